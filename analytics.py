@@ -0,0 +1,126 @@
+"""
+Module Docstring: This module computes market statistics from the stored market history.
+
+All requested types and regions are loaded in one query and every statistic is
+computed with grouped pandas/NumPy operations rather than per-type queries. History
+moved to the Parquet archive by history_archive is read from there transparently.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from app.models import db, MarketHistory
+from history_archive import archived_through, read_archive
+from metrics import ANALYTICS_SECONDS
+
+# Trailing windows, in days, for which statistics are computed
+WINDOWS = (7, 30, 60, 90)
+KEYS = ["region_id", "type_id"]
+
+
+def load_history(type_ids, region_ids, start_date):
+    """
+    Load the market history of several types and regions from `start_date` onwards.
+
+    Rows come from the MarketHistory table and, for regions whose archive reaches
+    back to `start_date`, from the Parquet archive.
+
+    :param type_ids: A list of type IDs.
+    :param region_ids: A list of region IDs.
+    :param start_date: The first date to load.
+    :return: A DataFrame with region_id, type_id, date, volume and average_price columns.
+    """
+    query = select(
+        MarketHistory.region_id,
+        MarketHistory.type_id,
+        MarketHistory.date,
+        MarketHistory.volume,
+        MarketHistory.average_price,
+    ).where(
+        MarketHistory.region_id.in_([int(region_id) for region_id in region_ids]),
+        MarketHistory.type_id.in_([int(type_id) for type_id in type_ids]),
+        MarketHistory.date >= start_date,
+    )
+    history = pd.read_sql(query, db.session.connection(), parse_dates=["date"])
+    archived_regions = [region_id for region_id, through in archived_through(region_ids).items()
+                        if through >= start_date]
+    if not archived_regions:
+        return history
+    archived = read_archive(type_ids, archived_regions, start_date)
+    history = pd.concat([archived, history], ignore_index=True)
+    # Rows archived by a run that stopped before deleting them are also still in the table
+    return history.drop_duplicates(KEYS + ["date"], keep="last")
+
+
+def history_stats(history, windows=WINDOWS, today=None):
+    """
+    Compute trailing-window statistics for every (region_id, type_id) in a history frame.
+
+    For each window of N days the result has the columns:
+      avg_volume_N   - total volume traded divided by N (days without trades count as zero)
+      median_price_N - median of the daily average prices
+      volatility_N   - standard deviation of the daily log returns of the average price
+      trend_N        - least-squares slope of the average price per day, relative to its mean
+
+    :param history: A DataFrame as returned by load_history.
+    :param windows: The window lengths in days.
+    :param today: The date windows end on, defaults to today.
+    :return: A DataFrame indexed by (region_id, type_id).
+    """
+    today = pd.Timestamp(today or date.today())
+    history = history.sort_values(KEYS + ["date"])
+    history = history.assign(
+        age=(today - history["date"]).dt.days,
+        log_return=np.log(history["average_price"]).groupby(
+            [history[key] for key in KEYS]).diff(),
+    )
+    history["x"] = -history["age"].astype(float)
+    history["xy"] = history["x"] * history["average_price"]
+    history["xx"] = history["x"] ** 2
+
+    columns = {}
+    for window in windows:
+        grouped = history[history["age"] <= window].groupby(KEYS)
+        sums = grouped[["volume", "x", "average_price", "xy", "xx"]].sum()
+        count = grouped.size()
+        denominator = count * sums["xx"] - sums["x"] ** 2
+        slope = (count * sums["xy"] - sums["x"] * sums["average_price"]) / denominator
+        mean_price = sums["average_price"] / count
+        columns[f"avg_volume_{window}"] = sums["volume"] / window
+        columns[f"median_price_{window}"] = grouped["average_price"].median()
+        columns[f"volatility_{window}"] = grouped["log_return"].std()
+        columns[f"trend_{window}"] = (slope / mean_price).where(denominator > 0)
+
+    stats = pd.DataFrame(columns)
+    stats.index.names = KEYS
+    volume_columns = [f"avg_volume_{window}" for window in windows]
+    stats[volume_columns] = stats[volume_columns].fillna(0.0)
+    return stats
+
+
+@ANALYTICS_SECONDS.time(function="market_history_stats")
+def market_history_stats(type_ids, region_ids, windows=WINDOWS, today=None):
+    """
+    Load the relevant history window and compute statistics for all types and regions at once.
+
+    :param type_ids: A list of type IDs.
+    :param region_ids: A list of region IDs.
+    :param windows: The window lengths in days.
+    :param today: The date windows end on, defaults to today.
+    :return: A DataFrame indexed by (region_id, type_id), see history_stats for the columns.
+    """
+    today = today or date.today()
+    history = load_history(type_ids, region_ids, today - timedelta(days=max(windows)))
+    stats = history_stats(history, windows, today)
+    # Types without any trades in the loaded window still get a row
+    index = pd.MultiIndex.from_product(
+        [sorted({int(region_id) for region_id in region_ids}),
+         sorted({int(type_id) for type_id in type_ids})],
+        names=KEYS,
+    )
+    stats = stats.reindex(index).astype(float)
+    volume_columns = [f"avg_volume_{window}" for window in windows]
+    stats[volume_columns] = stats[volume_columns].fillna(0.0)
+    return stats
@@ -1,21 +1,66 @@
+"""
+Module Docstring: This package holds the Flask web app, built by create_app.
+
+Importing the package or any of its modules has no side effects: the app, its
+database and its routes are only set up when create_app is called, e.g., by
+`flask --app app run` or `python app.py`.
+"""
 from flask import Flask
 from flask_caching import Cache
+
 from app.models import db
-### Create the Flask app
-app = Flask(__name__)
-
-# Configure the database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///eve_industry.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-# Configure caching
-app.config['CACHE_TYPE'] = 'FileSystemCache' # Store cache files in the filesystem
-app.config['CACHE_DEFAULT_TIMEOUT'] = 86400  # 24 hours in seconds
-app.config['CACHE_DIR'] = 'cache'  # Directory to store cache files
-cache = Cache(app)
-# Initialize the database
-db.init_app(app)
-
-# Create the tables if they do not exist already
-with app.app_context():
-    db.create_all()  
-from app import routes
\ No newline at end of file
+
+cache = Cache()
+
+
+def create_app(config=None):
+    """
+    Create and configure the Flask app, creating or upgrading the database tables.
+
+    :param config: Optional settings overriding the defaults (e.g., SQLALCHEMY_DATABASE_URI).
+    :return: The Flask app.
+    """
+    # Imported here so that importing the package stays cheap for the CLI scripts
+    # pylint: disable=import-outside-toplevel
+    from app.api import bp as api_bp
+    from app.database import database_url, engine_options, init_database
+    from app.jobs import JobQueue
+    from app.migrations import upgrade_database
+    from app.profiling import init_profiling
+    from app.read_cache import init_read_cache
+    from app.routes import bp
+    from logging_config import configure_logging
+
+    configure_logging()
+    ### Create the Flask app
+    app = Flask(__name__)
+
+    # Configure the database
+    # SQLite by default, set DATABASE_URL to use PostgreSQL
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Configure caching
+    app.config['CACHE_TYPE'] = 'FileSystemCache' # Store cache files in the filesystem
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 86400  # 24 hours in seconds
+    app.config['CACHE_DIR'] = 'cache'  # Directory to store cache files
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    # Initialize the database and the cache
+    init_database(app)
+    cache.init_app(app)
+    # Time every request, and profile the routes listed in PROFILE_ENDPOINTS
+    init_profiling(app)
+    app.register_blueprint(bp)
+    # JSON read API, its responses are cached until the ingest changes their data
+    init_read_cache(app)
+    app.register_blueprint(api_bp)
+    # Fetches run here, in the background, instead of on the request thread
+    app.extensions['job_queue'] = JobQueue(app)
+
+    # Create the tables if they do not exist already and bring existing ones up to date
+    with app.app_context():
+        db.create_all()
+        upgrade_database()
+    return app
@@ -0,0 +1,238 @@
+"""
+Module Docstring: This module serves the read API: order books, history statistics and build margins.
+
+Every endpoint takes comma-separated region_ids (The Forge by default) and type_ids
+and answers with one item per region and type:
+
+    GET /api/order_book?region_ids=10000002,10000043&type_ids=34,35
+    GET /api/history_stats?type_ids=34,35
+    GET /api/margins?type_ids=11176,11178&material_side=best_bid
+
+Items come from the ReadCache, which only computes the pairs it does not hold and
+drops them when the ingest commits new data for them. Responses carry a weak ETag,
+so a dashboard polling with If-None-Match gets a 304 until something changed, and
+are gzip compressed for clients that accept it.
+"""
+import gzip
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import select
+from werkzeug.exceptions import BadRequest, ServiceUnavailable
+
+from app.models import db, OrderBookSummary
+from fetch_data import DEFAULT_REGION_ID
+from order_book import SUMMARY_COLUMNS
+
+bp = Blueprint("api", __name__, url_prefix="/api")
+
+# Region and type pairs one request may ask for
+MAX_PAIRS = 5000
+# Smaller bodies are sent uncompressed
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+PRICE_SIDES = ("best_ask", "best_bid")
+# The BOMEngine of bom_engine and the MD5 of the SDE import its index was loaded from
+_engine = {}
+_engine_lock = threading.Lock()
+
+
+def bom_engine():
+    """
+    Return the BOMEngine margins are computed with and the MD5 of the SDE it reads.
+
+    The engine is built on first use. Once the slim SDE is imported again, by this or
+    another process, it switches to the new index and only drops the expansions of the
+    changed types, or is rebuilt when it missed an import in between.
+
+    :raises ServiceUnavailable: If the SDE has not been imported yet.
+    """
+    # pylint: disable=import-outside-toplevel
+    from blueprints import load_sde_index
+    from bom import BOMEngine
+    from sde_import import imported_md5, last_import
+
+    try:
+        with _engine_lock:
+            md5 = imported_md5()
+            engine = _engine.get("engine")
+            if engine is None or _engine["md5"] != md5:
+                # Read before the index, an import in between is picked up by the next call
+                md5, previous_md5, changed = last_import()
+                load_sde_index.cache_clear()
+                index = load_sde_index()
+                if engine is not None and _engine["md5"] == previous_md5:
+                    engine.update_index(index, changed)
+                else:
+                    engine = BOMEngine(index)
+                _engine.update(engine=engine, md5=md5)
+            return engine, md5
+    except sqlite3.OperationalError as e:
+        raise ServiceUnavailable("The SDE has not been imported yet") from e
+
+
+def id_list(name, default=None):
+    """Parse a comma-separated list of IDs from the query string."""
+    value = request.args.get(name, "")
+    if not value.strip():
+        if default is None:
+            raise BadRequest(f"{name} is required")
+        return default
+    try:
+        return sorted({int(part) for part in value.split(",") if part.strip()})
+    except ValueError as e:
+        raise BadRequest(f"{name} must be comma-separated integers") from e
+
+
+def requested_pairs():
+    """Return the (region_id, type_id) pairs asked for, region by region."""
+    region_ids = id_list("region_ids", [DEFAULT_REGION_ID])
+    type_ids = id_list("type_ids")
+    if len(region_ids) * len(type_ids) > MAX_PAIRS:
+        raise BadRequest(f"At most {MAX_PAIRS} region and type pairs per request")
+    return [(region_id, type_id) for region_id in region_ids for type_id in type_ids]
+
+
+def price_side(name):
+    """Parse the order book side prices are taken from."""
+    value = request.args.get(name, "best_ask")
+    if value not in PRICE_SIDES:
+        raise BadRequest(f"{name} must be one of {', '.join(PRICE_SIDES)}")
+    return value
+
+
+def json_value(value):
+    """Convert a value to JSON, non-finite numbers become null."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if hasattr(value, "item"):
+        # NumPy scalar
+        return json_value(value.item())
+    return value
+
+
+def frame_items(frame, pairs):
+    """Turn the (region_id, type_id) indexed rows of a DataFrame into items."""
+    records = frame.to_dict("index")
+    return {pair: {"region_id": pair[0], "type_id": pair[1],
+                   **{name: json_value(value) for name, value in records[pair].items()}}
+            for pair in pairs}
+
+
+def json_response(items):
+    """Answer with the items, honouring If-None-Match and Accept-Encoding."""
+    body = json.dumps({"items": items}, separators=(",", ":")).encode()
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(hashlib.md5(body).hexdigest(), weak=True)
+    # Let clients keep the body, but have them check the ETag on every poll
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    response.make_conditional(request)
+    if (response.status_code == 200 and len(body) >= GZIP_MIN_SIZE
+            and request.accept_encodings["gzip"]):
+        response.set_data(gzip.compress(body, GZIP_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def read_cache():
+    """Return the ReadCache of the current app."""
+    return current_app.extensions["read_cache"]
+
+
+### Order book summaries
+def load_order_books(pairs):
+    """Load the order book summaries of several pairs with one query."""
+    columns = [getattr(OrderBookSummary, name) for name in SUMMARY_COLUMNS]
+    rows = db.session.execute(
+        select(OrderBookSummary.region_id, OrderBookSummary.type_id, *columns).where(
+            OrderBookSummary.region_id.in_(sorted({region_id for region_id, _ in pairs})),
+            OrderBookSummary.type_id.in_(sorted({type_id for _, type_id in pairs})),
+        )
+    ).all()
+    summaries = {(row[0], row[1]): row[2:] for row in rows}
+    return {pair: {"region_id": pair[0], "type_id": pair[1],
+                   **{name: json_value(value) for name, value in
+                      zip(SUMMARY_COLUMNS, summaries.get(pair, (None,) * len(SUMMARY_COLUMNS)))}}
+            for pair in pairs}
+
+
+@bp.route("/order_book")
+def order_book():
+    """Best prices, depth-weighted prices and depth of the order books."""
+    items = read_cache().items(
+        "order_book", requested_pairs(),
+        lambda pairs: {(region_id, type_id): [("orders", region_id, type_id)]
+                       for region_id, type_id in pairs},
+        load_order_books,
+    )
+    return json_response(items)
+
+
+### History statistics
+@bp.route("/history_stats")
+def history_stats():
+    """Trailing 7, 30, 60 and 90-day volumes, prices, volatility and trends."""
+    today = date.today()
+
+    def compute(pairs):
+        # pandas is only imported once a request needs it
+        from analytics import market_history_stats  # pylint: disable=import-outside-toplevel
+        stats = market_history_stats(sorted({type_id for _, type_id in pairs}),
+                                     sorted({region_id for region_id, _ in pairs}), today=today)
+        return frame_items(stats, pairs)
+
+    items = read_cache().items(
+        "history_stats", requested_pairs(),
+        lambda pairs: {(region_id, type_id): [("history", region_id, type_id)]
+                       for region_id, type_id in pairs},
+        compute, variant=today.isoformat(),
+    )
+    return json_response(items)
+
+
+### Build margins
+@bp.route("/margins")
+def margins():
+    """Build cost, margin, ISK/hour and days-to-sell, buying the materials in the same region."""
+    pairs = requested_pairs()
+    material_side = price_side("material_side")
+    product_side = price_side("product_side")
+    engine, sde_md5 = bom_engine()
+
+    def dependencies(pairs):
+        expansions = engine.expand_many({type_id for _, type_id in pairs})
+        return {
+            (region_id, type_id): [("orders", region_id, type_id), ("history", region_id, type_id)]
+            + [("orders", region_id, material_id) for material_id in expansions[type_id].materials]
+            for region_id, type_id in pairs
+        }
+
+    def compute(pairs):
+        # pandas is only imported once a request needs it
+        from profitability import build_profitability  # pylint: disable=import-outside-toplevel
+        profitability = build_profitability(engine, sorted({type_id for _, type_id in pairs}),
+                                            sorted({region_id for region_id, _ in pairs}),
+                                            material_side=material_side,
+                                            product_side=product_side)
+        return frame_items(profitability, pairs)
+
+    items = read_cache().items(
+        "margins", pairs, dependencies, compute,
+        variant=f"{material_side}:{product_side}:{date.today().isoformat()}:{sde_md5}",
+    )
+    return json_response(items)
+
+
+@bp.errorhandler(BadRequest)
+@bp.errorhandler(ServiceUnavailable)
+def json_error(error):
+    """Answer invalid query parameters and missing data with a JSON error."""
+    return jsonify(error=error.description), error.code
@@ -0,0 +1,128 @@
+"""
+Module Docstring: This module runs fetch jobs in the background, off the request thread.
+
+A job is a call to one of the fetch functions for a region. It runs in a small thread
+pool inside an application context and reports progress through the FetchStats the
+fetch function updates as it goes, so the status endpoint can read it at any time.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app.models import db
+from esi_client import FetchStats
+
+# Number of fetch jobs allowed to run at once, further jobs wait in the queue
+DEFAULT_WORKERS = 2
+# Number of finished jobs kept for the status endpoint
+FINISHED_JOBS_KEPT = 100
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """
+    A background fetch job and its progress.
+
+    :param kind: What the job fetches, e.g., "orders" or "history".
+    :param region_id: The region the job fetches data for.
+    """
+
+    def __init__(self, kind, region_id):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.region_id = region_id
+        self.status = QUEUED
+        self.error = None
+        self.stats = FetchStats()
+        self.created = datetime.utcnow()
+        self.started = None
+        self.finished = None
+
+    @property
+    def active(self):
+        """Whether the job is still queued or running."""
+        return self.status in (QUEUED, RUNNING)
+
+    def summary(self):
+        """Return the job status and progress as a dictionary."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "region_id": self.region_id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created.isoformat(),
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "progress": self.stats.summary(),
+        }
+
+
+class JobQueue:
+    """
+    Runs fetch jobs in a thread pool, at most one active job per kind and region.
+
+    :param app: The Flask application the jobs run in.
+    :param max_workers: Number of jobs allowed to run at once.
+    """
+
+    def __init__(self, app, max_workers=DEFAULT_WORKERS):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="fetch-job")
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, region_id, func, *args, **kwargs):
+        """
+        Queue `func(*args, stats=..., **kwargs)` as a job.
+
+        If a job of the same kind is already queued or running for the region, that job
+        is returned instead of starting a second one.
+
+        :return: The Job.
+        """
+        with self._lock:
+            for job in self.jobs.values():
+                if job.kind == kind and job.region_id == region_id and job.active:
+                    return job
+            job = Job(kind, region_id)
+            self.jobs[job.id] = job
+            self._forget_finished()
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given ID, or None if it is unknown."""
+        return self.jobs.get(job_id)
+
+    def _forget_finished(self):
+        """Drop the oldest finished jobs beyond FINISHED_JOBS_KEPT."""
+        finished = [job for job in self.jobs.values() if not job.active]
+        for job in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self.jobs[job.id]
+
+    def _run(self, job, func, args, kwargs):
+        """Run one job inside an application context, recording its outcome."""
+        job.status = RUNNING
+        job.started = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                func(*args, stats=job.stats, **kwargs)
+                job.status = DONE
+            except Exception as e:  # pylint: disable=broad-except
+                job.error = str(e)
+                job.status = FAILED
+                logging.exception("Background %s job for region_id %s failed.",
+                                  job.kind, job.region_id)
+            finally:
+                job.finished = datetime.utcnow()
+                db.session.remove()
+        logging.info("Background %s job %s for region_id %s %s: %s", job.kind, job.id,
+                     job.region_id, job.status, job.stats.summary())
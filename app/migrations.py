@@ -0,0 +1,74 @@
+"""
+Module Docstring: This module upgrades existing databases to the current schema.
+
+db.create_all() only creates missing tables, so indexes and constraints added to
+existing tables are applied here. Every step is idempotent and runs at startup.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+
+from app.models import db
+
+
+def index_exists(table_name, index_name):
+    """Check whether an index exists on a table."""
+    indexes = inspect(db.session.connection()).get_indexes(table_name)
+    return any(index["name"] == index_name for index in indexes)
+
+
+def add_market_history_unique_index():
+    """Deduplicate market_history and add the unique (type_id, region_id, date) index."""
+    if index_exists("market_history", "uq_market_history_type_region_date"):
+        return
+    logging.info("Adding unique (type_id, region_id, date) index to market_history.")
+    db.session.execute(text("""
+        DELETE FROM market_history
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM market_history GROUP BY type_id, region_id, date
+        )
+    """))
+    db.session.execute(text("""
+        CREATE UNIQUE INDEX uq_market_history_type_region_date
+        ON market_history (type_id, region_id, date)
+    """))
+
+
+def create_missing_indexes():
+    """Create every index declared on the models that the database does not have yet."""
+    connection = db.session.connection()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if not index_exists(table.name, index.name):
+                logging.info("Creating index %s on %s.", index.name, table.name)
+                index.create(connection)
+
+
+def add_missing_columns():
+    """Add every nullable column declared on the models that an existing table does not have yet."""
+    connection = db.session.connection()
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            logging.info("Adding column %s to %s.", column.name, table.name)
+            column_type = column.type.compile(dialect=connection.dialect)
+            db.session.execute(text(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            ))
+
+
+MIGRATIONS = [
+    add_market_history_unique_index,
+    add_missing_columns,
+    create_missing_indexes,
+]
+
+
+def upgrade_database():
+    """Apply every migration step in order."""
+    for migration in MIGRATIONS:
+        migration()
+    db.session.commit()
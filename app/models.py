@@ -15,6 +15,12 @@ class MarketOrder(db.Model):
     issued = db.Column(db.DateTime, nullable=False)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Order book lookups: best price per side for a type in a region
+        db.Index("ix_market_order_region_type_side_price",
+                 "region_id", "type_id", "is_buy_order", "price"),
+    )
+
     def __repr__(self):
         return f"<MarketOrder {self.order_id}>"
     
@@ -26,5 +32,83 @@ class MarketHistory(db.Model):
     volume = db.Column(db.BigInteger, nullable=False)
     average_price = db.Column(db.Float, nullable=False)
 
+    __table_args__ = (
+        # One row per type, region and day; ingestion relies on it for ON CONFLICT DO NOTHING
+        db.Index("uq_market_history_type_region_date", "type_id", "region_id", "date",
+                 unique=True),
+        # Covers volume aggregates over a date range without touching the table
+        db.Index("ix_market_history_region_type_date_volume",
+                 "region_id", "type_id", "date", "volume"),
+    )
+
+    def __repr__(self):
+        return f"<MarketHistory {self.type_id} {self.date}>"
+
+class FetchState(db.Model):
+    """Freshness of the last ESI fetch per endpoint, region, type and page."""
+    endpoint = db.Column(db.String(32), primary_key=True)
+    region_id = db.Column(db.Integer, primary_key=True)
+    type_id = db.Column(db.Integer, primary_key=True)
+    page = db.Column(db.Integer, primary_key=True, default=1)
+    expires = db.Column(db.DateTime, nullable=False)
+    etag = db.Column(db.String(128))
+    # Order IDs on the page when it was last downloaded, packed as int64, for order books
+    order_ids = db.Column(db.LargeBinary)
+    last_fetched = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<FetchState {self.endpoint} {self.region_id} {self.type_id} {self.page}>"
+
+
+class OrderBookSummary(db.Model):
+    """Best prices and depth of the order book of one type in one region."""
+    region_id = db.Column(db.Integer, primary_key=True)
+    type_id = db.Column(db.Integer, primary_key=True)
+    best_bid = db.Column(db.Float)
+    best_ask = db.Column(db.Float)
+    # Volume-weighted price of the best 5% of the volume on each side
+    bid_5pct = db.Column(db.Float)
+    ask_5pct = db.Column(db.Float)
+    buy_volume = db.Column(db.BigInteger, nullable=False, default=0)
+    sell_volume = db.Column(db.BigInteger, nullable=False, default=0)
+    buy_orders = db.Column(db.Integer, nullable=False, default=0)
+    sell_orders = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<OrderBookSummary {self.region_id} {self.type_id}>"
+
+
+class HistoryArchive(db.Model):
+    """How far the market history of a region has been moved to the Parquet archive."""
+    region_id = db.Column(db.Integer, primary_key=True)
+    # Every day up to and including this date lives in the archive, not in MarketHistory
+    archived_through = db.Column(db.Date, nullable=False)
+    updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<HistoryArchive {self.region_id} {self.archived_through}>"
+
+
+class OrderSnapshot(db.Model):
+    """
+    The order book of one type in one region at one refresh, stored as a delta.
+
+    A keyframe holds the whole book, other rows hold the orders added or changed and
+    the orders removed since the previous snapshot; see order_snapshots.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    region_id = db.Column(db.Integer, nullable=False)
+    type_id = db.Column(db.Integer, nullable=False)
+    taken = db.Column(db.DateTime, nullable=False)
+    keyframe = db.Column(db.Boolean, nullable=False)
+    # Number of orders in the book after applying this snapshot
+    orders = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_order_snapshot_region_type_taken", "region_id", "type_id", "taken"),
+    )
+
     def __repr__(self):
-        return f"<MarketHistory {self.type_id} {self.date}>"
\ No newline at end of file
+        return f"<OrderSnapshot {self.region_id} {self.type_id} {self.taken}>"
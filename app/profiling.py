@@ -0,0 +1,103 @@
+"""
+Module Docstring: This module times every request and profiles the routes asked for.
+
+Request durations go to the http_request_duration_seconds metric. Routes listed in
+the PROFILE_ENDPOINTS config value, or in a comma-separated PROFILE_ENDPOINTS
+environment variable (e.g., PROFILE_ENDPOINTS=main.analyse,main.fetch_orders), are also run
+under a profiler and each profile is written to PROFILE_DIR: a pstats file from
+cProfile, or an HTML report when PROFILER is "pyinstrument" and it is installed.
+"""
+import cProfile
+import logging
+import os
+import time
+from datetime import datetime
+
+from flask import g, request
+
+from metrics import HTTP_REQUEST_SECONDS
+
+DEFAULT_PROFILE_DIR = "profiles"
+
+
+def init_profiling(app):
+    """
+    Register the request timing and profiling hooks on a Flask app.
+
+    :param app: The Flask app.
+    """
+    app.config.setdefault("PROFILE_ENDPOINTS", [
+        endpoint.strip()
+        for endpoint in os.environ.get("PROFILE_ENDPOINTS", "").split(",")
+        if endpoint.strip()
+    ])
+    app.config.setdefault("PROFILE_DIR", os.environ.get("PROFILE_DIR", DEFAULT_PROFILE_DIR))
+    app.config.setdefault("PROFILER", os.environ.get("PROFILER", "cprofile"))
+
+    @app.before_request
+    def start_request():
+        g.request_started = time.perf_counter()
+        if request.endpoint in app.config["PROFILE_ENDPOINTS"]:
+            g.profiler = _start_profiler(app.config["PROFILER"])
+
+    @app.after_request
+    def finish_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                         endpoint=request.endpoint or "unknown",
+                                         status=response.status_code)
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            _save_profile(profiler, app.config["PROFILE_DIR"], request.endpoint)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):  # pylint: disable=unused-argument
+        # The request failed before after_request ran
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            _stop(profiler)
+
+
+def _start_profiler(name):
+    """Start a pyinstrument profiler if asked for and installed, a cProfile one otherwise."""
+    if name == "pyinstrument":
+        try:
+            from pyinstrument import Profiler  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            logging.warning("pyinstrument is not installed, profiling with cProfile instead.")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another request is already being profiled on this interpreter
+        logging.warning("Not profiling %s: %s", request.endpoint, e)
+        return None
+    return profiler
+
+
+def _stop(profiler):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+def _save_profile(profiler, profile_dir, endpoint):
+    """Stop a profiler and write its profile to a file named after the endpoint and time."""
+    _stop(profiler)
+    os.makedirs(profile_dir, exist_ok=True)
+    stem = os.path.join(profile_dir, f"{endpoint}-{datetime.now():%Y%m%dT%H%M%S%f}")
+    if isinstance(profiler, cProfile.Profile):
+        path = f"{stem}.prof"
+        profiler.dump_stats(path)
+    else:
+        path = f"{stem}.html"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    logging.info("Saved profile of %s to %s.", endpoint, path)
@@ -0,0 +1,234 @@
+"""
+Module Docstring: This module caches the items of the read API until their data changes.
+
+An item is the answer for one (region_id, type_id) pair, so a batch request only
+computes the pairs that are not cached. Rather than expiring after a fixed time, an
+item is stored with the ingest generation of each of its inputs, e.g., the orders of
+a product and of all its materials for a build margin. The ingest bumps the
+generation of a region and type when it commits new orders or history for it (see
+signals), and an item is only served while none of its generations has moved, so
+nothing stale is served and nothing is recomputed early.
+
+Items are kept in a per-process LRU by default, which only sees the ingests run by
+the same process. Since the scheduler ingests in a process of its own, items in the
+LRU are also never served for longer than the data they were built from stays fresh
+(ORDER_CACHE_TTL, HISTORY_CACHE_TTL). Set READ_CACHE_URL to a Redis URL (pip install
+redis) to share the items, and the invalidations, between the web app and the
+scheduler or other worker processes:
+
+    READ_CACHE_URL=redis://localhost:6379/0
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from cachelib import BaseCache
+
+from fetch_data import HISTORY_CACHE_TTL, ORDER_CACHE_TTL
+from metrics import READ_CACHE_LOOKUPS
+from signals import history_committed, orders_committed
+
+# Items kept by the per-process LRU
+DEFAULT_MAX_ITEMS = 100000
+# Seconds an item stays in Redis, the generations themselves never expire
+ITEM_TIMEOUT = 2 * 86400
+# Seconds an item built from each kind of data stays in the per-process LRU
+IN_PROCESS_MAX_AGE = {"orders": ORDER_CACHE_TTL, "history": HISTORY_CACHE_TTL}
+REDIS_KEY_PREFIX = "eve_industry:"
+
+
+class LRUCache(BaseCache):
+    """
+    Thread-safe in-memory cache evicting the least recently used entries.
+
+    :param max_items: Entries kept before the least recently used ones are evicted,
+                      None to never evict.
+    :param default_timeout: Seconds entries live, 0 for no expiry.
+    """
+
+    def __init__(self, max_items=DEFAULT_MAX_ITEMS, default_timeout=0):
+        super().__init__(default_timeout)
+        self.max_items = max_items
+        # key -> (monotonic expiry time or None, value), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        expires = time.monotonic() + timeout if timeout > 0 else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            if self.max_items is not None:
+                while len(self._entries) > self.max_items:
+                    self._entries.popitem(last=False)
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self.get(key) is not None:
+                return False
+            return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def has(self, key):
+        with self._lock:
+            return self.get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return True
+
+    def inc(self, key, delta=1):
+        with self._lock:
+            value = (self.get(key) or 0) + delta
+            self.set(key, value)
+            return value
+
+
+class Entry(NamedTuple):
+    """A cached item and the generations of its inputs when it was computed."""
+    inputs: tuple
+    generations: tuple
+    item: dict
+
+
+class ReadCache:
+    """
+    The read API's item cache and the ingest generations its items are checked against.
+
+    :param store: The cachelib cache holding the items, e.g., an LRUCache or a RedisCache.
+    :param generations: The cachelib cache holding the generations, it must never evict
+                        them. Defaults to `store`.
+    :param max_age: Dictionary of input kind ("orders" or "history") to the seconds an
+                    item built from it is kept, for caches some ingests cannot
+                    invalidate. None keeps items until they are invalidated.
+    """
+
+    def __init__(self, store, generations=None, max_age=None):
+        self.store = store
+        self.generations = generations if generations is not None else store
+        self.max_age = max_age
+
+    def invalidate(self, kind, region_id, type_ids):
+        """Bump the generation of the `kind` data ("orders" or "history") of types in a region."""
+        for type_id in type_ids:
+            self.generations.inc(_generation_key(kind, region_id, type_id))
+
+    def items(self, kind, pairs, dependencies, compute, variant=""):
+        """
+        Return the item of every (region_id, type_id) pair, computing the missing and stale ones.
+
+        :param kind: The kind of item, e.g., "order_book".
+        :param pairs: A list of (region_id, type_id) tuples.
+        :param dependencies: Called with the pairs to compute, returns a dictionary of pair
+                             to the ("orders" or "history", region_id, type_id) inputs of
+                             its item.
+        :param compute: Called with the pairs to compute, returns a dictionary of pair to item.
+        :param variant: Anything besides the pair the items depend on, e.g., a date.
+        :return: A list of items in the order of `pairs`.
+        """
+        keys = {pair: f"{kind}:{variant}:{pair[0]}:{pair[1]}" for pair in pairs}
+        entries = dict(zip(pairs, self._get_many(self.store, list(keys.values()))))
+        current = self._current({key for entry in entries.values() if entry is not None
+                                 for key in entry.inputs})
+        items = {pair: entry.item for pair, entry in entries.items()
+                 if entry is not None
+                 and entry.generations == tuple(current[key] for key in entry.inputs)}
+        missing = [pair for pair in pairs if pair not in items]
+        READ_CACHE_LOOKUPS.inc(len(items), kind=kind, result="hit")
+        READ_CACHE_LOOKUPS.inc(len(missing), kind=kind, result="miss")
+        if missing:
+            sources = dependencies(missing)
+            inputs = {pair: tuple(_generation_key(*source) for source in pair_sources)
+                      for pair, pair_sources in sources.items()}
+            # Generations are read before the data, so a commit in between is never
+            # cached as current
+            needed = {key for pair_inputs in inputs.values() for key in pair_inputs}
+            current.update(self._current(needed - current.keys()))
+            computed = compute(missing)
+            by_timeout = {}
+            for pair in missing:
+                by_timeout.setdefault(self._timeout(sources[pair]), {})[keys[pair]] = Entry(
+                    inputs[pair], tuple(current[key] for key in inputs[pair]), computed[pair])
+            for timeout, entries in by_timeout.items():
+                self.store.set_many(entries, timeout=timeout)
+            items.update(computed)
+        return [items[pair] for pair in pairs]
+
+    def _timeout(self, sources):
+        """Return the seconds an item built from the (kind, region_id, type_id) sources is kept."""
+        if self.max_age is None:
+            return ITEM_TIMEOUT
+        return min((self.max_age[kind] for kind, _, _ in sources), default=ITEM_TIMEOUT)
+
+    def _current(self, keys):
+        """Return a dictionary of generation key to its current generation."""
+        keys = list(keys)
+        return dict(zip(keys, self._get_many(self.generations, keys)))
+
+    @staticmethod
+    def _get_many(cache, keys):
+        # RedisCache cannot MGET an empty list of keys
+        return cache.get_many(*keys) if keys else []
+
+
+def _generation_key(kind, region_id, type_id):
+    return f"generation:{kind}:{int(region_id)}:{int(type_id)}"
+
+
+def init_read_cache(app):
+    """
+    Create the app's ReadCache and have the ingest signals invalidate it.
+
+    The cache is configured by the READ_CACHE_URL and READ_CACHE_SIZE config values,
+    which default to the environment variables of the same name.
+    """
+    app.config.setdefault("READ_CACHE_URL", os.environ.get("READ_CACHE_URL", ""))
+    app.config.setdefault("READ_CACHE_SIZE",
+                          int(os.environ.get("READ_CACHE_SIZE", DEFAULT_MAX_ITEMS)))
+    url = app.config["READ_CACHE_URL"]
+    if url:
+        # pylint: disable=import-outside-toplevel
+        import redis
+        from cachelib import RedisCache
+        read_cache = ReadCache(RedisCache(host=redis.from_url(url), key_prefix=REDIS_KEY_PREFIX,
+                                          default_timeout=0))
+    else:
+        read_cache = ReadCache(LRUCache(app.config["READ_CACHE_SIZE"]), LRUCache(max_items=None),
+                               max_age=IN_PROCESS_MAX_AGE)
+    app.extensions["read_cache"] = read_cache
+    orders_committed.connect(invalidate_orders)
+    history_committed.connect(invalidate_history)
+
+
+def invalidate_orders(app, region_id, type_ids):
+    """Receive orders_committed: items built from the orders of these types are now stale."""
+    read_cache = app.extensions.get("read_cache")
+    if read_cache is not None:
+        read_cache.invalidate("orders", region_id, type_ids)
+
+
+def invalidate_history(app, region_id, type_ids):
+    """Receive history_committed: items built from the history of these types are now stale."""
+    read_cache = app.extensions.get("read_cache")
+    if read_cache is not None:
+        read_cache.invalidate("history", region_id, type_ids)
@@ -2,94 +2,90 @@
 Module Docstring: This module allocates routes for the flask application.
 """
 import logging
-from flask import render_template, redirect, url_for
-from flask_caching import Cache
-from fetch_data import fetch_market_orders, fetch_market_history, calculate_daily_sales_volumes
-from app import app
+from flask import (Blueprint, Response, current_app, jsonify, render_template, redirect, request,
+                   url_for)
+from fetch_data import (fetch_market_orders, fetch_market_history, load_tracked_type_ids,
+                        DEFAULT_REGION_ID)
+from app import cache
+import metrics
 
-# Configure logging to write to a file
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("routes.log"),
-        logging.StreamHandler()
-    ]
-)
+# Registered on the app by create_app
+bp = Blueprint("main", __name__)
 
-# Configure caching
-app.config['CACHE_TYPE'] = 'FileSystemCache' # Store cache files in the filesystem
-app.config['CACHE_DEFAULT_TIMEOUT'] = 86400  # 24 hours in seconds
-app.config['CACHE_DIR'] = 'cache'  # Directory to store cache files
-cache = Cache(app)
+def job_queue():
+    """Return the JobQueue of the current app."""
+    return current_app.extensions["job_queue"]
+
+def fetch_and_analyse_history(region_id, type_ids, stats=None):
+    """Fetch market history for a region, then log the statistics of the updated history."""
+    # pandas is only imported once a view needs it
+    from analytics import market_history_stats  # pylint: disable=import-outside-toplevel
+    fetch_market_history(region_id=region_id, type_ids=type_ids, stats=stats)
+    market_stats = market_history_stats(type_ids, [region_id])
+    logging.info("Market history statistics:\n%s", market_stats.to_string())
+
+def job_accepted(job):
+    """Return the 202 response pointing the client at a job's status endpoint."""
+    response = jsonify(job_id=job.id, status=job.status,
+                       status_url=url_for(".job_status", job_id=job.id))
+    return response, 202
 
 ### Routes
 # Basic Home Route
-@app.route("/")
+@bp.route("/")
 def home() -> str:
     """Basic home route."""
     return render_template("index.html")
 
 # Route to fetch market orders
-@app.route("/fetch_orders")
-@cache.cached(timeout=300)
-def fetch_orders() -> str:
-    """Fetches market orders for T2 ships and materials in The Forge."""
-    id_list: list[str] = []
-    with open("t2_ships.txt", "r", encoding="utf-8") as f:
-        t2_ships: list[str] = f.readlines()
-    for line in t2_ships:
-        type_id, _ = line.strip().split(", ")
-        id_list.append(type_id)
-    with open("t2_materials.txt", "r", encoding="utf-8") as f:
-        t2_materials: list[str] = f.readlines()
-    for line in t2_materials:
-        type_id = line.strip(",\n")
-        id_list.append(type_id)
-    #print(id_list)
-    fetch_market_orders(region_id=10000002, type_ids=id_list)
-
-    return redirect(url_for("home"))
+@bp.route("/fetch_orders")
+def fetch_orders():
+    """Queues a market order fetch for T2 ships and materials in a region, The Forge by default."""
+    region_id = request.args.get("region_id", DEFAULT_REGION_ID, type=int)
+    id_list = load_tracked_type_ids()
+    job = job_queue().submit("orders", region_id, fetch_market_orders, region_id, id_list)
+    return job_accepted(job)
 
 # Route to fetch market history
-@app.route("/fetch_history")
-@cache.cached(timeout=86400)
-def fetch_history() -> str:
-    """Fetches market history for T2 ships and materials in The Forge."""
-    id_list: list[str] = []
-    with open("t2_ships.txt", "r", encoding="utf-8") as f:
-        t2_ships: list[str] = f.readlines()
-    for line in t2_ships:
-        type_id, _ = line.strip().split(", ")
-        id_list.append(type_id)
-    with open("t2_materials.txt", "r", encoding="utf-8") as f:
-        t2_materials: list[str] = f.readlines()
-    for line in t2_materials:
-        type_id = line.strip(",\n")
-        id_list.append(type_id)
-    fetch_market_history(region_id=10000002, type_ids=id_list)
-    for type_id in id_list:
-        calculate_daily_sales_volumes(type_id, 10000002)
-    return "Market history fetched and stored!"
+@bp.route("/fetch_history")
+def fetch_history():
+    """Queues a market history fetch for T2 ships and materials in a region, The Forge by default."""
+    region_id = request.args.get("region_id", DEFAULT_REGION_ID, type=int)
+    id_list = load_tracked_type_ids()
+    job = job_queue().submit("history", region_id, fetch_and_analyse_history,
+                           region_id, id_list)
+    return job_accepted(job)
+
+# Route to report the progress of a fetch job
+@bp.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Reports the status and progress of a background fetch job."""
+    job = job_queue().get(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job {job_id}"), 404
+    return jsonify(job.summary())
+
+# Route to expose the pipeline metrics to Prometheus
+@bp.route("/metrics")
+def metrics_endpoint():
+    """Reports ESI, ingest, database and analytics metrics in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # Route to analyse market history
-@app.route("/analyse")
+@bp.route("/analyse")
 def analyse() -> str:
-    """Analyse the market history for T2 ships in The Forge"""
-    ship_list: list[str] = []
-    with open("t2_ships.txt", "r", encoding="utf-8") as f:
-        t2_ships: list[str] = f.readlines()
-    for line in t2_ships:
-        type_id, _ = line.strip().split(", ")
-        ship_list.append(type_id)
-    for type_id in ship_list:
-        calculate_daily_sales_volumes(type_id, 10000002)
+    """Analyse the market history for T2 ships in a region, The Forge by default"""
+    from analytics import market_history_stats  # pylint: disable=import-outside-toplevel
+    region_id = request.args.get("region_id", DEFAULT_REGION_ID, type=int)
+    ship_list = load_tracked_type_ids(include_materials=False)
+    stats = market_history_stats(ship_list, [region_id])
+    logging.info("Market history statistics:\n%s", stats.to_string())
     return "Market history analysed!"
 
 # Route to clear the cache
-@app.route("/clear_cache")
+@bp.route("/clear_cache")
 def clear_cache() -> str:
     """Clears the cache."""
     cache.clear()
     logging.info("Cache cleared.")
-    return redirect(url_for("home"))
+    return redirect(url_for(".home"))
@@ -0,0 +1,5 @@
+"""
+Module Docstring: Benchmarks for the data ingestion and analytics hot paths.
+
+Each benchmark is a runnable module, e.g. `python -m benchmarks.bench_process_orders`.
+"""
@@ -0,0 +1,108 @@
+"""
+Module Docstring: Benchmark decoding ESI order pages into insert parameters.
+
+Measures orders per second from a raw response body to the MarketOrder insert
+parameters, without the database: the original json.loads plus strptime path, and
+decode_orders with the standard json module and with orjson when it is installed.
+
+    python -m benchmarks.bench_decode --orders 100000 --repeat 5
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+import esi_payloads
+from fetch_data import order_rows
+
+REGION_ID = 10000002
+FETCHED = datetime(2025, 1, 2)
+
+
+def make_body(count, seed=0):
+    """Generate a JSON body of `count` orders with every field ESI returns."""
+    rng = random.Random(seed)
+    issued = datetime(2025, 1, 1)
+    return json.dumps([
+        {
+            "duration": 90,
+            "is_buy_order": i % 3 == 0,
+            "issued": (issued + timedelta(seconds=rng.randint(0, 10**7))).strftime(
+                '%Y-%m-%dT%H:%M:%SZ'),
+            "location_id": 60003760,
+            "min_volume": 1,
+            "order_id": 6_000_000_000 + i,
+            "price": round(rng.uniform(1, 1000), 2),
+            "range": "region",
+            "system_id": 30000142,
+            "type_id": 34 + i % 500,
+            "volume_remain": rng.randint(1, 10_000),
+            "volume_total": 10_000,
+        }
+        for i in range(count)
+    ]).encode()
+
+
+def legacy_rows(body, now):
+    """The json.loads and per-order strptime path decode_orders replaced, kept as a baseline."""
+    return [
+        {
+            "order_id": order['order_id'],
+            "type_id": order['type_id'],
+            "region_id": REGION_ID,
+            "price": order['price'],
+            "volume_remain": order['volume_remain'],
+            "volume_total": order['volume_total'],
+            "is_buy_order": order['is_buy_order'],
+            "issued": datetime.strptime(order['issued'], '%Y-%m-%dT%H:%M:%SZ'),
+            "last_updated": now,
+        }
+        for order in json.loads(body)
+    ]
+
+
+def decoded_rows(body, now):
+    """The current path: decode_orders into Order tuples, then the insert parameters."""
+    return order_rows(REGION_ID, esi_payloads.decode_orders(body), now)
+
+
+def measure(label, func, body, count, repeat):
+    """Print the best orders per second of `repeat` runs of `func` over `body`."""
+    best = min(_elapsed(func, body, FETCHED) for _ in range(repeat))
+    print(f"{label:<40} {count / best:>12,.0f} orders/s")
+    return func(body, FETCHED)
+
+
+def _elapsed(func, body, now):
+    start = time.perf_counter()
+    func(body, now)
+    return time.perf_counter() - start
+
+
+def run(count, repeat):
+    """Benchmark every decoding path on a body of `count` orders."""
+    body = make_body(count)
+    baseline = measure("json.loads + strptime (legacy)", legacy_rows, body, count, repeat)
+    with mock.patch.object(esi_payloads, "loads", json.loads):
+        rows = measure("decode_orders, json", decoded_rows, body, count, repeat)
+    assert rows == baseline
+    if esi_payloads.orjson is not None:
+        rows = measure("decode_orders, orjson", decoded_rows, body, count, repeat)
+        assert rows == baseline
+    else:
+        print("orjson is not installed, skipping the orjson decoder")
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.orders, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Module Docstring: Benchmark history ingestion against the original per-entry SELECT implementation.
+
+Each run ingests a multi-year history fixture into an empty table, then replays the
+daily refresh where ESI returns the full history again with a single new day.
+
+    python -m benchmarks.bench_history --types 50 --years 3
+"""
+import argparse
+from datetime import date, datetime, timedelta
+
+from benchmarks.common import bench_app, timer
+from benchmarks.fixtures import make_history
+from app.models import db, MarketHistory
+from fetch_data import ingest_history, latest_history_dates
+
+REGION_ID = 10000002
+
+
+def legacy_ingest_history(region_id, type_id, history_data):
+    """The per-entry SELECT implementation ingest_history replaced, kept as a baseline."""
+    for entry in history_data:
+        entry_date = datetime.strptime(entry['date'], '%Y-%m-%d').date()
+        existing_entry = MarketHistory.query.filter_by(
+            type_id=type_id,
+            region_id=region_id,
+            date=entry_date,
+        ).first()
+        if not existing_entry:
+            db.session.add(MarketHistory(
+                type_id=type_id,
+                region_id=region_id,
+                date=entry_date,
+                volume=entry['volume'],
+                average_price=entry['average'],
+            ))
+    db.session.commit()
+
+
+def run(types, years):
+    """Benchmark both implementations on `types` types with `years` of history each."""
+    days = years * 365
+    end = date(2025, 1, 1)
+    initial = {type_id: make_history(days, end, seed=type_id) for type_id in range(types)}
+    refreshed = {type_id: history[1:] + make_history(1, end + timedelta(days=1), seed=type_id)
+                 for type_id, history in initial.items()}
+    label = f"{types} types x {days} days"
+
+    with bench_app():
+        with timer(f"legacy initial load {label}"):
+            for type_id, history in initial.items():
+                legacy_ingest_history(REGION_ID, type_id, history)
+        with timer(f"legacy daily refresh {label}"):
+            for type_id, history in refreshed.items():
+                legacy_ingest_history(REGION_ID, type_id, history)
+
+    with bench_app():
+        with timer(f"incremental initial load {label}"):
+            latest = latest_history_dates(REGION_ID, list(initial))
+            for type_id, history in initial.items():
+                ingest_history(REGION_ID, type_id, history, latest.get(type_id))
+        with timer(f"incremental daily refresh {label}"):
+            latest = latest_history_dates(REGION_ID, list(refreshed))
+            for type_id, history in refreshed.items():
+                ingest_history(REGION_ID, type_id, history, latest.get(type_id))
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--types", type=int, default=50)
+    parser.add_argument("--years", type=int, default=3)
+    args = parser.parse_args()
+    run(args.types, args.years)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Module Docstring: Benchmark multi-year history scans from the database against the Parquet archive.
+
+A multi-year history fixture is loaded into MarketHistory and the full range is
+scanned with analytics.load_history, then everything older than the last month is
+archived and the same scan is repeated.
+
+    python -m benchmarks.bench_history_archive --types 200 --years 3
+"""
+import argparse
+import os
+import tempfile
+from datetime import date, timedelta
+
+from benchmarks.common import bench_app, timer
+from benchmarks.bench_history import make_history
+import analytics
+import history_archive
+from fetch_data import ingest_history
+
+REGION_IDS = (10000002, 10000043)
+
+
+def run(types, years):
+    """Scan `years` of history for `types` types in two regions before and after archiving."""
+    days = years * 365
+    today = date(2025, 1, 1)
+    start = today - timedelta(days=days)
+    type_ids = list(range(types))
+    label = f"{len(REGION_IDS)} regions x {types} types x {days} days"
+
+    with bench_app(), tempfile.TemporaryDirectory() as archive_dir:
+        for region_id in REGION_IDS:
+            for type_id in type_ids:
+                ingest_history(region_id, type_id, make_history(days, today, seed=type_id))
+
+        with timer(f"database scan {label}"):
+            rows = len(analytics.load_history(type_ids, REGION_IDS, start))
+        with timer(f"archive {label}"):
+            history_archive.archive_history(30, archive_dir, today=today)
+        with timer(f"archive scan {label}"):
+            archived = len(history_archive.read_archive(type_ids, REGION_IDS, start, archive_dir))
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(archive_dir) for name in names)
+        print(f"{rows} rows scanned, {archived} rows archived in {size / 1e6:.1f} MB of Parquet")
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--types", type=int, default=200)
+    parser.add_argument("--years", type=int, default=3)
+    args = parser.parse_args()
+    run(args.types, args.years)
+
+
+if __name__ == "__main__":
+    main()
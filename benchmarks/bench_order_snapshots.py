@@ -0,0 +1,108 @@
+"""
+Module Docstring: Benchmark the order book snapshot store against storing full copies.
+
+A synthetic book per type is refreshed repeatedly through process_orders, each refresh
+changing a share of the remaining volumes and prices and replacing a few orders, the
+typical shape of a five-minute refresh. The stored snapshots are compared with the
+size of a full, uncompressed copy per refresh, then point-in-time books are rebuilt.
+
+    python -m benchmarks.bench_order_snapshots --types 20 --orders 300 --refreshes 60
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.common import bench_app, timer
+from app.models import db, OrderSnapshot
+from esi_payloads import parse_orders
+from fetch_data import process_orders
+import order_snapshots
+
+REGION_ID = 10000002
+
+
+def make_book(type_id, count, rng, first_order_id):
+    """Generate `count` synthetic ESI orders for one type."""
+    return {
+        first_order_id + i: {
+            "order_id": first_order_id + i,
+            "type_id": type_id,
+            "price": round(rng.uniform(100, 200), 2),
+            "volume_remain": rng.randint(1, 1000),
+            "volume_total": 1000,
+            "is_buy_order": rng.random() < 0.5,
+            "issued": "2025-01-01T00:00:00Z",
+        }
+        for i in range(count)
+    }
+
+
+def refresh_book(book, rng, next_order_id):
+    """Partially fill, reprice and replace orders, returning the next free order ID."""
+    for order in book.values():
+        roll = rng.random()
+        if roll < 0.10:
+            order["volume_remain"] = max(1, order["volume_remain"] - rng.randint(1, 50))
+        elif roll < 0.13:
+            order["price"] = round(order["price"] * rng.uniform(0.99, 1.01), 2)
+    for order_id in rng.sample(sorted(book), max(1, len(book) // 50)):
+        type_id = book.pop(order_id)["type_id"]
+        book.update(make_book(type_id, 1, rng, next_order_id))
+        next_order_id += 1
+    return next_order_id
+
+
+def run(types, orders, refreshes):
+    """Record `refreshes` refreshes of `types` books of `orders` orders each."""
+    rng = random.Random(0)
+    books = {type_id: make_book(type_id, orders, rng, type_id * 1_000_000)
+             for type_id in range(1, types + 1)}
+    next_order_id = 10**9
+    start = datetime(2025, 1, 1)
+    label = f"{types} types x {orders} orders x {refreshes} refreshes"
+
+    with bench_app():
+        full_bytes = 0
+        with timer(f"process_orders with snapshots {label}"):
+            for refresh in range(refreshes):
+                taken = start + timedelta(minutes=5 * refresh)
+                for type_id, book in books.items():
+                    process_orders(REGION_ID, parse_orders(book.values()),
+                                   snapshot_type_ids=[type_id])
+                    full_bytes += len(book) * order_snapshots.BOOK_DTYPE.itemsize
+                    next_order_id = refresh_book(book, rng, next_order_id)
+                # Align the recorded times with the simulated clock
+                db.session.query(OrderSnapshot).filter(
+                    OrderSnapshot.taken > taken).update({"taken": taken})
+                db.session.commit()
+
+        stored = db.session.query(db.func.sum(db.func.length(OrderSnapshot.data))).scalar()
+        snapshots = db.session.query(OrderSnapshot).count()
+        print(f"{snapshots} snapshots in {stored / 1e3:.0f} kB,"
+              f" {full_bytes / 1e3:.0f} kB as uncompressed full copies"
+              f" ({full_bytes / stored:.1f}x smaller)")
+
+        end = start + timedelta(minutes=5 * (refreshes - 1))
+        with timer(f"book_at x {types * 10}"):
+            for type_id in books:
+                for _ in range(10):
+                    when = start + (end - start) * rng.random()
+                    order_snapshots.book_at(REGION_ID, type_id, when)
+        with timer(f"iter_books full range x {types}"):
+            for type_id in books:
+                for _ in order_snapshots.iter_books(REGION_ID, type_id, start, end):
+                    pass
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--types", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--refreshes", type=int, default=60)
+    args = parser.parse_args()
+    run(args.types, args.orders, args.refreshes)
+
+
+if __name__ == "__main__":
+    main()
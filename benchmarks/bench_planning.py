@@ -0,0 +1,79 @@
+"""
+Module Docstring: Benchmark the parallel what-if planning runs against a serial run.
+
+Builds a synthetic SDE with --ships Tech II ships, prices every type in every hub and
+gives the ships 30 days of history, then evaluates a grid of scenarios in one process
+and with --workers processes and checks both give the same results.
+
+    python -m benchmarks.bench_planning --ships 500 --hubs 3 --workers 4
+"""
+import argparse
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.common import bench_app, timer
+from benchmarks.fixtures import make_sde
+from app.models import db, MarketHistory, OrderBookSummary
+from planning import STRUCTURES, build_queue, plan_builds, scenario_grid
+from sde_index import SDEIndex
+
+HUBS = [10000002, 10000043, 10000032, 10000030, 10000042]
+
+
+def populate(type_ids, product_ids, hubs, seed=0):
+    """Store an order book summary for every type and 30 days of history for the products."""
+    rng = random.Random(seed)
+    products = set(product_ids)
+    now = date.today()
+    summaries, history = [], []
+    for region_id in hubs:
+        for type_id in type_ids:
+            # Cheap materials, so that some of the builds make a profit
+            price = rng.uniform(5e7, 5e8) if type_id in products else rng.uniform(1, 100)
+            summaries.append({"region_id": region_id, "type_id": type_id,
+                              "best_bid": price * 0.95, "best_ask": price})
+        for type_id in product_ids:
+            history.extend({"region_id": region_id, "type_id": type_id,
+                            "date": now - timedelta(days=day), "volume": rng.randint(0, 20),
+                            "average_price": 1.0} for day in range(1, 31))
+    db.session.execute(OrderBookSummary.__table__.insert(), summaries)
+    db.session.execute(MarketHistory.__table__.insert(), history)
+    db.session.commit()
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ships", type=int, default=500)
+    parser.add_argument("--hubs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    hubs = HUBS[:args.hubs]
+    scenarios = scenario_grid(me_levels=(0, 5, 10), te_levels=(0, 20),
+                              structures=sorted(STRUCTURES), skill_levels=(4, 5))
+    label = f"{len(scenarios)} scenarios x {args.ships} ships x {args.hubs} hubs"
+
+    with tempfile.TemporaryDirectory() as tmp, bench_app():
+        sde_path = os.path.join(tmp, "sde.sqlite")
+        ship_ids = make_sde(sde_path, args.ships)
+        index = SDEIndex.from_sde(sde_path)
+        populate(list(index.types), ship_ids, hubs)
+
+        with timer(f"serial {label}"):
+            serial = plan_builds(index, ship_ids, hubs, scenarios, workers=1)
+        with timer(f"{args.workers} workers {label}"):
+            parallel = plan_builds(index, ship_ids, hubs, scenarios, workers=args.workers)
+        with timer(f"build_queue of {len(serial)} results"):
+            queue = build_queue(serial)
+
+    assert np.allclose(serial.to_numpy(), parallel.to_numpy(), equal_nan=True), \
+        "parallel results differ from the serial ones"
+    print(f"{len(queue)} builds queued, best {queue['isk_per_hour'].max():,.0f} ISK/hour")
+
+
+if __name__ == "__main__":
+    main()
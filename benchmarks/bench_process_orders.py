@@ -0,0 +1,80 @@
+"""
+Module Docstring: Benchmark process_orders against the original per-order SELECT implementation.
+
+Each run loads N fresh orders into an empty table, then refreshes the same orders with
+a fifth of them changed, the typical shape of a periodic refresh.
+
+    python -m benchmarks.bench_process_orders --sizes 10000 100000
+"""
+import argparse
+from datetime import datetime
+
+from benchmarks.common import bench_app, timer
+from benchmarks.fixtures import change_orders, make_orders
+from app.models import db, MarketOrder
+from esi_payloads import parse_orders
+from fetch_data import process_orders
+
+REGION_ID = 10000002
+
+
+def legacy_process_orders(region_id, orders):
+    """The per-order SELECT implementation process_orders replaced, kept as a baseline."""
+    new_orders = []
+    for order in orders:
+        existing_order = MarketOrder.query.filter_by(order_id=order['order_id']).first()
+        issued = datetime.strptime(order['issued'], '%Y-%m-%dT%H:%M:%SZ')
+        if not existing_order:
+            new_orders.append(MarketOrder(
+                order_id=order['order_id'],
+                type_id=order['type_id'],
+                region_id=region_id,
+                price=order['price'],
+                volume_remain=order['volume_remain'],
+                volume_total=order['volume_total'],
+                is_buy_order=order['is_buy_order'],
+                issued=issued,
+            ))
+        else:
+            updated = False
+            for field in ("price", "volume_remain", "volume_total", "is_buy_order"):
+                if getattr(existing_order, field) != order[field]:
+                    setattr(existing_order, field, order[field])
+                    updated = True
+            if existing_order.issued != issued:
+                existing_order.issued = issued
+                updated = True
+            if updated:
+                db.session.add(existing_order)
+    if new_orders:
+        db.session.bulk_save_objects(new_orders)
+    db.session.commit()
+
+
+def run(size):
+    """Benchmark both implementations for `size` orders."""
+    orders = make_orders(size)
+    refreshed = change_orders(orders)
+    runs = (
+        ("legacy", legacy_process_orders, orders, refreshed),
+        ("bulk upsert", process_orders, parse_orders(orders), parse_orders(refreshed)),
+    )
+    for name, func, initial, changed in runs:
+        with bench_app():
+            with timer(f"{name} insert {size} orders"):
+                func(REGION_ID, initial)
+            with timer(f"{name} refresh {size} orders (20% changed)"):
+                func(REGION_ID, changed)
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size)
+
+
+if __name__ == "__main__":
+    main()
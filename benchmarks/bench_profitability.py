@@ -0,0 +1,115 @@
+"""
+Module Docstring: Benchmark the batch profitability calculation for many products and hubs.
+
+Compares the matrix computation with a per-product, per-hub Python loop over the
+same preloaded prices, then times the full build_profitability pipeline including
+the price and history queries.
+
+    python -m benchmarks.bench_profitability --products 1000 --hubs 5
+"""
+import argparse
+import random
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.common import bench_app, timer
+from app.models import db, MarketOrder
+from bom import Expansion
+from profitability import (best_prices, build_profitability, material_matrix,
+                           profitability_matrix)
+
+HUBS = [10000002, 10000043, 10000032, 10000030, 10000042, 10000001, 10000003]
+
+
+class SyntheticEngine:
+    """Stands in for BOMEngine, returning pre-generated expansions."""
+
+    def __init__(self, expansions):
+        self.expansions = expansions
+
+    def expand_many(self, type_ids):
+        """Return the expansion of each product."""
+        return {type_id: self.expansions[type_id] for type_id in type_ids}
+
+
+def make_expansions(products, materials, per_product=20, seed=0):
+    """Generate expansions using `per_product` of `materials` raw materials each."""
+    rng = random.Random(seed)
+    material_ids = list(range(1, materials + 1))
+    return {
+        100_000 + p: Expansion(
+            {material_id: rng.uniform(1, 10_000) for material_id in
+             rng.sample(material_ids, per_product)},
+            rng.uniform(3_600, 86_400),
+        )
+        for p in range(products)
+    }
+
+
+def populate_orders(type_ids, hubs, seed=0):
+    """Insert a buy and a sell order for every type in every hub."""
+    rng = random.Random(seed)
+    issued = datetime(2025, 1, 1)
+    rows = []
+    for region_id in hubs:
+        for type_id in type_ids:
+            price = rng.uniform(1, 1_000_000)
+            for is_buy_order, factor in ((True, 0.95), (False, 1.0)):
+                rows.append({"order_id": len(rows), "type_id": type_id, "region_id": region_id,
+                             "price": price * factor, "volume_remain": 10, "volume_total": 10,
+                             "is_buy_order": is_buy_order, "issued": issued,
+                             "last_updated": issued})
+    db.session.execute(MarketOrder.__table__.insert(), rows)
+    db.session.commit()
+
+
+def loop_profitability(expansions, prices, hubs):
+    """Per-product, per-hub baseline over a {(region_id, type_id): price} dictionary."""
+    results = {}
+    for region_id in hubs:
+        for product_id, expansion in expansions.items():
+            cost = sum(quantity * prices[(region_id, material_id)]
+                       for material_id, quantity in expansion.materials.items())
+            revenue = prices[(region_id, product_id)]
+            margin = revenue - cost
+            results[(region_id, product_id)] = (cost, margin,
+                                                margin / (expansion.job_seconds / 3600))
+    return results
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--materials", type=int, default=300)
+    parser.add_argument("--hubs", type=int, default=5)
+    args = parser.parse_args()
+    hubs = HUBS[:args.hubs]
+    label = f"{args.products} products x {args.hubs} hubs"
+
+    expansions = make_expansions(args.products, args.materials)
+    with bench_app():
+        type_ids = list(expansions) + list(range(1, args.materials + 1))
+        populate_orders(type_ids, hubs)
+
+        with timer(f"best_prices query ({len(type_ids)} types x {args.hubs} hubs)"):
+            prices = best_prices(type_ids, hubs)
+        asks = prices["best_ask"].to_dict()
+
+        with timer(f"per-item loop {label}"):
+            loop_profitability(expansions, asks, hubs)
+
+        matrix, product_ids, material_ids, job_hours = material_matrix(expansions)
+        material_prices = np.array([[asks[(hub, m)] for hub in hubs] for m in material_ids])
+        product_prices = np.array([[asks[(hub, p)] for hub in hubs] for p in product_ids])
+        with timer(f"matrix computation {label}"):
+            profitability_matrix(matrix, material_prices, product_prices, job_hours,
+                                 np.ones_like(product_prices))
+
+        with timer(f"build_profitability end to end {label}"):
+            build_profitability(SyntheticEngine(expansions), list(expansions), hubs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Module Docstring: Benchmark the history and order book queries with and without the composite indexes.
+
+Prints the SQLite query plan and timings for the volume aggregate used by
+calculate_daily_sales_volumes and a best-price order book lookup.
+
+    python -m benchmarks.bench_queries --types 2000 --days 365
+"""
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.common import bench_app, timer
+from app.models import db, MarketOrder, MarketHistory
+
+REGION_ID = 10000002
+# Dropped for the baseline run, the unique history index would otherwise serve the SUM
+BENCHMARKED_INDEXES = (
+    "uq_market_history_type_region_date",
+    "ix_market_history_region_type_date_volume",
+    "ix_market_order_region_type_side_price",
+)
+QUERIES = {
+    "history volume SUM (30 days)": """
+        SELECT SUM(volume) FROM market_history
+        WHERE type_id = :type_id AND region_id = :region_id AND date >= :start_date
+    """,
+    "best sell price": """
+        SELECT MIN(price) FROM market_order
+        WHERE region_id = :region_id AND type_id = :type_id AND is_buy_order = 0
+    """,
+}
+
+
+def populate(types, days, orders_per_type, seed=0):
+    """Fill the history and order tables with synthetic data."""
+    rng = random.Random(seed)
+    end = date(2025, 1, 1)
+    db.session.execute(MarketHistory.__table__.insert(), [
+        {"type_id": type_id, "region_id": REGION_ID, "date": end - timedelta(days=day),
+         "volume": rng.randint(0, 5_000), "average_price": rng.uniform(1, 1000)}
+        for type_id in range(types) for day in range(days)
+    ])
+    db.session.execute(MarketOrder.__table__.insert(), [
+        {"order_id": type_id * orders_per_type + i, "type_id": type_id, "region_id": REGION_ID,
+         "price": rng.uniform(1, 1000), "volume_remain": 10, "volume_total": 10,
+         "is_buy_order": i % 2 == 0, "issued": datetime(2025, 1, 1),
+         "last_updated": datetime(2025, 1, 1)}
+        for type_id in range(types) for i in range(orders_per_type)
+    ])
+    db.session.commit()
+
+
+def run_queries(label, types, repeat):
+    """Print the plan of each query and time `repeat` lookups over random types."""
+    rng = random.Random(1)
+    params = {"region_id": REGION_ID, "start_date": date(2024, 12, 2)}
+    for name, query in QUERIES.items():
+        plan = db.session.execute(text(f"EXPLAIN QUERY PLAN {query}"),
+                                  {**params, "type_id": 0}).fetchall()
+        print(f"  {label} plan for {name}: {' | '.join(row[-1] for row in plan)}")
+        with timer(f"{label} {name} x{repeat}"):
+            for _ in range(repeat):
+                db.session.execute(text(query), {**params, "type_id": rng.randrange(types)}).scalar()
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--types", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--orders-per-type", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with bench_app():
+        with timer(f"populate {args.types} types x {args.days} days"):
+            populate(args.types, args.days, args.orders_per_type)
+        for index in BENCHMARKED_INDEXES:
+            db.session.execute(text(f"DROP INDEX {index}"))
+        run_queries("without indexes", args.types, args.repeat)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in BENCHMARKED_INDEXES:
+                    index.create(db.session.connection())
+        db.session.execute(text("ANALYZE"))
+        run_queries("with indexes", args.types, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
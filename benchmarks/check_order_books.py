@@ -0,0 +1,93 @@
+"""
+Module Docstring: Check that incremental order fetches keep the stored order books exact.
+
+Pages ESI reports as unchanged (304) are not downloaded again, so the orders on them
+must still count as seen when vanished orders are pruned. Each scenario runs a
+sequence of fetches against the stub ESI server, with the fetch state expired in
+between, and compares the stored orders with the book the stub serves last.
+
+    python -m benchmarks.check_order_books
+"""
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.common import bench_app
+from benchmarks.fixtures import make_orders
+from benchmarks.stub_esi import StubESI
+from app.models import db, FetchState, MarketOrder
+from fetch_data import fetch_market_orders
+from logging_config import configure_logging
+
+REGION_ID = 10000002
+# Three types of 1000 orders each, spread over the three pages of the region book
+ORDERS = make_orders(3000, types=3)
+TYPE_IDS = sorted({order["type_id"] for order in ORDERS})
+# One type whose book spans two pages
+BUSY_ORDERS = make_orders(2000, types=1)
+BUSY_TYPE_IDS = [BUSY_ORDERS[0]["type_id"]]
+
+
+def fetch(orders, type_ids, mode):
+    """Expire the fetch state, then fetch `type_ids` in `mode` from a stub serving `orders`."""
+    FetchState.query.update({"expires": datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    with StubESI(orders) as base_url:
+        fetch_market_orders(REGION_ID, type_ids, mode=mode, base_url=base_url)
+
+
+# Name -> list of (orders served, type IDs fetched, mode), the last book is the expected one
+SCENARIOS = {
+    # Types fetched on their own between two region snapshots of fewer types
+    "region, type, then region of all types": [
+        (ORDERS, TYPE_IDS[:2], "region"),
+        (ORDERS, TYPE_IDS[2:], "type"),
+        (ORDERS, TYPE_IDS, "region"),
+    ],
+    "region of all types, then region of some": [
+        (ORDERS, TYPE_IDS, "region"),
+        (ORDERS, TYPE_IDS[:1], "region"),
+        (ORDERS, TYPE_IDS, "region"),
+    ],
+    "region, last page shrunk": [
+        (ORDERS, TYPE_IDS, "region"),
+        (ORDERS[:2950], TYPE_IDS, "region"),
+    ],
+    "region, middle page shrunk": [
+        (ORDERS, TYPE_IDS, "region"),
+        (ORDERS[:1000] + ORDERS[1100:], TYPE_IDS, "region"),
+        (ORDERS[:1000] + ORDERS[1100:], TYPE_IDS, "region"),
+    ],
+    # Pages of a type's book carry their own ETags, page 1 is unchanged here
+    "type, second page shrunk": [
+        (BUSY_ORDERS, BUSY_TYPE_IDS, "type"),
+        (BUSY_ORDERS[:1010], BUSY_TYPE_IDS, "type"),
+    ],
+}
+
+
+def check(name, steps):
+    """Run one scenario and return whether the stored orders match the last book served."""
+    with bench_app():
+        for orders, type_ids, mode in steps:
+            fetch(orders, type_ids, mode)
+        expected = {order["order_id"] for order in steps[-1][0]}
+        stored = set(db.session.execute(db.select(MarketOrder.order_id)).scalars())
+    ok = stored == expected
+    print(f"{name:<45} {len(stored):>6} stored {len(expected):>6} expected"
+          f"  {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    """Main entry point of the script, exits with 1 when a stored book is wrong."""
+    # Configured first, so that the apps created by bench_app keep the level
+    configure_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+    results = [check(name, steps) for name, steps in SCENARIOS.items()]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
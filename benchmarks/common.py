@@ -0,0 +1,35 @@
+"""
+Module Docstring: Shared helpers for the benchmark scripts.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from app import create_app
+from app.models import db
+
+
+@contextmanager
+def bench_app():
+    """Yield an app context bound to a fresh, temporary SQLite database."""
+    with tempfile.TemporaryDirectory() as tmp:
+        bench = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'CACHE_TYPE': 'NullCache',
+        })
+        with bench.app_context():
+            yield bench
+            db.session.remove()
+            db.engine.dispose()
+
+
+@contextmanager
+def timer(label, results=None):
+    """Time the enclosed block, print it and optionally record it in `results`."""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    print(f"{label:<50} {elapsed:>10.3f} s")
+    if results is not None:
+        results[label] = elapsed
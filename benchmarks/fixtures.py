@@ -0,0 +1,166 @@
+"""
+Module Docstring: Deterministic synthetic data for the benchmarks.
+
+Every generator takes a seed, so two runs on any machine work on identical data:
+ESI market orders and history as ESI returns them, and an SDE export with the
+tables and shape of the Fuzzwork one (Tech I hulls, invented Tech II ships built
+from components, and components built from reacted moon materials).
+"""
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+# First type ID of each synthetic SDE type range
+MINERAL_IDS = range(34, 42)
+MOON_MATERIAL_IDS = range(16_633, 16_653)
+DATACORE_IDS = range(20_410, 20_420)
+INTERMEDIATE_BASE = 100_000
+COMPONENT_BASE = 200_000
+HULL_BASE = 300_000
+SHIP_BASE = 400_000
+# Blueprint IDs are the product ID plus this offset
+BLUEPRINT_OFFSET = 1_000_000
+
+
+def make_orders(count, types=50, seed=0, first_type_id=34):
+    """Generate `count` synthetic ESI orders spread evenly over `types` type IDs."""
+    rng = random.Random(seed)
+    issued = datetime(2025, 1, 1)
+    return [
+        {
+            "order_id": 6_000_000_000 + i,
+            "type_id": first_type_id + i % types,
+            "price": round(rng.uniform(1, 1000), 2),
+            "volume_remain": rng.randint(1, 10_000),
+            "volume_total": 10_000,
+            "is_buy_order": i % 3 == 0,
+            "issued": (issued + timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }
+        for i in range(count)
+    ]
+
+
+def change_orders(orders, fraction=0.2, seed=1):
+    """Return a copy of `orders` with `fraction` of them repriced."""
+    rng = random.Random(seed)
+    changed = [dict(order) for order in orders]
+    for order in rng.sample(changed, int(len(changed) * fraction)):
+        order["price"] = round(order["price"] * 0.99, 2)
+        order["volume_remain"] = max(1, order["volume_remain"] - 1)
+    return changed
+
+
+def make_history(days, end, seed=0):
+    """Generate `days` synthetic ESI history entries ending on `end`."""
+    rng = random.Random(seed)
+    return [
+        {
+            "date": (end - timedelta(days=days - 1 - i)).isoformat(),
+            "volume": rng.randint(0, 5_000),
+            "average": round(rng.uniform(1, 1000), 2),
+            "highest": 0.0,
+            "lowest": 0.0,
+            "order_count": rng.randint(0, 100),
+        }
+        for i in range(days)
+    ]
+
+
+def make_sde(path, ships, seed=0):
+    """
+    Write a synthetic SDE export with `ships` Tech II ships to a new SQLite file.
+
+    :param path: The file to create, replaced if it exists.
+    :param ships: Number of Tech II ships, each with its own Tech I hull.
+    :return: The type IDs of the Tech II ships.
+    """
+    rng = random.Random(seed)
+    components = max(10, ships // 10)
+    intermediates = max(5, components // 5)
+    types, groups, meta_types = [], [], []
+    activities, materials, products, probabilities = [], [], [], []
+
+    def add_type(type_id, group_id, name):
+        types.append((type_id, group_id, name, 1, 1.0, f"Synthetic {name}"))
+
+    def add_blueprint(product_id, activity_id, seconds, inputs, quantity=1):
+        blueprint_id = product_id + BLUEPRINT_OFFSET
+        activities.append((blueprint_id, activity_id, seconds))
+        materials.extend((blueprint_id, activity_id, material_id, amount)
+                         for material_id, amount in inputs)
+        products.append((blueprint_id, activity_id, product_id, quantity))
+        return blueprint_id
+
+    groups.extend([(18, 4, "Mineral"), (427, 4, "Moon Materials"), (333, 17, "Datacores"),
+                   (428, 4, "Intermediate Materials"), (334, 17, "Construction Components"),
+                   (25, 6, "Frigate"), (831, 6, "Interceptor"), (105, 9, "Blueprint")])
+    for type_id in MINERAL_IDS:
+        add_type(type_id, 18, f"Mineral {type_id}")
+    for type_id in MOON_MATERIAL_IDS:
+        add_type(type_id, 427, f"Moon Material {type_id}")
+    for type_id in DATACORE_IDS:
+        add_type(type_id, 333, f"Datacore {type_id}")
+
+    for i in range(intermediates):
+        type_id = INTERMEDIATE_BASE + i
+        add_type(type_id, 428, f"Intermediate {i}")
+        inputs = [(moon_id, 100) for moon_id in rng.sample(MOON_MATERIAL_IDS, 2)]
+        add_type(add_blueprint(type_id, 11, 10_800, inputs, 200), 105, f"Formula {i}")
+    for i in range(components):
+        type_id = COMPONENT_BASE + i
+        add_type(type_id, 334, f"Component {i}")
+        inputs = [(INTERMEDIATE_BASE + j, rng.randint(5, 50))
+                  for j in rng.sample(range(intermediates), 3)]
+        add_type(add_blueprint(type_id, 1, 600, inputs), 105, f"Component {i} Blueprint")
+
+    ship_ids = []
+    for i in range(ships):
+        hull_id, ship_id = HULL_BASE + i, SHIP_BASE + i
+        add_type(hull_id, 25, f"Hull {i}")
+        add_type(ship_id, 831, f"Ship {i}")
+        meta_types.append((ship_id, hull_id, 2))
+        hull_inputs = [(mineral_id, rng.randint(1_000, 50_000)) for mineral_id in MINERAL_IDS]
+        hull_blueprint_id = add_blueprint(hull_id, 1, 6_000, hull_inputs)
+        add_type(hull_blueprint_id, 105, f"Hull {i} Blueprint")
+        ship_inputs = [(hull_id, 1)] + [(COMPONENT_BASE + j, rng.randint(10, 200))
+                                        for j in rng.sample(range(components), 5)]
+        ship_blueprint_id = add_blueprint(ship_id, 1, 12_000, ship_inputs)
+        add_type(ship_blueprint_id, 105, f"Ship {i} Blueprint")
+        invention_inputs = [(datacore_id, 2) for datacore_id in rng.sample(DATACORE_IDS, 2)]
+        activities.append((hull_blueprint_id, 8, 3_600))
+        materials.extend((hull_blueprint_id, 8, datacore_id, amount)
+                         for datacore_id, amount in invention_inputs)
+        products.append((hull_blueprint_id, 8, ship_blueprint_id, 10))
+        probabilities.append((hull_blueprint_id, 8, ship_blueprint_id, 0.3))
+        ship_ids.append(ship_id)
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript("""
+            CREATE TABLE invTypes (typeID INTEGER, groupID INTEGER, typeName TEXT,
+                                   published INTEGER, volume REAL, description TEXT);
+            CREATE TABLE invGroups (groupID INTEGER, categoryID INTEGER, groupName TEXT);
+            CREATE TABLE invMetaTypes (typeID INTEGER, parentTypeID INTEGER, metaGroupID INTEGER);
+            CREATE TABLE industryActivity (typeID INTEGER, activityID INTEGER, time INTEGER);
+            CREATE TABLE industryActivityMaterials (typeID INTEGER, activityID INTEGER,
+                                                    materialTypeID INTEGER, quantity INTEGER);
+            CREATE TABLE industryActivityProducts (typeID INTEGER, activityID INTEGER,
+                                                   productTypeID INTEGER, quantity INTEGER);
+            CREATE TABLE industryActivityProbabilities (typeID INTEGER, activityID INTEGER,
+                                                        productTypeID INTEGER, probability REAL);
+        """)
+        conn.executemany("INSERT INTO invTypes VALUES (?, ?, ?, ?, ?, ?)", types)
+        conn.executemany("INSERT INTO invGroups VALUES (?, ?, ?)", groups)
+        conn.executemany("INSERT INTO invMetaTypes VALUES (?, ?, ?)", meta_types)
+        conn.executemany("INSERT INTO industryActivity VALUES (?, ?, ?)", activities)
+        conn.executemany("INSERT INTO industryActivityMaterials VALUES (?, ?, ?, ?)", materials)
+        conn.executemany("INSERT INTO industryActivityProducts VALUES (?, ?, ?, ?)", products)
+        conn.executemany("INSERT INTO industryActivityProbabilities VALUES (?, ?, ?, ?)",
+                         probabilities)
+        conn.commit()
+    finally:
+        conn.close()
+    return ship_ids
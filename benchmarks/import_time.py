@@ -0,0 +1,99 @@
+"""
+Module Docstring: Check the start-up time of the entry points against a budget.
+
+Each module is imported in a fresh interpreter, best of --repeat runs, then once more
+under `python -X importtime` to see what it pulls in. The check fails when starting a
+process that imports the module takes longer than the budget, or when the module
+imports one of HEAVY_MODULES, which must only be imported by the code that needs them.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time fetch_data --top 15 --budget 0.5
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+# Modules the CLI jobs, the workers and the web app start from
+ENTRY_MODULES = (
+    "app",
+    "app.routes",
+    "app.api",
+    "fetch_data",
+    "scheduler",
+    "history_archive",
+    "sde_import",
+    "sde_index",
+    "blueprints",
+)
+# Seconds a process importing an entry module may take to start, by default. The modules
+# that load Flask and SQLAlchemy measured 0.6-1.1s on a fast machine and up to 1.7s on a
+# slower one, the budget leaves room above that
+BUDGET = 2.0
+# Imported lazily, by the functions that need them
+HEAVY_MODULES = ("pandas", "matplotlib")
+
+
+def start_up_time(module):
+    """Return the seconds a fresh interpreter takes to import `module` and exit."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - start
+
+
+def import_times(module):
+    """
+    Import `module` in a fresh interpreter under `-X importtime`, which slows it down.
+
+    :return: A dictionary of each imported module to its self and cumulative import time
+             in seconds.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header
+        imports[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return imports
+
+
+def check(module, budget, repeat, top):
+    """Measure one module, print its report and return whether it is within the budget."""
+    elapsed = min(start_up_time(module) for _ in range(repeat))
+    imports = import_times(module)
+    heavy = sorted(name for name in imports if name in HEAVY_MODULES)
+    ok = elapsed <= budget and not heavy
+    print(f"{module:<20} {elapsed:6.3f}s  {len(imports):5} modules  {'ok' if ok else 'FAIL'}")
+    if heavy:
+        print(f"  imports {', '.join(heavy)} at start-up")
+    if top:
+        slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (self_s, cumulative_s) in slowest:
+            print(f"  {self_s * 1000:7.1f} ms self {cumulative_s * 1000:8.1f} ms total  {name}")
+    return ok
+
+
+def main():
+    """Main entry point of the script, exits with 1 when a module is over budget."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=ENTRY_MODULES)
+    parser.add_argument("--budget", type=float, default=BUDGET,
+                        help="Seconds each module may take to start a process.")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of this many imports.")
+    parser.add_argument("--top", type=int, default=0,
+                        help="List the modules with the slowest imports of their own.")
+    args = parser.parse_args()
+
+    print(f"Start-up budget {args.budget:.3f}s, no {', '.join(HEAVY_MODULES)} at import")
+    results = [check(module, args.budget, args.repeat, args.top) for module in args.modules]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""
+Module Docstring: Run the benchmark suite over synthetic fixtures and flag regressions.
+
+Every hot path is measured on generated data against a fresh SQLite database and a
+local stub ESI server, so the numbers are reproducible without network access:
+order decoding, process_orders, both order fetch modes, history ingestion and fetch,
+the history statistics, the SDE import, index and blueprint lookups, and the Flask
+routes. Each stage reports its best time of --repeat runs, its throughput, the
+p50/p95 latency of its individual calls where it makes many, and the peak Python
+heap measured with tracemalloc in a separate run.
+
+Results are compared with the baseline stored for the scale in baseline.json, and
+the exit status is 1 when a stage got slower or bigger than the tolerances allow.
+Baselines depend on the machine, record your own before comparing:
+
+    python -m benchmarks.run --save-baseline        # on the parent commit
+    python -m benchmarks.run                        # on your change
+    python -m benchmarks.run --scale full --stages process_orders ingest_history
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import date
+from fnmatch import fnmatch
+from functools import cached_property
+from typing import Callable, NamedTuple
+from unittest import mock
+
+from flask import current_app
+
+from benchmarks.common import bench_app
+from benchmarks.fixtures import change_orders, make_history, make_orders, make_sde
+from benchmarks.stub_esi import StubESI
+from analytics import market_history_stats
+from bom import BOMEngine
+from esi_payloads import decode_orders, parse_orders
+import fetch_data
+from fetch_data import (calculate_daily_sales_volumes, fetch_market_history,
+                        fetch_market_orders, ingest_history, latest_history_dates,
+                        process_orders)
+from logging_config import configure_logging
+import order_snapshots
+from sde_import import import_sde
+from sde_index import SDEIndex
+
+REGION_ID = 10000002
+HISTORY_END = date(2025, 1, 1)
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SCALES = {
+    "small": {
+        "orders": 50_000, "order_types": 500, "fetch_types": 200,
+        "history_types": 100, "history_years": 2, "ships": 200, "requests": 20,
+    },
+    "full": {
+        "orders": 1_000_000, "order_types": 2_000, "fetch_types": 2_000,
+        "history_types": 2_000, "history_years": 5, "ships": 2_000, "requests": 100,
+    },
+}
+# Allowed slowdown and peak memory growth before a stage counts as a regression
+TIME_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.10
+# Time differences below this many seconds and memory differences below this many MB are noise
+TIME_FLOOR = 0.05
+MEMORY_FLOOR_MB = 1.0
+
+
+class Stage(NamedTuple):
+    """
+    One benchmarked operation.
+
+    :param name: The stage name, used in the results and the baseline.
+    :param unit: What the items counted for the throughput are.
+    :param run: Called with the setup state, returns (items, per-call latencies or None).
+    :param setup: Called in a fresh database before each run, returns the state for `run`.
+    :param read_only: The run does not change the database, so one setup serves every run.
+    """
+    name: str
+    unit: str
+    run: Callable
+    setup: Callable = lambda: None
+    read_only: bool = False
+
+
+class Fixtures:
+    """The generated data of one scale, each part built on first use and kept."""
+
+    def __init__(self, scale, workdir):
+        self.scale = scale
+        self.workdir = workdir
+
+    @cached_property
+    def orders(self):
+        """ESI orders spread over the order types."""
+        return make_orders(self.scale["orders"], types=self.scale["order_types"])
+
+    @cached_property
+    def order_type_ids(self):
+        """The type IDs with orders, sorted."""
+        return sorted({order["type_id"] for order in self.orders})
+
+    @cached_property
+    def parsed_orders(self):
+        """The orders as Order tuples."""
+        return parse_orders(self.orders)
+
+    @cached_property
+    def parsed_refresh(self):
+        """The orders with a fifth of them changed, as Order tuples."""
+        return parse_orders(change_orders(self.orders))
+
+    @cached_property
+    def order_body(self):
+        """The orders as a single JSON body."""
+        return json.dumps(self.orders).encode()
+
+    @cached_property
+    def history(self):
+        """Dictionary of type ID to its ESI history entries."""
+        days = self.scale["history_years"] * 365
+        return {type_id: make_history(days, HISTORY_END, seed=type_id)
+                for type_id in range(1, self.scale["history_types"] + 1)}
+
+    @cached_property
+    def history_rows(self):
+        """Total number of history entries."""
+        return sum(len(entries) for entries in self.history.values())
+
+    @cached_property
+    def sde(self):
+        """The path of the synthetic SDE export and its Tech II ship type IDs."""
+        path = os.path.join(self.workdir, "sde.sqlite")
+        return path, make_sde(path, self.scale["ships"])
+
+    @cached_property
+    def slim_sde(self):
+        """The path of the slim database imported from the synthetic SDE."""
+        path = os.path.join(self.workdir, "sde-slim-fixture.sqlite")
+        import_sde(self.sde[0], path, md5="fixture")
+        return path
+
+    @cached_property
+    def ships_file(self):
+        """The path of a T2 ship list naming the history types, read by /analyse."""
+        path = os.path.join(self.workdir, "t2_ships.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for type_id in self.history:
+                f.write(f"{type_id}, Ship {type_id}\n")
+        return path
+
+
+def build_stages(fixtures, base_url):
+    """Return the stages of the suite, in the order they run."""
+    scale = fixtures.scale
+
+    def load_history():
+        for type_id, entries in fixtures.history.items():
+            ingest_history(REGION_ID, type_id, entries)
+
+    def ingest_all():
+        latest = latest_history_dates(REGION_ID, list(fixtures.history))
+        return fixtures.history_rows, [
+            _timed(ingest_history, REGION_ID, type_id, entries, latest.get(type_id))
+            for type_id, entries in fixtures.history.items()
+        ]
+
+    def fetch_orders(mode, type_ids):
+        stats = fetch_market_orders(REGION_ID, type_ids, mode=mode, base_url=base_url)
+        return stats.rows_written, None
+
+    def daily_volumes():
+        type_ids = list(fixtures.history)[:scale["requests"]]
+        return len(type_ids), [_timed(calculate_daily_sales_volumes, type_id, REGION_ID)
+                               for type_id in type_ids]
+
+    def fresh_slim():
+        path = os.path.join(fixtures.workdir, "sde-slim-run.sqlite")
+        if os.path.exists(path):
+            os.remove(path)
+        return path
+
+    def blueprint_lookups(index):
+        ship_ids = fixtures.sde[1]
+        return len(ship_ids), [_timed(index.blueprint_details, type_id) for type_id in ship_ids]
+
+    def routes_client():
+        load_history()
+        return current_app.test_client()
+
+    def get(client, path):
+        latencies = []
+        for _ in range(scale["requests"]):
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, (path, response.status_code)
+        return len(latencies), latencies
+
+    fetch_type_ids = fixtures.order_type_ids[:scale["fetch_types"]]
+    history_stats_path = (f"/api/history_stats?region_ids={REGION_ID}"
+                          f"&type_ids={','.join(map(str, fixtures.history))}")
+    return [
+        Stage("decode_orders", "orders",
+              lambda _: (len(decode_orders(fixtures.order_body)), None)),
+        Stage("process_orders insert", "orders",
+              lambda _: _process(fixtures.parsed_orders, fixtures.order_type_ids)),
+        Stage("process_orders refresh", "orders",
+              lambda _: _process(fixtures.parsed_refresh, fixtures.order_type_ids),
+              setup=lambda: _process(fixtures.parsed_orders, fixtures.order_type_ids)),
+        Stage("fetch_market_orders type mode", "orders",
+              lambda _: fetch_orders("type", fetch_type_ids)),
+        Stage("fetch_market_orders region mode", "orders",
+              lambda _: fetch_orders("region", fixtures.order_type_ids)),
+        Stage("ingest_history", "rows", lambda _: ingest_all()),
+        Stage("fetch_market_history", "rows",
+              lambda _: (fetch_market_history(REGION_ID, list(fixtures.history),
+                                              base_url=base_url).rows_written, None)),
+        Stage("market_history_stats", "types",
+              lambda _: (len(market_history_stats(list(fixtures.history), [REGION_ID])), None),
+              setup=load_history, read_only=True),
+        Stage("calculate_daily_sales_volumes", "types", lambda _: daily_volumes(),
+              setup=load_history, read_only=True),
+        Stage("import_sde", "types",
+              lambda path: (len(import_sde(fixtures.sde[0], path, "bench")), None),
+              setup=fresh_slim),
+        Stage("SDEIndex.from_sde", "ships",
+              lambda _: (len(SDEIndex.from_sde(fixtures.slim_sde).t2_ships()), None),
+              read_only=True),
+        Stage("get_blueprint_details", "ships", blueprint_lookups,
+              setup=lambda: SDEIndex.from_sde(fixtures.slim_sde), read_only=True),
+        Stage("BOMEngine.expand_many", "ships",
+              lambda index: (len(BOMEngine(index).expand_many(fixtures.sde[1])), None),
+              setup=lambda: SDEIndex.from_sde(fixtures.slim_sde), read_only=True),
+        Stage("GET /analyse", "requests", lambda client: get(client, "/analyse"),
+              setup=routes_client, read_only=True),
+        # The first request fills the read cache, the others are served from it
+        Stage("GET /api/history_stats", "requests", lambda client: get(client, history_stats_path),
+              setup=routes_client, read_only=True),
+        Stage("GET /metrics", "requests", lambda client: get(client, "/metrics"),
+              setup=routes_client, read_only=True),
+    ]
+
+
+def run_stage(stage, repeat, memory):
+    """
+    Run a stage `repeat` times, then once more under tracemalloc if `memory` is set.
+
+    :return: A dictionary of the stage's measurements.
+    """
+    runs = []
+    with _fresh_database():
+        state = stage.setup()
+        for attempt in range(repeat):
+            if attempt and not stage.read_only:
+                with _fresh_database():
+                    runs.append(_measure(stage, stage.setup()))
+            else:
+                runs.append(_measure(stage, state))
+        if memory:
+            with ExitStack() as stack:
+                if not stage.read_only:
+                    stack.enter_context(_fresh_database())
+                    state = stage.setup()
+                tracemalloc.start()
+                try:
+                    stage.run(state)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+
+    seconds, items, latencies = min(runs, key=lambda result: result[0])
+    result = {
+        "seconds": round(seconds, 4),
+        "items": items,
+        "unit": stage.unit,
+        "throughput": round(items / seconds, 1) if seconds else None,
+        "repeat": repeat,
+    }
+    if latencies:
+        latencies = sorted(latencies)
+        result["p50_ms"] = round(_percentile(latencies, 50) * 1000, 3)
+        result["p95_ms"] = round(_percentile(latencies, 95) * 1000, 3)
+    if memory:
+        result["peak_mb"] = round(peak / 1e6, 2)
+    return result
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE,
+            memory_tolerance=MEMORY_TOLERANCE):
+    """
+    Compare results with a baseline of the same scale.
+
+    :return: A dictionary of stage name to the list of regressions found in it.
+    """
+    regressions = {}
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        found = []
+        if (result["seconds"] > reference["seconds"] * (1 + time_tolerance)
+                and result["seconds"] - reference["seconds"] > TIME_FLOOR):
+            found.append(f"time {result['seconds']:.3f} s vs {reference['seconds']:.3f} s")
+        if ("peak_mb" in result and "peak_mb" in reference
+                and result["peak_mb"] > reference["peak_mb"] * (1 + memory_tolerance)
+                and result["peak_mb"] - reference["peak_mb"] > MEMORY_FLOOR_MB):
+            found.append(f"peak {result['peak_mb']:.1f} MB vs {reference['peak_mb']:.1f} MB")
+        if found:
+            regressions[name] = found
+    return regressions
+
+
+def report(results, baseline):
+    """Print a table of the results, with the change against the baseline."""
+    print(f"{'stage':<34} {'time':>9} {'throughput':>22} {'p50':>9} {'p95':>9}"
+          f" {'peak':>9} {'vs base':>8}")
+    for name, result in results.items():
+        throughput = f"{result['throughput']:,.0f} {result['unit']}/s" \
+            if result["throughput"] else "-"
+        p50 = f"{result['p50_ms']:.2f}ms" if "p50_ms" in result else "-"
+        p95 = f"{result['p95_ms']:.2f}ms" if "p95_ms" in result else "-"
+        peak = f"{result['peak_mb']:.1f}MB" if "peak_mb" in result else "-"
+        reference = baseline.get(name)
+        change = f"{result['seconds'] / reference['seconds'] - 1:+.0%}" \
+            if reference and reference["seconds"] else "-"
+        print(f"{name:<34} {result['seconds']:>8.3f}s {throughput:>22} {p50:>9} {p95:>9}"
+              f" {peak:>9} {change:>8}")
+
+
+def load_baselines(path=BASELINE_FILE):
+    """Read the stored baselines, a dictionary of scale to stage results."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(scale_name, results, path=BASELINE_FILE):
+    """Store `results` as the baseline of a scale, keeping the other scales."""
+    baselines = load_baselines(path)
+    baselines[scale_name] = results
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+@contextmanager
+def _fresh_database():
+    with bench_app():
+        # Cached snapshot heads belong to whichever database was used before
+        order_snapshots._heads.clear()  # pylint: disable=protected-access
+        yield
+
+
+def _measure(stage, state):
+    start = time.perf_counter()
+    items, latencies = stage.run(state)
+    return time.perf_counter() - start, items, latencies
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def _process(orders, type_ids):
+    process_orders(REGION_ID, orders, snapshot_type_ids=type_ids)
+    return len(orders), None
+
+
+def _percentile(values, percent):
+    """Return the nearest-rank percentile of sorted `values`."""
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--stages", nargs="+", default=["*"],
+                        help="Only run the stages matching these patterns.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip the tracemalloc run measuring peak memory.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the stub ESI server waits before each response.")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store the results as the new baseline of the scale.")
+    parser.add_argument("--output", help="Also write the results as JSON to this file.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the INFO log output.")
+    args = parser.parse_args()
+    # Configured here, so that the apps created by the stages keep the level
+    configure_logging(level=logging.INFO if args.verbose else logging.WARNING)
+
+    scale = SCALES[args.scale]
+    print(f"Scale {args.scale}: {scale}")
+    print(f"Python {platform.python_version()} on {platform.platform()}")
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        fixtures = Fixtures(scale, workdir)
+        with StubESI(fixtures.orders, fixtures.history, args.latency) as base_url, \
+                mock.patch.object(fetch_data, "T2_SHIPS_FILE", fixtures.ships_file):
+            for stage in build_stages(fixtures, base_url):
+                if any(fnmatch(stage.name, pattern) for pattern in args.stages):
+                    results[stage.name] = run_stage(stage, args.repeat, not args.no_memory)
+                    print(f"  {stage.name}: {results[stage.name]['seconds']:.3f} s")
+
+    baseline = load_baselines(args.baseline).get(args.scale, {})
+    print()
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "python": platform.python_version(),
+                       "stages": results}, f, indent=2)
+    if args.save_baseline:
+        save_baseline(args.scale, {**baseline, **results}, args.baseline)
+        print(f"\nSaved the {args.scale} baseline to {args.baseline}.")
+        return 0
+    if any(baseline[name].get("repeat") != args.repeat for name in results if name in baseline):
+        print(f"\nThe baseline was recorded with another --repeat than {args.repeat},"
+              " best times of fewer runs are slower.")
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for name, found in regressions.items():
+        print(f"REGRESSION {name}: {'; '.join(found)}")
+    if not baseline:
+        print(f"\nNo {args.scale} baseline in {args.baseline}, run with --save-baseline first.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Module Docstring: A local stand-in for the ESI market endpoints.
+
+Serves market orders, as paginated per-type and region books, and market history
+from fixtures held in memory, with the headers the ESI client relies on: X-Pages,
+Expires, ETag (answering If-None-Match with 304) and the error-limit headers. Bodies
+are encoded once up front so the server costs as little as possible per request.
+
+    with StubESI(orders, history) as base_url:
+        fetch_market_orders(region_id, type_ids, base_url=base_url)
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from email.utils import formatdate
+
+from aiohttp import web
+
+# Orders per page of the region endpoint, as on ESI
+PAGE_SIZE = 1000
+# Seconds the served data stays fresh
+EXPIRES_AFTER = 300
+
+
+class StubESI:
+    """
+    Stub ESI server running on its own event loop in a background thread.
+
+    :param orders: ESI orders served for every region.
+    :param history: Dictionary of type ID to the ESI history entries served for every region.
+    :param latency: Seconds each request waits before answering, to mimic the network.
+    """
+
+    def __init__(self, orders=(), history=None, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        by_type = defaultdict(list)
+        for order in orders:
+            by_type[order["type_id"]].append(order)
+        self._type_orders = {type_id: _encode_pages(items) for type_id, items in by_type.items()}
+        self._pages = _encode_pages(list(orders))
+        self._history = {type_id: _encode(items) for type_id, items in (history or {}).items()}
+        self._empty = _encode([])
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self.base_url = None
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+        self._runner = web.AppRunner(self._application(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def __exit__(self, exc_type, exc, tb):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _application(self):
+        application = web.Application()
+        application.router.add_get("/markets/{region_id}/orders/", self._orders)
+        application.router.add_get("/markets/{region_id}/history/", self._history_handler)
+        return application
+
+    async def _orders(self, request):
+        type_id = request.query.get("type_id")
+        if type_id is not None:
+            pages = self._type_orders.get(int(type_id), [self._empty])
+        else:
+            pages = self._pages
+        page = int(request.query.get("page", 1))
+        if not 1 <= page <= len(pages):
+            return web.json_response({"error": "Requested page does not exist!"}, status=404)
+        return await self._respond(request, pages[page - 1], pages=len(pages))
+
+    async def _history_handler(self, request):
+        type_id = int(request.query["type_id"])
+        return await self._respond(request, self._history.get(type_id, self._empty))
+
+    async def _respond(self, request, encoded, pages=1):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body, etag = encoded
+        headers = {
+            "ETag": etag,
+            "Expires": formatdate(time.time() + EXPIRES_AFTER, usegmt=True),
+            "X-Pages": str(pages),
+            "X-ESI-Error-Limit-Remain": "100",
+            "X-ESI-Error-Limit-Reset": "60",
+        }
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+
+def _encode_pages(items):
+    """Split `items` into PAGE_SIZE pages and encode each one, there is always a page."""
+    return [_encode(items[start:start + PAGE_SIZE])
+            for start in range(0, len(items), PAGE_SIZE)] or [_encode([])]
+
+
+def _encode(items):
+    """Return the JSON body of `items` and its ETag."""
+    body = json.dumps(items).encode()
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
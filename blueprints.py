@@ -1,28 +1,20 @@
-import sqlite3
-
-# Path to your SQLite SDE file
-sde_path = "sqlite-latest.sqlite"
-conn = sqlite3.connect(sde_path)
-cursor = conn.cursor()
-
-# Query to find T2 ship type IDs
-query = """
-    SELECT typeID, typeName 
-    FROM invTypes 
-    WHERE groupID IN (
-        SELECT groupID FROM invGroups WHERE categoryID = 6
-    )
-    AND typeID IN (
-        SELECT typeID FROM invMetaTypes WHERE metaGroupID = 2
-    );
 """
-cursor.execute(query)
-t2_ships = cursor.fetchall()
+Module Docstring: This module lists the materials needed to build the T2 ships in t2_ships.txt.
 
-"""# Print T2 ships
-for ship in t2_ships:
-    print(f"Type ID: {ship[0]}, Name: {ship[1]}")
+    python blueprints.py
 """
+from functools import lru_cache
+
+from bom import BOMEngine
+from sde_index import SDEIndex
+
+
+@lru_cache(maxsize=None)
+def load_sde_index():
+    """Return the SDE index, loaded on first use instead of at import."""
+    # Blueprint lookups come from the cached SDE index instead of querying the SDE file
+    return SDEIndex.load()
+
 def get_blueprint_details(type_id):
     """
     Fetch blueprint details for a specific type ID.
@@ -30,55 +22,45 @@ def get_blueprint_details(type_id):
     :param type_id: The type ID of the ship.
     :return: A dictionary containing materials and build time.
     """
-    # Get blueprint ID
-    cursor.execute("SELECT typeID FROM industryActivityProducts WHERE productTypeID = ?", (type_id,))
-    blueprint_id = cursor.fetchone()
-    if not blueprint_id:
-        return None
-
-    blueprint_id = blueprint_id[0]
-
-    # Get materials
-    cursor.execute("""
-        SELECT materialTypeID, quantity
-        FROM industryActivityMaterials
-        WHERE typeID = ? AND activityID = 1  -- activityID 1 = manufacturing
-    """, (blueprint_id,))
-    materials = cursor.fetchall()
+    return load_sde_index().blueprint_details(type_id)
 
-    return {
-        "blueprint_id": blueprint_id,
-        "materials": materials,
-    }
+def main():
+    """Main entry point of the script, writes the material IDs to t2_materials.txt."""
+    t2_ships_blueprints = []
+    ship_list = []
+    with open("t2_ships.txt", "r", encoding="utf-8") as f:
+        t2_ships = f.readlines()
+    for line in t2_ships:
+        type_id, _name = line.strip().split(", ")
+        ship_list.append(type_id)
+    for item in ship_list:
+        blueprint_details = get_blueprint_details(item)
+        t2_ships_blueprints.append(blueprint_details)
 
-t2_ships_blueprints = []
-ship_list = []
-with open("t2_ships.txt", "r", encoding="utf-8") as f:
-    t2_ships = f.readlines()
-for line in t2_ships:
-    type_id, name = line.strip().split(", ")
-    ship_list.append(type_id)
-for item in ship_list:
-    blueprint_details = get_blueprint_details(item)
-    t2_ships_blueprints.append(blueprint_details)
-#print(t2_ships_blueprints)
+    unique_material_ids = set()
+    # Aggregate unique material IDs
+    for ship in t2_ships_blueprints:
+        print(ship)
+        for material in ship['materials']:
+            material_id = material[0]  # material[0] is the materialTypeID
+            unique_material_ids.add(material_id)
+        print(f"Material list: {unique_material_ids}")
 
+    # Add the raw materials of the full build tree (components, reactions, invention)
+    bom_engine = BOMEngine(load_sde_index())
+    for expansion in bom_engine.expand_many(ship_list).values():
+        unique_material_ids.update(expansion.materials)
+    print(f"Material list including raw materials: {unique_material_ids}")
 
+    # Convert the set to a list (if needed)
+    unique_material_ids = list(unique_material_ids)
 
-unique_material_ids = set()
-# Aggregate unique material IDs
-for ship in t2_ships_blueprints:
-    print(ship)
-    for material in ship['materials']:
-        material_id = material[0]  # material[0] is the materialTypeID
-        unique_material_ids.add(material_id)
-    print(f"Material list: {unique_material_ids}")
+    with open("t2_materials.txt", "w", encoding="utf-8") as f:
+        for type_id in unique_material_ids:
+            f.write(f"{type_id},\n")
 
-# Convert the set to a list (if needed)
-unique_material_ids = list(unique_material_ids)
+    print(f"Saved {len(unique_material_ids)} materials to t2_materials.txt.")
 
-with open("t2_materials.txt", "w", encoding="utf-8") as f:
-    for type_id in unique_material_ids:
-        f.write(f"{type_id},\n")
 
-print(f"Saved {len(unique_material_ids)} materials to t2_materials.txt.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Module Docstring: This module expands products into their full bill of materials.
+
+A product is expanded recursively through manufacturing and reactions down to the
+materials that cannot be built, adding the expected invention materials for Tech II
+blueprints. Every sub-assembly is expanded once per BOMEngine and memoized, so a
+batch of products sharing components costs little more than a single one.
+
+Quantities are per unit of product and fractional: the per-run rounding of the
+game is ignored, which is what the requirement converges to for large batches.
+Only the floor of one unit per run for each material is kept.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+from sde_index import SDEIndex, MANUFACTURING, REACTION, INVENTION
+
+
+@dataclass(frozen=True)
+class BuildConfig:
+    """
+    Blueprint, structure and skill modifiers applied while expanding.
+
+    :param me: Material efficiency of researched blueprints (0-10).
+    :param te: Time efficiency of researched blueprints (0-20).
+    :param invented_me: Material efficiency of invented Tech II blueprint copies.
+    :param invented_te: Time efficiency of invented Tech II blueprint copies.
+    :param structure_me_bonus: Manufacturing material reduction of the structure and rigs.
+    :param structure_te_bonus: Manufacturing time reduction of the structure and rigs.
+    :param reaction_me_bonus: Reaction material reduction of the refinery rigs.
+    :param reaction_te_bonus: Reaction time reduction of the refinery and rigs.
+    :param invention_chance_bonus: Multiplier on the base invention chance from skills.
+    :param buy: Type IDs that are bought rather than built even if a blueprint exists.
+    """
+    me: int = 10
+    te: int = 20
+    invented_me: int = 2
+    invented_te: int = 4
+    structure_me_bonus: float = 0.0
+    structure_te_bonus: float = 0.0
+    reaction_me_bonus: float = 0.0
+    reaction_te_bonus: float = 0.0
+    invention_chance_bonus: float = 1.0
+    buy: frozenset = field(default_factory=frozenset)
+
+
+class Expansion(NamedTuple):
+    """The expanded requirements for one unit of a product."""
+    materials: dict
+    job_seconds: float
+
+
+class BOMEngine:
+    """
+    Memoizing bill-of-materials expander.
+
+    :param index: The SDEIndex to read blueprints from.
+    :param config: The BuildConfig to apply, defaults to BuildConfig().
+    """
+
+    def __init__(self, index: SDEIndex, config=None):
+        self.index = index
+        self.config = config or BuildConfig()
+        self._memo = {}
+
+    def expand(self, type_id):
+        """
+        Expand one unit of a product into raw materials.
+
+        :param type_id: The type ID of the product.
+        :return: An Expansion of raw material quantities and the total job time in seconds.
+        """
+        return self._expand(int(type_id), ())
+
+    def expand_many(self, type_ids):
+        """Expand one unit of each product, returning a dictionary of type ID to Expansion."""
+        return {int(type_id): self.expand(type_id) for type_id in type_ids}
+
+    def raw_materials(self, quantities):
+        """
+        Total the raw materials needed to build several products.
+
+        :param quantities: A dictionary of product type ID to the number of units to build.
+        :return: A dictionary of raw material type ID to quantity.
+        """
+        totals = defaultdict(float)
+        for type_id, quantity in quantities.items():
+            for material_id, per_unit in self.expand(type_id).materials.items():
+                totals[material_id] += per_unit * quantity
+        return dict(totals)
+
+    def invalidate(self, type_ids=None):
+        """Drop memoized expansions, all of them or those that involve any of `type_ids`."""
+        if type_ids is None:
+            self._memo.clear()
+            return
+        changed = {int(type_id) for type_id in type_ids}
+        self._memo = {
+            type_id: expansion for type_id, expansion in self._memo.items()
+            if type_id not in changed and changed.isdisjoint(expansion.materials)
+            and changed.isdisjoint(self._components(type_id))
+        }
+
+    def update_index(self, index, changed_type_ids):
+        """
+        Switch to an updated SDEIndex, keeping the expansions the update did not touch.
+
+        :param index: The updated SDEIndex.
+        :param changed_type_ids: The type IDs whose SDE data changed, as returned by
+                                 sde_import.import_sde.
+        """
+        # Build trees are checked under both indexes, as the update may add or remove components
+        self.invalidate(changed_type_ids)
+        self.index = index
+        self.invalidate(changed_type_ids)
+
+    def _components(self, type_id):
+        """Return every type that appears in the build tree of a product."""
+        seen = set()
+        stack = [type_id]
+        while stack:
+            current = stack.pop()
+            recipe = self._recipe(current)
+            if recipe is None:
+                continue
+            blueprint_id, activity_id, _ = recipe
+            seen.add(blueprint_id)
+            for material_id, _ in self.index.activity_materials(blueprint_id, activity_id):
+                if material_id not in seen:
+                    seen.add(material_id)
+                    stack.append(material_id)
+        return seen
+
+    def _recipe(self, type_id):
+        """Return (blueprint_id, activity_id, units per run) used to build a type, or None."""
+        if type_id in self.config.buy:
+            return None
+        for activity_id in (MANUFACTURING, REACTION):
+            blueprint_id = self.index.blueprint_for(type_id, activity_id)
+            if blueprint_id is not None:
+                units = dict(self.index.activity_products(blueprint_id, activity_id))[type_id]
+                return blueprint_id, activity_id, units
+        return None
+
+    def _modifiers(self, blueprint_id, activity_id):
+        """Return the (material, time) multipliers for running an activity on a blueprint."""
+        config = self.config
+        if activity_id == REACTION:
+            return 1 - config.reaction_me_bonus, 1 - config.reaction_te_bonus
+        if self.index.blueprint_for(blueprint_id, INVENTION) is not None:
+            me, te = config.invented_me, config.invented_te
+        else:
+            me, te = config.me, config.te
+        return ((1 - me / 100) * (1 - config.structure_me_bonus),
+                (1 - te / 100) * (1 - config.structure_te_bonus))
+
+    def _expand(self, type_id, path):
+        if type_id in self._memo:
+            return self._memo[type_id]
+        if type_id in path:
+            raise ValueError(f"Circular bill of materials through type_id {type_id}")
+        recipe = self._recipe(type_id)
+        if recipe is None:
+            return Expansion({type_id: 1.0}, 0.0)
+
+        blueprint_id, activity_id, units = recipe
+        material_factor, time_factor = self._modifiers(blueprint_id, activity_id)
+        materials = defaultdict(float)
+        job_seconds = (self.index.activity_time(blueprint_id, activity_id) or 0) \
+            * time_factor / units
+        path = path + (type_id,)
+        for material_id, quantity in self.index.activity_materials(blueprint_id, activity_id):
+            # A run never uses less than one of each material
+            per_unit = max(1.0, quantity * material_factor) / units
+            sub = self._expand(material_id, path)
+            for raw_id, raw_quantity in sub.materials.items():
+                materials[raw_id] += raw_quantity * per_unit
+            job_seconds += sub.job_seconds * per_unit
+
+        if activity_id == MANUFACTURING:
+            job_seconds += self._add_invention(blueprint_id, units, materials)
+
+        expansion = Expansion(dict(materials), job_seconds)
+        self._memo[type_id] = expansion
+        return expansion
+
+    def _add_invention(self, blueprint_id, units, materials):
+        """
+        Add the expected invention materials per unit for an invented blueprint.
+
+        :return: The expected invention time per unit in seconds.
+        """
+        source_id = self.index.blueprint_for(blueprint_id, INVENTION)
+        if source_id is None:
+            return 0.0
+        runs_per_copy = dict(self.index.activity_products(source_id, INVENTION))[blueprint_id]
+        chance = min(1.0, self.index.probability(source_id, INVENTION)
+                     * self.config.invention_chance_bonus)
+        attempts_per_unit = 1 / (chance * runs_per_copy * units)
+        for material_id, quantity in self.index.activity_materials(source_id, INVENTION):
+            materials[material_id] += quantity * attempts_per_unit
+        return (self.index.activity_time(source_id, INVENTION) or 0) * attempts_per_unit
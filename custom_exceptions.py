@@ -2,3 +2,21 @@
 
 class UnexpectedException(Exception):
     """Unexpected error occurred."""
+
+class ESIRequestException(Exception):
+    """The ESI API answered with an error status."""
+
+    def __init__(self, url, status, message=""):
+        super().__init__(f"ESI request to {url} failed with HTTP {status}: {message}")
+        self.url = url
+        self.status = status
+
+class SDEDownloadException(Exception):
+    """The SDE could not be downloaded or failed verification."""
+
+class DatabaseBusyException(Exception):
+    """A write to the database waited too long for the other writers."""
+
+    def __init__(self, database, waited):
+        super().__init__(f"Timed out after {waited:.0f} s waiting to write to {database}")
+        self.database = database
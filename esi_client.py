@@ -0,0 +1,230 @@
+"""
+Module Docstring: This module provides an asyncio client for the ESI API.
+
+All requests made through one ESIClient share a single aiohttp connection pool,
+are limited to a fixed number in flight, and pause when ESI reports that the
+error limit for the current window is nearly spent.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Mapping, NamedTuple
+
+import aiohttp
+
+from custom_exceptions import ESIRequestException
+from esi_payloads import loads
+from metrics import (ESI_ERRORS, ESI_REQUEST_SECONDS, ESI_RESPONSE_BYTES, ESI_RESPONSES,
+                     esi_endpoint)
+
+ESI_BASE_URL = "https://esi.evetech.net/latest"
+USER_AGENT = "eve-industry (https://github.com/munroalex/eve-industry)"
+
+# Maximum number of requests in flight at once
+DEFAULT_CONCURRENCY = 20
+# Pause all requests once fewer than this many errors remain in the window
+ERROR_LIMIT_THRESHOLD = 10
+# Number of retries for throttled (420), server (5xx) and network errors
+DEFAULT_RETRIES = 3
+
+
+class ESIResponse(NamedTuple):
+    """A decoded ESI response."""
+    status: int
+    headers: Mapping
+    data: object
+
+
+class FetchStats:
+    """
+    Counters describing a fetch run: ESI traffic and the progress of storing the results.
+
+    The counters are updated while the run is in progress, so another thread may read
+    them to report progress.
+    """
+
+    def __init__(self):
+        self.status_counts = Counter()
+        self.bytes_downloaded = 0
+        self.types_total = 0
+        self.types_done = 0
+        self.rows_written = 0
+        self.cache_hits = 0
+
+    def record(self, status, size):
+        """Count one ESI response and the size of its body."""
+        self.status_counts[status] += 1
+        self.bytes_downloaded += size
+
+    @property
+    def requests(self):
+        """Total number of ESI responses received."""
+        return sum(self.status_counts.values())
+
+    @property
+    def not_modified(self):
+        """Number of 304 responses, each one a payload that was neither downloaded nor stored."""
+        return self.status_counts[304]
+
+    def summary(self):
+        """Return the counters as a dictionary."""
+        return {
+            "requests": self.requests,
+            "ok": self.status_counts[200],
+            "not_modified": self.not_modified,
+            "errors": sum(count for status, count in self.status_counts.items() if status >= 400),
+            "bytes_downloaded": self.bytes_downloaded,
+            "types_total": self.types_total,
+            "types_done": self.types_done,
+            "rows_written": self.rows_written,
+            "cache_hits": self.cache_hits,
+        }
+
+
+class ESIClient:
+    """
+    Asynchronous ESI client with bounded concurrency and error-limit handling.
+
+    Use as an async context manager so the connection pool is closed afterwards:
+
+        async with ESIClient() as client:
+            response = await client.get("/markets/10000002/history/", {"type_id": 1201})
+
+    :param base_url: Root URL of the ESI API, override to point at a stub server.
+    :param concurrency: Maximum number of requests in flight.
+    :param timeout: Total timeout in seconds for a single request.
+    :param retries: Number of retries for throttled, server and network errors.
+    :param stats: FetchStats to count responses in, a new one is created if omitted.
+    """
+
+    def __init__(self, base_url=ESI_BASE_URL, concurrency=DEFAULT_CONCURRENCY,
+                 timeout=10, retries=DEFAULT_RETRIES, stats=None):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.stats = stats if stats is not None else FetchStats()
+        self._session = None
+        self._semaphore = None
+        self._paused_until = 0.0
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": USER_AGENT},
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    def _update_error_limit(self, headers):
+        """Pause new requests if the ESI error limit is close to exhausted."""
+        remain = headers.get("X-ESI-Error-Limit-Remain")
+        reset = headers.get("X-ESI-Error-Limit-Reset")
+        if remain is None or reset is None:
+            return
+        if int(remain) <= ERROR_LIMIT_THRESHOLD:
+            paused_until = time.monotonic() + int(reset)
+            if paused_until > self._paused_until:
+                logging.warning("ESI error limit low (%s remaining), pausing for %s seconds.",
+                                remain, reset)
+                self._paused_until = paused_until
+
+    async def _wait_for_error_limit(self):
+        """Sleep until the current error-limit pause has expired."""
+        delay = self._paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until - time.monotonic()
+
+    async def get(self, path, params=None, etag=None, decode=loads):
+        """
+        Perform a GET request against the ESI API.
+
+        :param path: Path relative to the base URL (e.g., "/markets/10000002/orders/").
+        :param params: Optional query parameters.
+        :param etag: ETag of the copy already stored, sent as If-None-Match.
+        :param decode: Function decoding the raw body, plain JSON decoding by default.
+        :return: An ESIResponse with the decoded body, or no data for a 304 response.
+        :raises ESIRequestException: If ESI answers with an error status.
+        """
+        url = f"{self.base_url}{path}"
+        endpoint = esi_endpoint(path)
+        request_headers = {"If-None-Match": etag} if etag else None
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                await self._wait_for_error_limit()
+                start = time.perf_counter()
+                try:
+                    async with self._session.get(url, params=params,
+                                                 headers=request_headers) as response:
+                        self._update_error_limit(response.headers)
+                        body = await response.read()
+                        status = response.status
+                        headers = response.headers.copy()
+                        self.stats.record(status, len(body))
+                    ESI_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+                    ESI_RESPONSES.inc(endpoint=endpoint, status=status)
+                    ESI_RESPONSE_BYTES.inc(len(body), endpoint=endpoint)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    ESI_ERRORS.inc(endpoint=endpoint)
+                    if attempt >= self.retries:
+                        raise
+                    logging.warning("Retrying %s after network error: %s", url, e)
+                    status = None
+
+            if status is None or status == 420 or status >= 500:
+                if attempt < self.retries:
+                    attempt += 1
+                    if status != 420:
+                        # A 420 already paused the client until the error window resets
+                        await asyncio.sleep(2 ** attempt)
+                    continue
+            if status >= 400:
+                raise ESIRequestException(url, status, body.decode("utf-8", "replace"))
+            if status == 304:
+                return ESIResponse(status, headers, None)
+            return ESIResponse(status, headers, decode(body) if body else None)
+
+    async def iter_pages(self, path, params=None, etags=None, first_page=1, pages=None,
+                         decode=loads):
+        """
+        Fetch every page of a paginated ESI endpoint.
+
+        The first page is requested alone to read the X-Pages header, the remaining pages
+        are then downloaded concurrently and yielded in completion order.
+
+        :param path: Path relative to the base URL.
+        :param params: Optional query parameters, "page" is added for each request.
+        :param etags: Optional mapping of page number to the ETag already stored.
+        :param first_page: The first page to fetch.
+        :param pages: The number of pages if already known, all pages are then fetched
+                      concurrently without waiting for the first one.
+        :param decode: Function decoding the raw body of each page.
+        :return: An async iterator of (page, ESIResponse) tuples.
+        """
+        params = dict(params or {})
+        etags = etags or {}
+
+        async def get_page(page):
+            return page, await self.get(path, {**params, "page": page}, etags.get(page), decode)
+
+        if pages is None:
+            first = await get_page(first_page)
+            yield first
+            pages = int(first[1].headers.get("X-Pages", 1))
+            first_page += 1
+        tasks = [asyncio.ensure_future(get_page(page)) for page in range(first_page, pages + 1)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,87 @@
+"""
+Module Docstring: This module decodes ESI response bodies on the ingest hot path.
+
+JSON is decoded with orjson when it is installed (pip install orjson) and with the
+standard library json module otherwise. Market order pages are turned straight into
+Order tuples holding only the fields we store, with the issued timestamp parsed once
+with datetime.fromisoformat, so nothing downstream touches the decoded dicts again.
+"""
+import json
+from datetime import date, datetime
+from operator import itemgetter
+from typing import NamedTuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Decode a JSON body given as bytes
+loads = orjson.loads if orjson is not None else json.loads
+
+
+class Order(NamedTuple):
+    """The fields of an ESI market order that are stored."""
+    order_id: int
+    type_id: int
+    price: float
+    volume_remain: int
+    volume_total: int
+    is_buy_order: bool
+    issued: datetime
+
+
+class OrderPage(NamedTuple):
+    """The wanted orders on a page of a region's order book and the IDs of all its orders."""
+    orders: list
+    order_ids: list
+
+
+_order_fields = itemgetter("order_id", "type_id", "price", "volume_remain", "volume_total",
+                           "is_buy_order")
+
+
+def parse_timestamp(value):
+    """Parse an ESI timestamp (e.g., "2025-01-01T12:00:00Z") into a naive UTC datetime."""
+    return datetime.fromisoformat(value[:-1] if value.endswith("Z") else value)
+
+
+def parse_date(value):
+    """Parse an ESI date (e.g., "2025-01-01")."""
+    return date.fromisoformat(value)
+
+
+def parse_orders(items, type_ids=None):
+    """
+    Convert decoded ESI market orders into Order tuples.
+
+    :param items: The orders as decoded from JSON.
+    :param type_ids: Optional set of type IDs to keep, the other orders are skipped.
+    :return: A list of Order tuples.
+    """
+    if type_ids is not None:
+        items = [item for item in items if item["type_id"] in type_ids]
+    return [Order(*_order_fields(item), parse_timestamp(item["issued"])) for item in items]
+
+
+def decode_orders(body, type_ids=None):
+    """
+    Decode an ESI market orders body into Order tuples.
+
+    :param body: The raw response body.
+    :param type_ids: Optional set of type IDs to keep, the other orders are skipped.
+    :return: A list of Order tuples.
+    """
+    return parse_orders(loads(body), type_ids)
+
+
+def decode_order_page(body, type_ids):
+    """
+    Decode a page of a region's order book, keeping only the orders of some types.
+
+    :param body: The raw response body.
+    :param type_ids: Set of type IDs to turn into Order tuples.
+    :return: An OrderPage, its order_ids cover every order on the page.
+    """
+    items = loads(body)
+    return OrderPage(parse_orders(items, type_ids), [item["order_id"] for item in items])
@@ -1,33 +1,19 @@
 import sqlite3
-import os
+
+from sde_import import SLIM_DB_FILE
+from sde_index import SDEIndex
+
 # Database file name
-DB_FILE = "sqlite-latest.sqlite"
+DB_FILE = SLIM_DB_FILE
 OUTPUT_FILE = "t2_ships.txt"
 
 def get_t2_ships():
     """Retrieves all type_ids and names of Tech 2 ships from the SDE."""
-    query = """
-    SELECT typeID, typeName 
-    FROM invTypes 
-    WHERE groupID IN (
-        SELECT groupID FROM invGroups WHERE categoryID = 6
-    )
-    AND typeID IN (
-        SELECT typeID FROM invMetaTypes WHERE metaGroupID = 2
-    );
-    """
-    
-    if not os.path.exists(DB_FILE):
+    try:
+        return SDEIndex.load(DB_FILE).t2_ships()
+    except sqlite3.Error:
         print("SDE database not found! Please ensure the SDE is downloaded and extracted.")
         return
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    ships = cursor.fetchall()
-    conn.close()
-    
-    return ships
 
 def save_t2_ships():
     """Fetches and saves the T2 ships to a file."""
@@ -2,251 +2,482 @@
 Module Docstring: This module fetches market data from the ESI API and stores it in a database.
 """
 # Imports
+import asyncio
 import logging
-from datetime import datetime, timedelta
-import os
-import pickle
+from datetime import datetime
+from functools import partial
 
-import requests
+import aiohttp
+from flask import current_app
 from sqlalchemy import func
 
-from custom_exceptions import UnexpectedException
+from custom_exceptions import UnexpectedException, ESIRequestException
+from app.database import bulk_upsert
 from app.models import db, MarketOrder, MarketHistory
+from history_archive import archived_through, archived_type_ids
+from esi_client import ESIClient, FetchStats, ESI_BASE_URL, DEFAULT_CONCURRENCY
+from esi_payloads import decode_order_page, decode_orders, parse_date
+from metrics import (FETCH_CACHE_HITS, FETCH_TYPES, ROWS_RECEIVED, ROWS_WRITTEN,
+                     STAGE_SECONDS)
+from order_book import prune_vanished_orders, refresh_order_book_summaries
+from order_snapshots import record_snapshots
+from fetch_state import FetchStateStore
+from signals import history_committed, orders_committed
 
-# Configure logging to write to a file
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("fetch_data.log"),
-        logging.StreamHandler()
-    ]
+# Region IDs of the main trade hubs
+TRADE_HUBS = {
+    "Jita": 10000002,     # The Forge
+    "Amarr": 10000043,    # Domain
+    "Dodixie": 10000032,  # Sinq Laison
+    "Rens": 10000030,     # Heimatar
+    "Hek": 10000042,      # Metropolis
+}
+DEFAULT_REGION_ID = TRADE_HUBS["Jita"]
+
+# Files listing the tracked type IDs, written by extract_t2_ships.py and blueprints.py
+T2_SHIPS_FILE = "t2_ships.txt"
+T2_MATERIALS_FILE = "t2_materials.txt"
+
+# Seconds fetched data stays fresh when ESI sends no Expires header
+ORDER_CACHE_TTL = 300
+HISTORY_CACHE_TTL = 86400
+
+# How market orders are fetched for each region:
+#   "type"   - one /markets/{region_id}/orders/?type_id= request per type ID
+#   "region" - every page of /markets/{region_id}/orders/, filtered to the tracked type IDs
+REGION_ORDER_FETCH_MODES: dict[int, str] = {}
+# Regions without an explicit mode use "region" once this many types are tracked
+REGION_SNAPSHOT_THRESHOLD = 200
+# FetchState type ID under which the pages of a region snapshot are tracked
+REGION_SNAPSHOT_TYPE_ID = 0
+
+# MarketOrder columns refreshed from ESI when an order already exists
+ORDER_UPSERT_COLUMNS = (
+    "type_id", "region_id", "price", "volume_remain", "volume_total", "is_buy_order", "issued",
 )
 
-# Cache to store the last fetch time for each region and type_id
-ORDER_CACHE_FILE = "order_fetch_cache.pkl"
-HISTORY_CACHE_FILE = "history_fetch_cache.pkl"
-
-def order_load_cache(ORDER_CACHE_FILE):
-    """Load the fetch cache from disk."""
-    if os.path.exists(ORDER_CACHE_FILE):
-        with open(ORDER_CACHE_FILE, "rb") as f:
-            return pickle.load(f)
-    return {}
-
-def order_save_cache(cache):
-    """Save the fetch cache to disk."""
-    with open(ORDER_CACHE_FILE, "wb") as f:
-        pickle.dump(cache, f)
-
-def history_load_cache(HISTORY_CACHE_FILE):
-    """Load the fetch cache from disk."""
-    if os.path.exists(HISTORY_CACHE_FILE):
-        with open(HISTORY_CACHE_FILE, "rb") as f:
-            return pickle.load(f)
-    return {}
-
-def history_save_cache(cache):
-    """Save the fetch cache to disk."""
-    with open(HISTORY_CACHE_FILE, "wb") as f:
-        pickle.dump(cache, f)
-
-
-
-def should_fetch_order(region_id, type_id, current_time):
-    """Check if we should fetch new data based on the last fetch time."""
-    fetch_cache = order_load_cache(ORDER_CACHE_FILE)
-    cache_key = (region_id, type_id)
-    if cache_key in fetch_cache:
-        last_fetch_time = fetch_cache[cache_key]
-        if (current_time - last_fetch_time).total_seconds() < 300:
-            logging.info("Skipping fetch for region_id:"
-                         " %s and type_id: %s due to cache.", region_id, type_id)
-            return False
-    return True
-
-def should_fetch_history(region_id, type_id, current_time):
-    """Check if we should fetch new data based on the last fetch time."""
-    fetch_cache = history_load_cache(HISTORY_CACHE_FILE)
-    cache_key = (region_id, type_id)
-    if cache_key in fetch_cache:
-        last_fetch_time = fetch_cache[cache_key]
-        if (current_time - last_fetch_time).total_seconds() < 86400:
-            logging.info("Skipping fetch for region_id:"
-                         " %s and type_id: %s due to cache.", region_id, type_id)
-            return False
-    return True
-
-def fetch_orders_from_api(region_id, type_id):
-    """Fetch market orders from the ESI API for a specific type ID in a region."""
-    url = f"https://esi.evetech.net/latest/markets/{region_id}/orders/"
+def load_tracked_type_ids(include_materials=True):
+    """
+    Read the tracked type IDs from the T2 ship and material lists.
+
+    :param include_materials: Also include the materials from T2_MATERIALS_FILE.
+    :return: A list of type IDs as strings, ships first.
+    """
+    id_list: list[str] = []
+    with open(T2_SHIPS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            type_id, _ = line.strip().split(", ")
+            id_list.append(type_id)
+    if include_materials:
+        with open(T2_MATERIALS_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                id_list.append(line.strip(",\n"))
+    return id_list
+
+async def fetch_orders_from_api(client, region_id, type_id, etags=None):
+    """
+    Fetch every page of the market orders of a specific type ID in a region.
+
+    ESI gives each page its own ETag, so every page is requested with its own and an
+    unchanged page says nothing about the others.
+
+    :param etags: Optional mapping of page number to the ETag already stored.
+    :return: A list of (page, ESIResponse) tuples in page order.
+    """
     params = {
         "type_id": type_id,
         "order_type": "all",
     }
-    response = requests.get(url, params=params, timeout=10)
-    response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
-    return response.json()
-
-def process_orders(region_id, orders):
-    """Process the fetched orders and store them in the database."""
-    new_orders = []
-    for order in orders:
+    pages = [page async for page in client.iter_pages(f"/markets/{region_id}/orders/", params,
+                                                      etags, decode=decode_orders)]
+    return sorted(pages, key=lambda page: page[0])
+
+def page_etags(fetch_state, type_id):
+    """
+    Return the ETags of the pages of a type ID whose order IDs are recorded.
+
+    Only these pages may answer 304, since the orders on an unchanged page must still
+    count as seen when the orders that vanished from the book are pruned.
+    """
+    return {page: etag for page, etag in fetch_state.etags(type_id).items()
+            if fetch_state.order_ids(type_id, page) is not None}
+
+async def fetch_region_orders_from_api(client, region_id, type_ids, etags=None):
+    """
+    Fetch every page of a region's order book, keeping only orders for the given type IDs.
+
+    Pages are downloaded concurrently and each one is filtered while it is decoded, so
+    orders for untracked types are never turned into Order tuples.
+
+    :param etags: Optional mapping of page number to the ETag already stored.
+    :return: An async iterator yielding (page, response, OrderPage) for each page, the
+             OrderPage is None for pages that have not been modified.
+    """
+    wanted = {int(type_id) for type_id in type_ids}
+    params = {"order_type": "all"}
+    decode = partial(decode_order_page, type_ids=wanted)
+    async for page, response in client.iter_pages(f"/markets/{region_id}/orders/", params,
+                                                  etags, decode=decode):
+        yield page, response, None if response.status == 304 else response.data
+
+def order_fetch_mode(region_id, type_count):
+    """Return the order fetch mode ("type" or "region") to use for a region."""
+    if region_id in REGION_ORDER_FETCH_MODES:
+        return REGION_ORDER_FETCH_MODES[region_id]
+    return "region" if type_count >= REGION_SNAPSHOT_THRESHOLD else "type"
+
+async def fetch_history_from_api(client, region_id, type_id, etag=None):
+    """Fetch historical market data from the ESI API for a specific type ID in a region."""
+    return await client.get(f"/markets/{region_id}/history/", {"type_id": type_id}, etag)
+
+async def _fetch_each(client, fetch, region_id, type_ids, etag):
+    """
+    Run `fetch` for every type ID concurrently, sending what `etag` returns for each type.
+
+    Yields (type_id, response, error) tuples in completion order so callers can store
+    results while the remaining requests are still in flight.
+    """
+    async def fetch_one(type_id):
         try:
-            # Check if the order already exists in the database
-            existing_order = MarketOrder.query.filter_by(order_id=order['order_id']).first()
-            if not existing_order:
-                new_order = MarketOrder(
-                    order_id=order['order_id'],
-                    type_id=order['type_id'],
-                    region_id=region_id,
-                    price=order['price'],
-                    volume_remain=order['volume_remain'],
-                    volume_total=order['volume_total'],
-                    is_buy_order=order['is_buy_order'],
-                    issued=datetime.strptime(order['issued'], '%Y-%m-%dT%H:%M:%SZ'),
-                )
-                new_orders.append(new_order)
-            else:
-                # Update the existing order if any data has changed
-                updated = False
-                if existing_order.price != order['price']:
-                    existing_order.price = order['price']
-                    updated = True
-                if existing_order.volume_remain != order['volume_remain']:
-                    existing_order.volume_remain = order['volume_remain']
-                    updated = True
-                if existing_order.volume_total != order['volume_total']:
-                    existing_order.volume_total = order['volume_total']
-                    updated = True
-                if existing_order.is_buy_order != order['is_buy_order']:
-                    existing_order.is_buy_order = order['is_buy_order']
-                    updated = True
-                if existing_order.issued != datetime.strptime(
-                    order['issued'], '%Y-%m-%dT%H:%M:%SZ'
-                    ):
-                    existing_order.issued = datetime.strptime(order['issued'], '%Y-%m-%dT%H:%M:%SZ')
-                    updated = True
-                if updated:
-                    db.session.add(existing_order)
-        except UnexpectedException as e:
-            logging.error("Error processing order %s: %s", order['order_id'], e)
-    if new_orders:
-        db.session.bulk_save_objects(new_orders)
+            return type_id, await fetch(client, region_id, type_id, etag(type_id)), None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ESIRequestException) as e:
+            return type_id, None, e
+
+    for future in asyncio.as_completed([fetch_one(type_id) for type_id in type_ids]):
+        yield await future
+        client.stats.types_done += 1
+
+def _run_fetch(store, region_id, type_ids, fetch_state, base_url, concurrency, stats):
+    """
+    Run an async store coroutine over a fresh ESI client and flush the fetch state afterwards.
+
+    :return: The FetchStats of the run.
+    """
+    async def run():
+        async with ESIClient(base_url=base_url, concurrency=concurrency, stats=stats) as client:
+            await store(client, region_id, type_ids, fetch_state)
+
+    try:
+        asyncio.run(run())
+    finally:
+        fetch_state.flush()
+    logging.info("ESI %s fetch for region_id %s: %s", fetch_state.endpoint, region_id,
+                 stats.summary())
+    return stats
+
+def process_orders(region_id, orders, snapshot_type_ids=None, seen_order_ids=None):
+    """
+    Process the fetched orders and store them in the database.
+
+    The order book summaries of every type touched are refreshed in the same transaction.
+
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :param orders: The orders returned by ESI, as Order tuples.
+    :param snapshot_type_ids: Type IDs for which `orders` is the complete order book,
+                              their stored orders missing from it are deleted and
+                              their book is recorded in the snapshot history.
+    :param seen_order_ids: The order IDs of the complete order book, defaults to those of
+                           `orders`; needed when unchanged pages were not downloaded.
+    """
+    upsert_orders(region_id, orders)
+    touched = {order.type_id for order in orders}
+    if snapshot_type_ids is not None:
+        touched.update(int(type_id) for type_id in snapshot_type_ids)
+        if seen_order_ids is None:
+            seen_order_ids = {order.order_id for order in orders}
+        prune_vanished_orders(region_id, snapshot_type_ids, seen_order_ids)
+        record_snapshots(region_id, snapshot_type_ids)
+    refresh_order_book_summaries(region_id, touched)
     db.session.commit()
+    notify_committed(orders_committed, region_id, touched)
+
+def notify_committed(signal, region_id, type_ids):
+    """Send `signal` for the types of a region whose data was just committed."""
+    signal.send(current_app._get_current_object(),  # pylint: disable=protected-access
+                region_id=int(region_id), type_ids=sorted({int(type_id) for type_id in type_ids}))
+
+@STAGE_SECONDS.time(stage="upsert")
+def upsert_orders(region_id, orders):
+    """
+    Upsert orders on order_id in a single statement, the caller commits.
+
+    Existing rows are only rewritten when one of their fields has changed.
+
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :param orders: Order tuples, as decoded by esi_payloads.decode_orders.
+    """
+    rows = order_rows(region_id, orders, datetime.utcnow())
+    if rows:
+        table = MarketOrder.__table__
+        result = bulk_upsert(table, rows, ["order_id"],
+                             update_columns=ORDER_UPSERT_COLUMNS + ("last_updated",),
+                             changed_columns=ORDER_UPSERT_COLUMNS)
+        ROWS_RECEIVED.inc(len(rows), table=table.name)
+        ROWS_WRITTEN.inc(max(result.rowcount, 0), table=table.name)
+
+def order_rows(region_id, orders, now):
+    """Build the MarketOrder insert parameters of Order tuples fetched at `now`."""
+    return [
+        {
+            "order_id": order_id,
+            "type_id": type_id,
+            "region_id": region_id,
+            "price": price,
+            "volume_remain": volume_remain,
+            "volume_total": volume_total,
+            "is_buy_order": is_buy_order,
+            "issued": issued,
+            "last_updated": now,
+        }
+        for (order_id, type_id, price, volume_remain, volume_total, is_buy_order,
+             issued) in orders
+    ]
 
-def fetch_market_orders(region_id, type_ids):
+def fetch_market_orders(region_id, type_ids, mode=None, base_url=ESI_BASE_URL,
+                        concurrency=DEFAULT_CONCURRENCY, stats=None):
     """
     Fetch market orders for a list of type IDs in a specific region and store them in the database.
 
+    Requests are issued concurrently; orders are stored as each response arrives.
+
     :param region_id: The region ID (e.g., 10000002 for Jita).
     :param type_ids: A list of type IDs (e.g., [1201, 1202] for Kestrel and Condor).
+    :param mode: "type" or "region", defaults to the mode configured for the region,
+                 chosen from all of `type_ids` so that it does not change with how many
+                 of them are due.
+    :param base_url: Root URL of the ESI API.
+    :param concurrency: Maximum number of ESI requests in flight.
+    :param stats: FetchStats to report progress in, a new one is created if omitted.
+    :return: The FetchStats of the run.
+    """
+    stats = stats if stats is not None else FetchStats()
+    if mode is None:
+        mode = order_fetch_mode(region_id, len(type_ids))
+    fetch_state = FetchStateStore("orders", region_id, ORDER_CACHE_TTL)
+    pending = _stale_type_ids(fetch_state, region_id, type_ids, stats)
+    if not pending:
+        return stats
+    store = _store_region_orders if mode == "region" else _store_market_orders
+    return _run_fetch(store, region_id, pending, fetch_state, base_url, concurrency, stats)
+
+def _stale_type_ids(fetch_state, region_id, type_ids, stats):
+    """Return the type IDs whose stored data has expired, counting the others as cache hits."""
+    now = datetime.utcnow()
+    pending = [type_id for type_id in type_ids if not fetch_state.is_fresh(type_id, now)]
+    skipped = len(type_ids) - len(pending)
+    stats.types_total += len(type_ids)
+    stats.types_done += skipped
+    stats.cache_hits += skipped
+    FETCH_TYPES.inc(len(type_ids), endpoint=fetch_state.endpoint)
+    FETCH_CACHE_HITS.inc(skipped, endpoint=fetch_state.endpoint)
+    if skipped:
+        logging.info("Skipping %s %s fetches for region_id: %s due to cache.",
+                     skipped, fetch_state.endpoint, region_id)
+    return pending
+
+async def _store_region_orders(client, region_id, type_ids, fetch_state):
+    """
+    Fetch the region's whole order book and store the orders of the given types.
+
+    The ETag and the IDs of all orders on every page are kept under
+    REGION_SNAPSHOT_TYPE_ID, whichever types were fetched. Pages ESI reports as
+    unchanged are skipped, their recorded order IDs count as seen, so the orders that
+    vanished from the book are pruned on every run.
     """
-    fetch_cache = order_load_cache(ORDER_CACHE_FILE)
-    current_time = datetime.now()
+    stored = 0
+    headers = None
+    seen_order_ids = set()
+    # A newly tracked type may have orders on pages that have not changed since
+    if all(fetch_state.known(type_id) for type_id in type_ids):
+        etags = page_etags(fetch_state, REGION_SNAPSHOT_TYPE_ID)
+    else:
+        etags = None
+    try:
+        async for page, response, order_page in fetch_region_orders_from_api(
+                client, region_id, type_ids, etags):
+            headers = headers or response.headers
+            if order_page is None:
+                page_order_ids = None
+                seen_order_ids.update(fetch_state.order_ids(REGION_SNAPSHOT_TYPE_ID, page))
+            else:
+                orders = order_page.orders
+                upsert_orders(region_id, orders)
+                db.session.commit()
+                notify_committed(orders_committed, region_id,
+                                 {order.type_id for order in orders})
+                page_order_ids = order_page.order_ids
+                seen_order_ids.update(page_order_ids)
+                stored += len(orders)
+                client.stats.rows_written += len(orders)
+            fetch_state.record(REGION_SNAPSHOT_TYPE_ID, response.headers, page=page,
+                               order_ids=page_order_ids)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ESIRequestException) as e:
+        logging.error("Error fetching market orders for region_id %s: %s", region_id, e)
+        return
+    pruned = prune_vanished_orders(region_id, type_ids, seen_order_ids)
+    logging.info("Pruned %s vanished orders in region_id: %s.", pruned, region_id)
+    record_snapshots(region_id, type_ids)
+    refresh_order_book_summaries(region_id, type_ids)
+    db.session.commit()
+    notify_committed(orders_committed, region_id, type_ids)
+    client.stats.types_done += len(type_ids)
     for type_id in type_ids:
-        if not should_fetch_order(region_id, type_id, current_time):
-            continue
+        fetch_state.record(type_id, {"Expires": headers.get("Expires")})
+    logging.info("Fetched and stored %s orders for %s type_ids in region_id: %s.",
+                 stored, len(type_ids), region_id)
+
+async def _store_market_orders(client, region_id, type_ids, fetch_state):
+    """
+    Fetch orders concurrently and store each type's orders as they arrive.
 
+    The ETag and order IDs of every page are kept, a book is only left alone when every
+    one of its pages is unchanged.
+    """
+    async for type_id, pages, error in _fetch_each(client, fetch_orders_from_api, region_id,
+                                                    type_ids, partial(page_etags, fetch_state)):
+        if error is not None:
+            logging.error("Error fetching market orders for type_id %s: %s", type_id, error)
+            continue
+        changed = {page: response.data for page, response in pages if response.status != 304}
+        if not changed:
+            for page, response in pages:
+                fetch_state.record(type_id, response.headers, page=page)
+            continue
         try:
-            orders = fetch_orders_from_api(region_id, type_id)
-            process_orders(region_id, orders)
-            fetch_cache[(region_id, type_id)] = current_time
-            order_save_cache(fetch_cache)
+            orders = [order for page_orders in changed.values() for order in page_orders]
+            seen_order_ids = {order.order_id for order in orders}
+            for page, _ in pages:
+                if page not in changed:
+                    seen_order_ids.update(fetch_state.order_ids(type_id, page))
+            process_orders(region_id, orders, snapshot_type_ids=[type_id],
+                           seen_order_ids=seen_order_ids)
+            for page, response in pages:
+                fetch_state.record(type_id, response.headers, page=page,
+                                   order_ids=[order.order_id for order in changed[page]]
+                                   if page in changed else None)
+            client.stats.rows_written += len(orders)
             logging.info("Fetched and stored %s orders for type_id: %s in region_id: %s.",
                          len(orders), type_id, region_id)
-        except requests.exceptions.RequestException as e:
-            logging.error("Error fetching market orders for type_id %s: %s", type_id, e)
         except UnexpectedException as e:
             logging.error("Unexpected error: %s", e)
 
-def fetch_market_history(region_id, type_ids):
+def fetch_market_history(region_id, type_ids, base_url=ESI_BASE_URL,
+                         concurrency=DEFAULT_CONCURRENCY, stats=None):
     """
     Fetch historical market data for a list of type IDs in a specific region,
     store it in the database.
 
     :param region_id: The region ID (e.g., 10000002 for Jita).
     :param type_ids: A list of type IDs (e.g., [1201, 1202] for Kestrel and Condor).
+    :param base_url: Root URL of the ESI API.
+    :param concurrency: Maximum number of ESI requests in flight.
+    :param stats: FetchStats to report progress in, a new one is created if omitted.
+    :return: The FetchStats of the run.
     """
-    fetch_cache = history_load_cache(HISTORY_CACHE_FILE)
-    current_time = datetime.now()
-    for type_id in type_ids:
-        if not should_fetch_history(region_id, type_id, current_time):
+    stats = stats if stats is not None else FetchStats()
+    fetch_state = FetchStateStore("history", region_id, HISTORY_CACHE_TTL)
+    pending = _stale_type_ids(fetch_state, region_id, type_ids, stats)
+    if not pending:
+        return stats
+    return _run_fetch(_store_market_history, region_id, pending, fetch_state, base_url,
+                      concurrency, stats)
+
+async def _store_market_history(client, region_id, type_ids, fetch_state):
+    """Fetch history concurrently and store each type's history as it arrives."""
+    latest_dates = latest_history_dates(region_id, type_ids)
+    async for type_id, response, error in _fetch_each(client, fetch_history_from_api, region_id,
+                                                       type_ids, fetch_state.etag):
+        if error is not None:
+            logging.error("Error fetching historical data for type_id %s: %s", type_id, error)
+            continue
+        if response.status == 304:
+            fetch_state.record(type_id, response.headers)
             continue
         try:
-            # Fetch historical data from the ESI API
-            url = f"https://esi.evetech.net/latest/markets/{region_id}/history/"
-            params = {
-                "type_id": type_id,
-            }
-            response = requests.get(url, params=params, timeout=10)
-
-            if response.status_code == 200:
-                history_data = response.json()
-                for entry in history_data:
-                    # Parse the date
-                    date = datetime.strptime(entry['date'], '%Y-%m-%d').date()
-
-                    # Check if the entry already exists in the database
-                    existing_entry = MarketHistory.query.filter_by(
-                        type_id=type_id,
-                        region_id=region_id,
-                        date=date,
-                    ).first()
-                    if not existing_entry:
-                        # Create a new MarketHistory object
-                        new_entry = MarketHistory(
-                            type_id=type_id,
-                            region_id=region_id,
-                            date=date,
-                            volume=entry['volume'],
-                            average_price=entry['average'],
-                        )
-                        db.session.add(new_entry)
-                db.session.commit()
-                fetch_cache[(region_id, type_id)] = current_time
-                history_save_cache(fetch_cache)
-
-                logging.info("Fetched and stored historical data for type_id: %s in region_id: %s.",
-                             type_id, region_id)
-            else:
-                logging.error("Error fetching historical data for type_id %s: %s - %s",
-                              type_id, response.status_code, response.text)
+            inserted = ingest_history(region_id, type_id, response.data,
+                                      latest_dates.get(int(type_id)))
+            fetch_state.record(type_id, response.headers)
+            client.stats.rows_written += inserted
 
+            logging.info("Fetched and stored %s new days of historical data for type_id: %s"
+                         " in region_id: %s.", inserted, type_id, region_id)
         except UnexpectedException as e:
             logging.error("An error occurred while processing type_id %s: %s", type_id, e)
 
-def calculate_daily_sales_volumes(type_id, region_id):
+def latest_history_dates(region_id, type_ids):
     """
-    Calculate the last 30 and 60-day daily sales volumes for a specific type ID in a region.
+    Find the newest stored history date for each type ID in a region with a single query.
+
+    Days up to the archive cutoff of the region count as stored for the types with
+    archived history. Other types get their whole history, the next archive run moves
+    their old days to the archive.
 
-    :param type_id: The type ID (e.g., 1201 for Kestrel).
     :param region_id: The region ID (e.g., 10000002 for Jita).
-    :return: A dictionary with the 30-day and 60-day average daily volumes.
+    :param type_ids: A list of type IDs.
+    :return: A dictionary of type ID to its latest stored date, types without history are omitted.
     """
-    # Get the current date
-    today = datetime.now()
+    rows = db.session.query(MarketHistory.type_id, func.max(MarketHistory.date)).filter(
+        MarketHistory.region_id == region_id,
+        MarketHistory.type_id.in_([int(type_id) for type_id in type_ids]),
+    ).group_by(MarketHistory.type_id).all()
+    latest = dict(rows)
+    archived = archived_through([region_id]).get(int(region_id))
+    if archived is not None:
+        unstored = [int(type_id) for type_id in type_ids if int(type_id) not in latest]
+        for type_id in archived_type_ids(region_id, unstored):
+            latest[type_id] = archived
+    return latest
 
-    # Calculate the start dates for the last 30 and 60 days
-    start_date_30 = today - timedelta(days=30)
-    start_date_60 = today - timedelta(days=60)
+@STAGE_SECONDS.time(stage="ingest_history")
+def ingest_history(region_id, type_id, history_data, latest_date=None):
+    """
+    Insert the history entries newer than `latest_date` in one statement.
 
-    # Query the database for the last 30 and 60 days
-    volumes_30 = db.session.query(func.sum(MarketHistory.volume)).filter(
-        MarketHistory.type_id == type_id,
-        MarketHistory.region_id == region_id,
-        MarketHistory.date >= start_date_30,
-    ).scalar() or 0
+    Rows that already exist are skipped by the unique (type_id, region_id, date) index.
 
-    volumes_60 = db.session.query(func.sum(MarketHistory.volume)).filter(
-        MarketHistory.type_id == type_id,
-        MarketHistory.region_id == region_id,
-        MarketHistory.date >= start_date_60,
-    ).scalar() or 0
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :param type_id: The type ID the history belongs to.
+    :param history_data: The history entries returned by ESI.
+    :param latest_date: The newest date already stored, or None to insert everything.
+    :return: The number of entries submitted for insertion.
+    """
+    rows = []
+    for entry in history_data:
+        date = parse_date(entry['date'])
+        if latest_date is not None and date <= latest_date:
+            continue
+        rows.append({
+            "type_id": int(type_id),
+            "region_id": region_id,
+            "date": date,
+            "volume": entry['volume'],
+            "average_price": entry['average'],
+        })
+    if rows:
+        table = MarketHistory.__table__
+        result = bulk_upsert(table, rows, ["type_id", "region_id", "date"])
+        ROWS_RECEIVED.inc(len(rows), table=table.name)
+        ROWS_WRITTEN.inc(max(result.rowcount, 0), table=table.name)
+    db.session.commit()
+    if rows:
+        notify_committed(history_committed, region_id, [type_id])
+    return len(rows)
+
+def calculate_daily_sales_volumes(type_id, region_id):
+    """
+    Calculate the last 30 and 60-day daily sales volumes for a specific type ID in a region.
+
+    For many types use analytics.market_history_stats, which computes them in one pass.
 
-    # Calculate average daily volumes
-    avg_daily_volume_30 = volumes_30 / 30
-    avg_daily_volume_60 = volumes_60 / 60
+    :param type_id: The type ID (e.g., 1201 for Kestrel).
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :return: A dictionary with the 30-day and 60-day average daily volumes.
+    """
+    from analytics import market_history_stats  # pylint: disable=import-outside-toplevel
+    stats = market_history_stats([type_id], [region_id], windows=(30, 60))
+    row = stats.loc[(int(region_id), int(type_id))]
+    avg_daily_volume_30 = row["avg_volume_30"]
+    avg_daily_volume_60 = row["avg_volume_60"]
 
     logging.info("Average daily volume for type_id %s"
                  " in region_id %s (last 30 days): %s",
@@ -254,11 +485,17 @@ def calculate_daily_sales_volumes(type_id, region_id):
     logging.info("Average daily volume for type_id %s"
           " in region_id %s (last 60 days): %s",
             type_id, region_id, avg_daily_volume_60)
-    return None
+    return {
+        "avg_daily_volume_30": avg_daily_volume_30,
+        "avg_daily_volume_60": avg_daily_volume_60,
+    }
 
 if __name__ == "__main__":
-    fetch_market_orders(region_id=10000002, type_ids=[1201, 1202])
-    fetch_market_history(region_id=10000002, type_ids=[1201, 1202])
-    calculate_daily_sales_volumes(type_id=1201, region_id=10000002)
-    calculate_daily_sales_volumes(type_id=1202, region_id=10000002)
-    logging.info("Data fetch and processing complete.")
\ No newline at end of file
+    from app import create_app  # pylint: disable=import-outside-toplevel
+
+    with create_app().app_context():
+        fetch_market_orders(region_id=10000002, type_ids=[1201, 1202])
+        fetch_market_history(region_id=10000002, type_ids=[1201, 1202])
+        calculate_daily_sales_volumes(type_id=1201, region_id=10000002)
+        calculate_daily_sales_volumes(type_id=1202, region_id=10000002)
+        logging.info("Data fetch and processing complete.")
\ No newline at end of file
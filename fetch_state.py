@@ -0,0 +1,142 @@
+"""
+Module Docstring: This module tracks when ESI data was last fetched and when it expires.
+
+A FetchStateStore loads the state of one endpoint and region in a single query,
+answers freshness checks from memory and writes new state back in batched,
+transactional upserts, so several worker processes can share the same table.
+
+For order books the order IDs of every downloaded page are kept next to its ETag, so
+the orders on a page ESI reports as unchanged still count as seen when the orders
+that vanished from the book are pruned.
+"""
+from array import array
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+from app.database import dialect_insert
+from app.models import db, FetchState
+
+# Number of recorded fetches kept in memory before they are written to the database
+FLUSH_EVERY = 100
+
+
+def parse_expires(value):
+    """Parse an HTTP Expires header into a naive UTC datetime, or None if it is invalid."""
+    if not value:
+        return None
+    try:
+        expires = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if expires.tzinfo is not None:
+        expires = expires.astimezone(timezone.utc).replace(tzinfo=None)
+    return expires
+
+
+def pack_ids(ids):
+    """Pack IDs into bytes for the order_ids column."""
+    return array("q", sorted(ids)).tobytes()
+
+
+def unpack_ids(packed):
+    """Unpack the IDs packed by pack_ids into a set."""
+    ids = array("q")
+    ids.frombytes(packed)
+    return set(ids)
+
+
+class FetchStateStore:
+    """
+    In-memory view of the FetchState rows for one endpoint and region.
+
+    :param endpoint: Name of the ESI endpoint (e.g., "orders" or "history").
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :param default_ttl: Seconds a fetch stays fresh when ESI sends no Expires header.
+    """
+
+    def __init__(self, endpoint, region_id, default_ttl):
+        self.endpoint = endpoint
+        self.region_id = region_id
+        self.default_ttl = default_ttl
+        self._states = {
+            (state.type_id, state.page): (state.expires, state.etag, state.order_ids)
+            for state in FetchState.query.filter_by(endpoint=endpoint, region_id=region_id)
+        }
+        self._pending = {}
+
+    def is_fresh(self, type_id, now=None, page=1):
+        """Check whether the stored data for a type ID has not expired yet."""
+        state = self._states.get((int(type_id), page))
+        if state is None:
+            return False
+        return (now or datetime.utcnow()) < state[0]
+
+    def known(self, type_id, page=1):
+        """Check whether a fetch of a type ID has ever been recorded."""
+        return (int(type_id), page) in self._states
+
+    def etag(self, type_id, page=1):
+        """Return the ETag recorded for a type ID, or None."""
+        state = self._states.get((int(type_id), page))
+        return state[1] if state else None
+
+    def etags(self, type_id):
+        """Return a mapping of page number to the ETag recorded for each page of a type ID."""
+        return {page: state[1] for (state_type_id, page), state in self._states.items()
+                if state_type_id == int(type_id) and state[1]}
+
+    def order_ids(self, type_id, page=1):
+        """Return the set of order IDs recorded for a page of a type ID, or None."""
+        state = self._states.get((int(type_id), page))
+        return unpack_ids(state[2]) if state and state[2] is not None else None
+
+    def record(self, type_id, headers=None, now=None, page=1, order_ids=None):
+        """
+        Record a successful fetch for a type ID from the response headers.
+
+        :param type_id: The type ID that was fetched.
+        :param headers: The ESI response headers, used for Expires and ETag. A response
+                        without an ETag (such as a 304) keeps the previously recorded one.
+        :param now: The time of the fetch, defaults to the current UTC time.
+        :param page: The page that was fetched.
+        :param order_ids: The order IDs on the page, None keeps the previously recorded ones.
+        """
+        now = now or datetime.utcnow()
+        headers = headers or {}
+        expires = parse_expires(headers.get("Expires"))
+        if expires is None:
+            expires = now + timedelta(seconds=self.default_ttl)
+        key = (int(type_id), page)
+        etag = headers.get("ETag") or self.etag(type_id, page)
+        if order_ids is not None:
+            packed = pack_ids(order_ids)
+        else:
+            packed = self._states[key][2] if key in self._states else None
+        self._states[key] = (expires, etag, packed)
+        self._pending[key] = {
+            "endpoint": self.endpoint,
+            "region_id": self.region_id,
+            "type_id": key[0],
+            "page": page,
+            "expires": expires,
+            "etag": etag,
+            "order_ids": packed,
+            "last_fetched": now,
+        }
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """Write all recorded fetches to the database in one transaction."""
+        if not self._pending:
+            return
+        table = FetchState.__table__
+        stmt = dialect_insert()(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.endpoint, table.c.region_id, table.c.type_id, table.c.page],
+            set_={column: stmt.excluded[column]
+                  for column in ("expires", "etag", "order_ids", "last_fetched")},
+        )
+        db.session.execute(stmt, list(self._pending.values()))
+        db.session.commit()
+        self._pending.clear()
@@ -0,0 +1,242 @@
+"""
+Module Docstring: This module moves old market history out of the database into Parquet files.
+
+History older than ARCHIVE_AFTER_DAYS is compacted into one Parquet file per region
+and month, laid out as hive partitions:
+
+    history_archive/region_id=10000002/month=2024-01/history.parquet
+
+Reads only open the partitions they need and skip row groups by type and date from
+the Parquet statistics. The HistoryArchive table records the last archived day of
+each region, so readers know when the archive has to be consulted at all and
+ingestion does not store archived days again.
+
+    python history_archive.py --days 365 --vacuum
+"""
+import argparse
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, select
+
+from app import create_app
+from app.database import dialect_insert
+from app.models import db, HistoryArchive, MarketHistory
+
+ARCHIVE_DIR = "history_archive"
+ARCHIVE_FILE = "history.parquet"
+# History older than this many days is moved to the archive
+ARCHIVE_AFTER_DAYS = 365
+# Rows per Parquet row group, the unit skipped by type and date statistics
+ROW_GROUP_SIZE = 64 * 1024
+COLUMNS = ["region_id", "type_id", "date", "volume", "average_price"]
+
+
+def _file_schema():
+    """Return the Arrow schema of an archive file, the partition columns are in its path."""
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    return pa.schema([
+        ("type_id", pa.int32()),
+        ("date", pa.date32()),
+        ("volume", pa.int64()),
+        ("average_price", pa.float64()),
+    ])
+
+
+def _partitioning():
+    """Return the hive partitioning of the archive directory."""
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.dataset as ds  # pylint: disable=import-outside-toplevel
+    return ds.partitioning(pa.schema([("region_id", pa.int32()), ("month", pa.string())]),
+                           flavor="hive")
+
+
+def archived_through(region_ids):
+    """
+    Return the last archived date of each region.
+
+    :param region_ids: A list of region IDs.
+    :return: A dictionary of region ID to date, regions without an archive are omitted.
+    """
+    rows = db.session.query(HistoryArchive.region_id, HistoryArchive.archived_through).filter(
+        HistoryArchive.region_id.in_([int(region_id) for region_id in region_ids]),
+    ).all()
+    return dict(rows)
+
+
+def archived_type_ids(region_id, type_ids, archive_dir=ARCHIVE_DIR):
+    """
+    Return which of several types have archived history in a region.
+
+    Only the type_id column of the region's partitions is read.
+
+    :param region_id: The region ID.
+    :param type_ids: A list of type IDs.
+    :param archive_dir: The archive directory.
+    :return: A set of type IDs.
+    """
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.compute as pc  # pylint: disable=import-outside-toplevel
+    import pyarrow.dataset as ds  # pylint: disable=import-outside-toplevel
+
+    if not type_ids or not os.path.isdir(archive_dir):
+        return set()
+    dataset = ds.dataset(archive_dir, format="parquet", partitioning=_partitioning())
+    predicate = (
+        (ds.field("region_id") == pa.scalar(int(region_id), pa.int32()))
+        & ds.field("type_id").isin(pa.array([int(t) for t in type_ids], pa.int32()))
+    )
+    table = dataset.to_table(columns=["type_id"], filter=predicate)
+    return set(pc.unique(table["type_id"]).to_pylist())
+
+
+def read_archive(type_ids, region_ids, start_date, archive_dir=ARCHIVE_DIR):
+    """
+    Read archived history of several types and regions from `start_date` onwards.
+
+    :param type_ids: A list of type IDs.
+    :param region_ids: A list of region IDs.
+    :param start_date: The first date to read.
+    :param archive_dir: The archive directory.
+    :return: A DataFrame with the same columns as analytics.load_history.
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.dataset as ds  # pylint: disable=import-outside-toplevel
+
+    if os.path.isdir(archive_dir):
+        dataset = ds.dataset(archive_dir, format="parquet", partitioning=_partitioning())
+        predicate = (
+            ds.field("region_id").isin(pa.array([int(r) for r in region_ids], pa.int32()))
+            & (ds.field("month") >= f"{start_date:%Y-%m}")
+            & ds.field("type_id").isin(pa.array([int(t) for t in type_ids], pa.int32()))
+            & (ds.field("date") >= pa.scalar(start_date, pa.date32()))
+        )
+        table = dataset.to_table(columns=COLUMNS, filter=predicate)
+    else:
+        schema = _file_schema().insert(0, pa.field("region_id", pa.int32()))
+        table = schema.empty_table()
+    history = table.to_pandas()
+    history["date"] = pd.to_datetime(history["date"])
+    return history[COLUMNS]
+
+
+def archive_history(days=ARCHIVE_AFTER_DAYS, archive_dir=ARCHIVE_DIR, today=None):
+    """
+    Move the history older than `days` days from MarketHistory to the archive.
+
+    Each region is archived month by month, then its archived rows are deleted and its
+    archive cutoff moved forward in one transaction. Parquet files are replaced
+    atomically, a crash in between leaves rows in both places, which readers drop.
+
+    :param days: Age in days from which history is archived.
+    :param archive_dir: The archive directory.
+    :param today: The date the age is counted from, defaults to today.
+    :return: The number of rows archived.
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    cutoff = (today or date.today()) - timedelta(days=days)
+    regions = db.session.query(MarketHistory.region_id, func.min(MarketHistory.date)).filter(
+        MarketHistory.date < cutoff,
+    ).group_by(MarketHistory.region_id).all()
+
+    archived = 0
+    for region_id, first_date in regions:
+        month = first_date.replace(day=1)
+        while month < cutoff:
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            history = pd.read_sql(
+                select(MarketHistory.type_id, MarketHistory.date, MarketHistory.volume,
+                       MarketHistory.average_price).where(
+                    MarketHistory.region_id == region_id,
+                    MarketHistory.date >= month,
+                    MarketHistory.date < min(next_month, cutoff),
+                ),
+                db.session.connection(),
+            )
+            if not history.empty:
+                _write_partition(archive_dir, region_id, month, history)
+                archived += len(history)
+            month = next_month
+
+        db.session.query(MarketHistory).filter(
+            MarketHistory.region_id == region_id,
+            MarketHistory.date < cutoff,
+        ).delete(synchronize_session=False)
+        _set_archived_through(region_id, cutoff - timedelta(days=1))
+        db.session.commit()
+        logging.info("Archived market history before %s for region_id: %s.", cutoff, region_id)
+    logging.info("Archived %s market history rows to %s.", archived, archive_dir)
+    return archived
+
+
+def _write_partition(archive_dir, region_id, month, history):
+    """Merge a month of history into its partition file, replacing the file atomically."""
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+    directory = os.path.join(archive_dir, f"region_id={region_id}", f"month={month:%Y-%m}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, ARCHIVE_FILE)
+    history["date"] = pd.to_datetime(history["date"]).dt.date
+    if os.path.exists(path):
+        existing = pq.read_table(path).to_pandas()
+        history = pd.concat([existing, history], ignore_index=True).drop_duplicates(
+            ["type_id", "date"], keep="last")
+    # Sorted rows give each row group a narrow type and date range to skip on
+    history = history.sort_values(["type_id", "date"])
+    table = pa.Table.from_pandas(history, schema=_file_schema(), preserve_index=False)
+    # Dataset discovery skips dot files, so a leftover temporary file is never read
+    tmp_path = os.path.join(directory, f".{ARCHIVE_FILE}.tmp")
+    pq.write_table(table, tmp_path, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+
+
+def _set_archived_through(region_id, through):
+    """Record the last archived date of a region, never moving it backwards."""
+    table = HistoryArchive.__table__
+    stmt = dialect_insert()(table).values(
+        region_id=region_id, archived_through=through, updated=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.region_id],
+        set_={"archived_through": case(
+                  (table.c.archived_through > stmt.excluded.archived_through,
+                   table.c.archived_through),
+                  else_=stmt.excluded.archived_through,
+              ),
+              "updated": stmt.excluded.updated},
+    )
+    db.session.execute(stmt)
+
+
+def vacuum():
+    """Give the space freed by archiving back to the file system, SQLite only."""
+    if db.engine.dialect.name != "sqlite":
+        return
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="Archive history older than this many days.")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Shrink the SQLite file after archiving.")
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        archive_history(args.days, args.archive_dir)
+        if args.vacuum:
+            vacuum()
+
+
+if __name__ == "__main__":
+    main()
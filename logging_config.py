@@ -0,0 +1,31 @@
+"""
+Module Docstring: This module configures logging for the app and the command line scripts.
+
+Every entry point calls configure_logging, so all modules log to the same file and to
+the console in the same format, whichever one is imported first.
+"""
+import logging
+import os
+
+LOG_FILE = os.environ.get("EVE_INDUSTRY_LOG_FILE", "eve_industry.log")
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def configure_logging(log_file=LOG_FILE, level=logging.INFO):
+    """
+    Log to `log_file` and to the console, unless logging is already configured.
+
+    :param log_file: The file to append log records to.
+    :param level: The minimum level of the records logged.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    logging.basicConfig(
+        level=level,
+        format=LOG_FORMAT,
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
@@ -0,0 +1,203 @@
+"""
+Module Docstring: This module collects pipeline metrics in the Prometheus text format.
+
+Counters, gauges and histograms live in process memory and are rendered by render()
+for the /metrics route. They are thread-safe, so the fetch jobs, the scheduler and
+the request threads all report into the same registry. Every metric is defined at
+the bottom of this module, so the full list is in one place.
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds in seconds, from a fast SQLite statement to a long ESI request
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+class _Metric:
+    """
+    A named metric with optional labels.
+
+    :param name: The metric name, e.g., "esi_responses_total".
+    :param documentation: The help text.
+    :param labelnames: Names of the labels every sample must be given.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + (extra or [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        """Return the exposition lines of the metric's samples."""
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop every sample."""
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g., a number of requests."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Add `amount` to the counter."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value."""
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g., a queue length."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        """Set the gauge to `value`."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Observations counted into cumulative buckets, e.g., request durations.
+
+    :param buckets: Ascending bucket upper bounds, +Inf is added.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """Record one observation."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block in seconds, also usable as a decorator."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """Return the number of observations."""
+        counts, _ = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total))
+                           for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def esi_endpoint(path):
+    """Return an ESI path with its IDs replaced, e.g., "/markets/{id}/orders/"."""
+    return re.sub(r"/\d+", "/{id}", path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+### Metrics
+ESI_REQUEST_SECONDS = Histogram(
+    "esi_request_duration_seconds", "Duration of ESI requests, retries counted separately.",
+    ["endpoint"])
+ESI_RESPONSES = Counter(
+    "esi_responses_total", "ESI responses by status code, 304 is a conditional-request hit.",
+    ["endpoint", "status"])
+ESI_RESPONSE_BYTES = Counter(
+    "esi_response_bytes_total", "Bytes of ESI response bodies downloaded.", ["endpoint"])
+ESI_ERRORS = Counter(
+    "esi_network_errors_total", "ESI requests that failed without a response.", ["endpoint"])
+
+FETCH_TYPES = Counter(
+    "fetch_types_total", "Types requested from the fetch functions.", ["endpoint"])
+FETCH_CACHE_HITS = Counter(
+    "fetch_cache_hits_total", "Types skipped because their stored data had not expired.",
+    ["endpoint"])
+
+ROWS_RECEIVED = Counter(
+    "ingest_rows_received_total", "Rows handed to the database by the ingest path.", ["table"])
+ROWS_WRITTEN = Counter(
+    "ingest_rows_written_total", "Rows inserted or changed by the ingest path.", ["table"])
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds", "Duration of each stage of the ingest pipeline.",
+    ["stage"])
+DB_COMMIT_SECONDS = Histogram(
+    "db_commit_duration_seconds", "Duration of session commits, including the final flush.")
+
+ANALYTICS_SECONDS = Histogram(
+    "analytics_duration_seconds", "Duration of analytics computations.", ["function"])
+READ_CACHE_LOOKUPS = Counter(
+    "read_cache_lookups_total", "Read API items served from the cache (hit) or computed (miss).",
+    ["kind", "result"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Duration of Flask requests.", ["endpoint", "status"])
@@ -0,0 +1,135 @@
+"""
+Module Docstring: This module maintains the per-type order book summaries.
+
+Summaries are recomputed only for the types touched by an ingest batch, and orders
+that disappeared from a complete snapshot are deleted, so reading the best prices
+of a type is a primary-key lookup on OrderBookSummary.
+"""
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import delete, select
+
+from app.database import dialect_insert
+from app.models import db, MarketOrder, OrderBookSummary
+from metrics import STAGE_SECONDS
+
+# Share of a side's volume used for the depth-weighted price
+DEPTH_FRACTION = 0.05
+# Maximum number of order IDs per DELETE statement
+DELETE_BATCH_SIZE = 500
+SUMMARY_COLUMNS = (
+    "best_bid", "best_ask", "bid_5pct", "ask_5pct", "buy_volume", "sell_volume",
+    "buy_orders", "sell_orders", "updated",
+)
+
+
+def depth_weighted_price(orders, fraction=DEPTH_FRACTION):
+    """
+    Return the volume-weighted price of the best `fraction` of the volume.
+
+    :param orders: (price, volume) pairs sorted from best to worst price.
+    :param fraction: Share of the total volume to average over.
+    :return: The weighted price, or None if there is no volume.
+    """
+    total = sum(volume for _, volume in orders)
+    if total <= 0:
+        return None
+    remaining = max(total * fraction, 1)
+    value = taken = 0
+    for price, volume in orders:
+        take = min(volume, remaining)
+        value += price * take
+        taken += take
+        remaining -= take
+        if remaining <= 0:
+            break
+    return value / taken
+
+
+def summarize(region_id, type_id, bids, asks, now):
+    """
+    Build a summary row from the two sides of an order book.
+
+    :param bids: (price, volume) buy orders sorted from highest to lowest price.
+    :param asks: (price, volume) sell orders sorted from lowest to highest price.
+    """
+    return {
+        "region_id": region_id,
+        "type_id": type_id,
+        "best_bid": bids[0][0] if bids else None,
+        "best_ask": asks[0][0] if asks else None,
+        "bid_5pct": depth_weighted_price(bids),
+        "ask_5pct": depth_weighted_price(asks),
+        "buy_volume": sum(volume for _, volume in bids),
+        "sell_volume": sum(volume for _, volume in asks),
+        "buy_orders": len(bids),
+        "sell_orders": len(asks),
+        "updated": now,
+    }
+
+
+@STAGE_SECONDS.time(stage="summaries")
+def refresh_order_book_summaries(region_id, type_ids):
+    """
+    Recompute the summaries of several types from their stored orders.
+
+    The orders of all types are read in one query; the caller commits.
+
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :param type_ids: The type IDs whose orders changed.
+    """
+    type_ids = sorted({int(type_id) for type_id in type_ids})
+    if not type_ids:
+        return
+    rows = db.session.execute(
+        select(MarketOrder.type_id, MarketOrder.is_buy_order, MarketOrder.price,
+               MarketOrder.volume_remain)
+        .where(MarketOrder.region_id == region_id, MarketOrder.type_id.in_(type_ids))
+        .order_by(MarketOrder.type_id, MarketOrder.is_buy_order, MarketOrder.price)
+    ).all()
+    books = {type_id: ([], []) for type_id in type_ids}
+    for (type_id, is_buy_order), orders in groupby(rows, key=lambda row: (row[0], row[1])):
+        books[type_id][0 if is_buy_order else 1].extend((row[2], row[3]) for row in orders)
+
+    now = datetime.utcnow()
+    summaries = [summarize(region_id, type_id, bids[::-1], asks, now)
+                 for type_id, (bids, asks) in books.items()]
+    table = OrderBookSummary.__table__
+    stmt = dialect_insert()(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.region_id, table.c.type_id],
+        set_={column: stmt.excluded[column] for column in SUMMARY_COLUMNS},
+    )
+    db.session.execute(stmt, summaries)
+
+
+@STAGE_SECONDS.time(stage="prune")
+def prune_vanished_orders(region_id, type_ids, seen_order_ids):
+    """
+    Delete the stored orders of several types that are missing from a complete snapshot.
+
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :param type_ids: The type IDs the snapshot covers completely.
+    :param seen_order_ids: The order IDs present in the snapshot.
+    :return: The number of orders deleted.
+    """
+    stored = db.session.execute(
+        select(MarketOrder.order_id).where(
+            MarketOrder.region_id == region_id,
+            MarketOrder.type_id.in_([int(type_id) for type_id in type_ids]),
+        )
+    ).scalars()
+    vanished = [order_id for order_id in stored if order_id not in seen_order_ids]
+    for start in range(0, len(vanished), DELETE_BATCH_SIZE):
+        db.session.execute(
+            delete(MarketOrder).where(
+                MarketOrder.order_id.in_(vanished[start:start + DELETE_BATCH_SIZE])
+            )
+        )
+    return len(vanished)
+
+
+def order_book_summary(region_id, type_id):
+    """Return the OrderBookSummary of a type in a region, or None."""
+    return db.session.get(OrderBookSummary, (int(region_id), int(type_id)))
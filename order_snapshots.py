@@ -0,0 +1,257 @@
+"""
+Module Docstring: This module keeps a time series of order books as compact deltas.
+
+Every complete refresh of a type's order book is stored as an OrderSnapshot holding
+only what changed since the previous one: the orders that are new or whose price or
+remaining volume changed, and the IDs of the orders that vanished. Every
+KEYFRAME_EVERY deltas, or when a delta would not be smaller, the whole book is stored
+instead, so reconstructing a book never replays more than that many deltas.
+
+Books are NumPy structured arrays of BOOK_DTYPE sorted by order ID. Snapshots are
+serialized column by column, order IDs as differences between sorted values, and
+zlib compressed.
+"""
+import struct
+import zlib
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import and_, func, select
+
+from app.models import db, MarketOrder, OrderSnapshot
+from metrics import STAGE_SECONDS
+
+BOOK_DTYPE = np.dtype([
+    ("order_id", "<i8"),
+    ("is_buy_order", "?"),
+    ("price", "<f8"),
+    ("volume_remain", "<i4"),
+])
+EMPTY_BOOK = np.empty(0, BOOK_DTYPE)
+EMPTY_IDS = np.empty(0, "<i8")
+# Maximum number of deltas between two full copies of a book
+KEYFRAME_EVERY = 48
+# Number of upserted orders and of removed order IDs
+_HEADER = struct.Struct("<II")
+
+
+class _Head(NamedTuple):
+    """The latest stored book of one type."""
+    snapshot_id: int
+    book: np.ndarray
+    deltas: int
+
+
+# (region_id, type_id) -> _Head, saves rebuilding the previous book on every refresh
+_heads = {}
+
+
+def encode(upserts, removed=EMPTY_IDS):
+    """Serialize a delta, or a whole book when `removed` is empty, to compressed bytes."""
+    parts = [_HEADER.pack(len(upserts), len(removed))]
+    for name in BOOK_DTYPE.names:
+        column = upserts[name]
+        if name == "order_id":
+            column = np.diff(column, prepend=0)
+        parts.append(np.ascontiguousarray(column).tobytes())
+    parts.append(np.diff(removed, prepend=0).astype("<i8").tobytes())
+    return zlib.compress(b"".join(parts))
+
+
+def decode(data):
+    """Deserialize bytes written by encode into an (upserts, removed) pair."""
+    raw = zlib.decompress(data)
+    upsert_count, removed_count = _HEADER.unpack_from(raw)
+    offset = _HEADER.size
+    upserts = np.empty(upsert_count, BOOK_DTYPE)
+    for name in BOOK_DTYPE.names:
+        dtype = BOOK_DTYPE[name]
+        upserts[name] = np.frombuffer(raw, dtype, upsert_count, offset)
+        offset += upsert_count * dtype.itemsize
+    upserts["order_id"] = np.cumsum(upserts["order_id"])
+    removed = np.cumsum(np.frombuffer(raw, "<i8", removed_count, offset))
+    return upserts, removed
+
+
+def diff(old, new):
+    """
+    Compute the delta turning one book into another.
+
+    :return: An (upserts, removed) pair: the orders of `new` that are missing from or
+             differ in `old`, and the IDs of the orders of `old` missing from `new`.
+    """
+    removed = np.setdiff1d(old["order_id"], new["order_id"], assume_unique=True)
+    if not len(old):
+        return new, removed
+    position = np.minimum(np.searchsorted(old["order_id"], new["order_id"]), len(old) - 1)
+    matched = old[position]
+    changed = ((matched["order_id"] != new["order_id"])
+               | (matched["price"] != new["price"])
+               | (matched["volume_remain"] != new["volume_remain"]))
+    return new[changed], removed
+
+
+def apply(book, upserts, removed):
+    """Return the book obtained by applying a delta to `book`."""
+    keep = ~(np.isin(book["order_id"], removed) | np.isin(book["order_id"], upserts["order_id"]))
+    merged = np.concatenate([book[keep], upserts])
+    return merged[np.argsort(merged["order_id"], kind="stable")]
+
+
+def current_books(region_id, type_ids):
+    """
+    Read the stored orders of several types in one query.
+
+    :return: A dictionary of type ID to book, types without orders are omitted.
+    """
+    rows = db.session.execute(
+        select(MarketOrder.type_id, MarketOrder.order_id, MarketOrder.is_buy_order,
+               MarketOrder.price, MarketOrder.volume_remain)
+        .where(MarketOrder.region_id == region_id, MarketOrder.type_id.in_(type_ids))
+        .order_by(MarketOrder.type_id, MarketOrder.order_id)
+    ).all()
+    if not rows:
+        return {}
+    type_column = np.fromiter((row[0] for row in rows), np.int64, len(rows))
+    orders = np.array([tuple(row[1:]) for row in rows], BOOK_DTYPE)
+    starts = np.flatnonzero(np.diff(type_column, prepend=type_column[0] - 1))
+    ends = np.append(starts[1:], len(rows))
+    return {int(type_column[start]): orders[start:end] for start, end in zip(starts, ends)}
+
+
+@STAGE_SECONDS.time(stage="snapshots")
+def record_snapshots(region_id, type_ids, taken=None):
+    """
+    Store a snapshot of the current order book of several types; the caller commits.
+
+    Call after the stored orders of the types were brought up to date from a complete
+    fetch. Types whose book did not change get no snapshot.
+
+    :param region_id: The region ID (e.g., 10000002 for Jita).
+    :param type_ids: The type IDs whose books were refreshed.
+    :param taken: Time of the refresh, defaults to now.
+    :return: The number of snapshots stored.
+    """
+    type_ids = sorted({int(type_id) for type_id in type_ids})
+    if not type_ids:
+        return 0
+    taken = taken or datetime.utcnow()
+    books = current_books(region_id, type_ids)
+    heads = _latest_heads(region_id, type_ids)
+
+    pending = []
+    for type_id in type_ids:
+        book = books.get(type_id, EMPTY_BOOK)
+        head = heads.get(type_id)
+        if head is None:
+            if not len(book):
+                continue
+            keyframe, data = True, encode(book)
+        else:
+            upserts, removed = diff(head.book, book)
+            if not len(upserts) and not len(removed):
+                continue
+            keyframe = head.deltas + 1 >= KEYFRAME_EVERY or len(upserts) + len(removed) >= len(book)
+            data = encode(book) if keyframe else encode(upserts, removed)
+        snapshot = OrderSnapshot(region_id=region_id, type_id=type_id, taken=taken,
+                                 keyframe=keyframe, orders=len(book), data=data)
+        pending.append((snapshot, book, 0 if keyframe else head.deltas + 1))
+
+    db.session.add_all(snapshot for snapshot, _, _ in pending)
+    db.session.flush()
+    for snapshot, book, deltas in pending:
+        _heads[(region_id, snapshot.type_id)] = _Head(snapshot.id, book, deltas)
+    return len(pending)
+
+
+def book_at(region_id, type_id, when):
+    """
+    Reconstruct the order book of a type as it was at a point in time.
+
+    :return: A BOOK_DTYPE array sorted by order ID, empty if nothing was recorded by then.
+    """
+    head = _replay(region_id, [int(type_id)], until=when).get(int(type_id))
+    return head.book if head else EMPTY_BOOK
+
+
+def iter_books(region_id, type_id, start, end):
+    """
+    Iterate over the recorded states of a type's order book in a time range.
+
+    The first state is the book as it was at `start`, each following one a later
+    snapshot up to and including `end`.
+
+    :return: An iterator of (taken, book) tuples.
+    """
+    type_id = int(type_id)
+    book = book_at(region_id, type_id, start)
+    yield start, book
+    rows = db.session.execute(
+        select(OrderSnapshot.taken, OrderSnapshot.keyframe, OrderSnapshot.data)
+        .where(OrderSnapshot.region_id == region_id, OrderSnapshot.type_id == type_id,
+               OrderSnapshot.taken > start, OrderSnapshot.taken <= end)
+        .order_by(OrderSnapshot.id)
+    )
+    for taken, keyframe, data in rows:
+        upserts, removed = decode(data)
+        book = upserts if keyframe else apply(book, upserts, removed)
+        yield taken, book
+
+
+def _latest_heads(region_id, type_ids):
+    """Return the latest stored book of each type, from memory where still current."""
+    latest = db.session.execute(
+        select(OrderSnapshot.type_id, func.max(OrderSnapshot.id))
+        .where(OrderSnapshot.region_id == region_id, OrderSnapshot.type_id.in_(type_ids))
+        .group_by(OrderSnapshot.type_id)
+    ).all()
+    heads = {}
+    stale = []
+    for type_id, snapshot_id in latest:
+        head = _heads.get((region_id, type_id))
+        if head is not None and head.snapshot_id == snapshot_id:
+            heads[type_id] = head
+        else:
+            stale.append(type_id)
+    if stale:
+        heads.update(_replay(region_id, stale))
+        for type_id in stale:
+            if type_id in heads:
+                _heads[(region_id, type_id)] = heads[type_id]
+    return heads
+
+
+def _replay(region_id, type_ids, until=None):
+    """
+    Rebuild books from their latest keyframe onwards, optionally only up to `until`.
+
+    :return: A dictionary of type ID to _Head, types without snapshots are omitted.
+    """
+    conditions = [OrderSnapshot.region_id == region_id, OrderSnapshot.type_id.in_(type_ids)]
+    if until is not None:
+        conditions.append(OrderSnapshot.taken <= until)
+    keyframes = (
+        select(OrderSnapshot.type_id, func.max(OrderSnapshot.id).label("keyframe_id"))
+        .where(*conditions, OrderSnapshot.keyframe.is_(True))
+        .group_by(OrderSnapshot.type_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(OrderSnapshot.type_id, OrderSnapshot.id, OrderSnapshot.keyframe,
+               OrderSnapshot.data)
+        .join(keyframes, and_(OrderSnapshot.type_id == keyframes.c.type_id,
+                              OrderSnapshot.id >= keyframes.c.keyframe_id))
+        .where(*conditions)
+        .order_by(OrderSnapshot.type_id, OrderSnapshot.id)
+    )
+    heads = {}
+    for type_id, snapshot_id, keyframe, data in rows:
+        upserts, removed = decode(data)
+        if keyframe:
+            heads[type_id] = _Head(snapshot_id, upserts, 0)
+        else:
+            head = heads[type_id]
+            heads[type_id] = _Head(snapshot_id, apply(head.book, upserts, removed),
+                                   head.deltas + 1)
+    return heads
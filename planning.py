@@ -0,0 +1,288 @@
+"""
+Module Docstring: This module plans what to build by evaluating many what-if scenarios in parallel.
+
+A scenario is a build setup: the ME/TE research of the blueprints, the structure the
+jobs run in and the level of the character's industry skills (see scenario_grid).
+Expanding and costing every product under every scenario is CPU-bound Python, so the
+scenarios are sharded across a ProcessPoolExecutor:
+
+- each worker receives the SDE index once, when it starts, and expands the products
+  of a scenario with its own memoizing BOMEngine;
+- the price and volume tables are saved once as .npy files that every worker
+  memory-maps read-only, so the pages are shared rather than pickled into each
+  task, which only carries scenario numbers.
+
+The results are ranked into a build queue in which each product is built only as
+many times as its hub trades in a day.
+
+    python planning.py --hubs Jita Amarr --me 0 5 10 --structures station raitaru --skills 4 5
+"""
+import argparse
+import itertools
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from analytics import market_history_stats
+from app.models import db, OrderBookSummary
+from bom import BOMEngine, BuildConfig
+from metrics import ANALYTICS_SECONDS
+from profitability import RESULT_COLUMNS, material_matrix, profitability_matrix
+
+# Manufacturing (material, time) bonuses of the structure the jobs run in
+STRUCTURES = {
+    "station": (0.0, 0.0),
+    "raitaru": (0.01, 0.15),
+    "azbel": (0.01, 0.20),
+    "sotiyo": (0.01, 0.30),
+}
+# Scenarios per task, small enough for the workers to finish at about the same time
+DEFAULT_CHUNK_SIZE = 4
+# Days of average trade volume queued per product
+DEFAULT_QUEUE_DAYS = 1.0
+QUEUE_COLUMNS = [
+    "scenario", "region_id", "type_id", "quantity", "margin", "margin_pct", "profit",
+    "job_hours", "isk_per_hour", "avg_daily_volume",
+]
+# Tables written by plan_builds and memory-mapped by the workers
+_TABLES = ("type_ids", "material_prices", "product_prices", "daily_volume")
+
+
+class Scenario(NamedTuple):
+    """A named build setup every product is evaluated under."""
+    name: str
+    config: BuildConfig
+
+
+def skill_bonuses(level):
+    """
+    Return the manufacturing time bonus and invention chance multiplier of the skills.
+
+    Industry and Advanced Industry shorten manufacturing by 4% and 3% per level, the
+    two science skills of an invention add level/30 each to its chance and the
+    encryption skill level/40.
+
+    :param level: The level of every industry and science skill (0-5).
+    """
+    time_bonus = 1 - (1 - 0.04 * level) * (1 - 0.03 * level)
+    return time_bonus, 1 + 2 * level / 30 + level / 40
+
+
+def scenario_grid(me_levels=(10,), te_levels=(20,), structures=("station",), skill_levels=(5,)):
+    """
+    Build a scenario for every combination of blueprint research, structure and skills.
+
+    :param me_levels: Material efficiency of the researched blueprints (0-10).
+    :param te_levels: Time efficiency of the researched blueprints (0-20).
+    :param structures: Names of STRUCTURES the jobs run in.
+    :param skill_levels: Levels of every industry and science skill (0-5).
+    :return: A list of Scenario.
+    """
+    scenarios = []
+    for me, te, structure, level in itertools.product(me_levels, te_levels, structures,
+                                                       skill_levels):
+        me_bonus, te_bonus = STRUCTURES[structure]
+        skill_te_bonus, chance_bonus = skill_bonuses(level)
+        config = BuildConfig(me=me, te=te, structure_me_bonus=me_bonus,
+                             # The structure and the skills each shorten the job
+                             structure_te_bonus=1 - (1 - te_bonus) * (1 - skill_te_bonus),
+                             invention_chance_bonus=chance_bonus)
+        scenarios.append(Scenario(f"ME{me} TE{te} {structure} skills {level}", config))
+    return scenarios
+
+
+def price_table(region_ids, side="best_ask"):
+    """
+    Load the price of every type traded in several hubs from the order book summaries.
+
+    :param region_ids: A list of hub region IDs.
+    :param side: "best_ask" or "best_bid".
+    :return: (sorted type IDs, types x hubs price matrix with NaN where there is no price)
+    """
+    column = getattr(OrderBookSummary, side)
+    rows = db.session.execute(
+        select(OrderBookSummary.type_id, OrderBookSummary.region_id, column).where(
+            OrderBookSummary.region_id.in_(region_ids),
+            column.isnot(None),
+        )
+    ).all()
+    data = np.array(rows, dtype=float).reshape(-1, 3)
+    type_ids = np.unique(data[:, 0]).astype(np.int64)
+    hub = {region_id: i for i, region_id in enumerate(region_ids)}
+    prices = np.full((len(type_ids), len(region_ids)), np.nan)
+    prices[np.searchsorted(type_ids, data[:, 0]),
+           [hub[int(region_id)] for region_id in data[:, 1]]] = data[:, 2]
+    return type_ids, prices
+
+
+def lookup(type_ids, prices, wanted):
+    """Return the rows of a price table for the `wanted` type IDs, NaN for unknown types."""
+    wanted = np.asarray(wanted, dtype=np.int64)
+    if not len(type_ids):
+        return np.full((len(wanted), prices.shape[1]), np.nan)
+    rows = np.minimum(np.searchsorted(type_ids, wanted), len(type_ids) - 1)
+    return np.where((type_ids[rows] == wanted)[:, None], prices[rows], np.nan)
+
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(index, directory, product_ids):
+    """Keep the SDE index and memory-map the tables, once per worker process."""
+    _worker["index"] = index
+    _worker["product_ids"] = product_ids
+    for name in _TABLES:
+        # Read-only maps share the pages with the other workers instead of copying them
+        _worker[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+
+def _evaluate(task, quantity):
+    """
+    Evaluate every product under the scenarios of a task, in a worker.
+
+    :param task: A list of (scenario number, BuildConfig).
+    :return: A list of (scenario number, products x hubs arrays keyed by RESULT_COLUMNS).
+    """
+    results = []
+    for number, config in task:
+        engine = BOMEngine(_worker["index"], config)
+        materials, _, material_ids, job_hours = material_matrix(
+            engine.expand_many(_worker["product_ids"]))
+        material_prices = lookup(_worker["type_ids"], _worker["material_prices"], material_ids)
+        results.append((number, profitability_matrix(
+            materials, material_prices, np.asarray(_worker["product_prices"]), job_hours,
+            np.asarray(_worker["daily_volume"]), quantity)))
+    return results
+
+
+@ANALYTICS_SECONDS.time(function="plan_builds")
+def plan_builds(index, product_ids, region_ids, scenarios, quantity=1,
+                material_side="best_ask", product_side="best_ask", workers=None,
+                chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Calculate margin, ISK/hour and days-to-sell of every product in every hub under every scenario.
+
+    :param index: The SDEIndex the products are expanded with.
+    :param product_ids: A list of product type IDs.
+    :param region_ids: A list of hub region IDs.
+    :param scenarios: A list of Scenario, e.g., from scenario_grid.
+    :param quantity: Number of units built of each product, used for days-to-sell.
+    :param material_side: Price materials are bought at, "best_ask" or "best_bid".
+    :param product_side: Price products are sold at, "best_ask" or "best_bid".
+    :param workers: Number of worker processes, defaults to the number of CPUs. With 1
+                    the scenarios are evaluated in this process.
+    :param chunk_size: Number of scenarios per task.
+    :return: A DataFrame indexed by (scenario, region_id, type_id) with RESULT_COLUMNS.
+    """
+    started = time.perf_counter()
+    product_ids = [int(product_id) for product_id in product_ids]
+    region_ids = [int(region_id) for region_id in region_ids]
+    workers = workers or os.cpu_count() or 1
+
+    type_ids, material_prices = price_table(region_ids, material_side)
+    product_prices = lookup(*price_table(region_ids, product_side), product_ids)
+    stats = market_history_stats(product_ids, region_ids, windows=(30,))
+    daily_volume = stats["avg_volume_30"].unstack("region_id").reindex(
+        index=product_ids, columns=region_ids).to_numpy(dtype=float)
+    tables = {"type_ids": type_ids, "material_prices": material_prices,
+              "product_prices": product_prices, "daily_volume": np.nan_to_num(daily_volume)}
+
+    numbered = [(number, scenario.config) for number, scenario in enumerate(scenarios)]
+    tasks = [numbered[start:start + chunk_size] for start in range(0, len(numbered), chunk_size)]
+    with tempfile.TemporaryDirectory(prefix="planning-") as directory:
+        for name in _TABLES:
+            np.save(os.path.join(directory, f"{name}.npy"), tables[name])
+        initargs = (index, directory, product_ids)
+        if workers == 1:
+            _init_worker(*initargs)
+            try:
+                evaluated = [_evaluate(task, quantity) for task in tasks]
+            finally:
+                _worker.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=initargs) as pool:
+                evaluated = list(pool.map(_evaluate, tasks, itertools.repeat(quantity)))
+
+    # Each scenario fills one block of rows, ordered by hub, then product
+    block = len(region_ids) * len(product_ids)
+    columns = {column: np.empty(block * len(scenarios)) for column in RESULT_COLUMNS}
+    for results in evaluated:
+        for number, result in results:
+            for column, values in result.items():
+                columns[column][number * block:(number + 1) * block] = np.asarray(values).T.ravel()
+    logging.info("Evaluated %s products in %s hubs under %s scenarios with %s workers in %.1fs.",
+                 len(product_ids), len(region_ids), len(scenarios), workers,
+                 time.perf_counter() - started)
+    index = pd.MultiIndex.from_product(
+        [[scenario.name for scenario in scenarios], region_ids, product_ids],
+        names=["scenario", "region_id", "type_id"])
+    return pd.DataFrame(columns, index=index)
+
+
+def build_queue(results, days=DEFAULT_QUEUE_DAYS, min_margin_pct=0.0):
+    """
+    Rank the profitable builds by ISK/hour, each limited to what its hub trades in `days` days.
+
+    Only the scenario with the highest ISK/hour is kept for each product and hub, so
+    pass the results of the scenarios that can actually be used.
+
+    :param results: A DataFrame as returned by plan_builds.
+    :param days: Days of average daily volume (30-day) queued per product.
+    :param min_margin_pct: Smallest margin, as a fraction of the sale price, worth building.
+    :return: A DataFrame with QUEUE_COLUMNS, best first.
+    """
+    builds = results.reset_index()
+    builds = builds[(builds["margin"] > 0) & (builds["margin_pct"] >= min_margin_pct)
+                    & builds["isk_per_hour"].notna()]
+    builds = builds.sort_values("isk_per_hour", ascending=False, kind="stable") \
+        .drop_duplicates(["region_id", "type_id"])
+    quantity = np.floor(builds["avg_daily_volume"] * days)
+    builds = builds.assign(quantity=quantity.astype(int), profit=builds["margin"] * quantity)
+    return builds[builds["quantity"] >= 1][QUEUE_COLUMNS].reset_index(drop=True)
+
+
+def main():
+    """Main entry point of the script."""
+    # pylint: disable=import-outside-toplevel
+    from app import create_app
+    from blueprints import load_sde_index
+    from fetch_data import TRADE_HUBS, load_tracked_type_ids
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hubs", nargs="+", choices=sorted(TRADE_HUBS), default=["Jita"])
+    parser.add_argument("--me", nargs="+", type=int, default=[10],
+                        help="ME levels of the researched blueprints.")
+    parser.add_argument("--te", nargs="+", type=int, default=[20],
+                        help="TE levels of the researched blueprints.")
+    parser.add_argument("--structures", nargs="+", choices=sorted(STRUCTURES),
+                        default=["station"])
+    parser.add_argument("--skills", nargs="+", type=int, default=[5],
+                        help="Levels of every industry and science skill.")
+    parser.add_argument("--days", type=float, default=DEFAULT_QUEUE_DAYS,
+                        help="Days of trade volume to queue per product.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes, defaults to the number of CPUs.")
+    parser.add_argument("--top", type=int, default=30, help="Number of builds to show.")
+    args = parser.parse_args()
+
+    scenarios = scenario_grid(args.me, args.te, args.structures, args.skills)
+    with create_app().app_context():
+        results = plan_builds(load_sde_index(), load_tracked_type_ids(include_materials=False),
+                              [TRADE_HUBS[hub] for hub in args.hubs], scenarios,
+                              workers=args.workers)
+    queue = build_queue(results, days=args.days)
+    print(queue.head(args.top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
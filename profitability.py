@@ -0,0 +1,138 @@
+"""
+Module Docstring: This module calculates build profitability for many products and hubs at once.
+
+Material requirements come from the BOM engine as a products x materials matrix,
+prices from the stored order books as a materials x hubs matrix, so the build cost
+of every product in every hub is a single matrix product.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from analytics import market_history_stats
+from app.models import db, MarketOrder
+from metrics import ANALYTICS_SECONDS
+
+RESULT_COLUMNS = [
+    "cost", "revenue", "margin", "margin_pct", "job_hours", "isk_per_hour",
+    "avg_daily_volume", "days_to_sell",
+]
+
+
+def best_prices(type_ids, region_ids):
+    """
+    Load the best buy and sell price of several types in several regions with one query.
+
+    :param type_ids: A list of type IDs.
+    :param region_ids: A list of region IDs.
+    :return: A DataFrame indexed by (region_id, type_id) with best_bid and best_ask columns.
+    """
+    query = select(
+        MarketOrder.region_id,
+        MarketOrder.type_id,
+        MarketOrder.is_buy_order,
+        func.max(MarketOrder.price).label("max_price"),
+        func.min(MarketOrder.price).label("min_price"),
+    ).where(
+        MarketOrder.region_id.in_([int(region_id) for region_id in region_ids]),
+        MarketOrder.type_id.in_([int(type_id) for type_id in type_ids]),
+    ).group_by(MarketOrder.region_id, MarketOrder.type_id, MarketOrder.is_buy_order)
+    orders = pd.read_sql(query, db.session.connection())
+    bids = orders[orders["is_buy_order"].astype(bool)].set_index(["region_id", "type_id"])
+    asks = orders[~orders["is_buy_order"].astype(bool)].set_index(["region_id", "type_id"])
+    return pd.DataFrame({"best_bid": bids["max_price"], "best_ask": asks["min_price"]})
+
+
+def material_matrix(expansions, material_ids=None):
+    """
+    Arrange BOM expansions into a products x materials quantity matrix.
+
+    :param expansions: A dictionary of product type ID to Expansion.
+    :param material_ids: Column order, defaults to every material used, sorted.
+    :return: (matrix, product_ids, material_ids, job_hours)
+    """
+    product_ids = list(expansions)
+    if material_ids is None:
+        material_ids = sorted({material_id for expansion in expansions.values()
+                               for material_id in expansion.materials})
+    column = {material_id: i for i, material_id in enumerate(material_ids)}
+    matrix = np.zeros((len(product_ids), len(material_ids)))
+    for row, product_id in enumerate(product_ids):
+        for material_id, quantity in expansions[product_id].materials.items():
+            matrix[row, column[material_id]] = quantity
+    job_hours = np.array([expansions[product_id].job_seconds / 3600
+                          for product_id in product_ids])
+    return matrix, product_ids, material_ids, job_hours
+
+
+def profitability_matrix(materials, material_prices, product_prices, job_hours,
+                         daily_volume, quantity=1):
+    """
+    Compute build economics for every product in every hub.
+
+    Products that need a material without a price in a hub get NaN figures for that hub.
+
+    :param materials: products x materials quantity matrix.
+    :param material_prices: materials x hubs price matrix, NaN where there is no price.
+    :param product_prices: products x hubs sale price matrix.
+    :param job_hours: Job hours per unit, one per product.
+    :param daily_volume: products x hubs average units traded per day.
+    :param quantity: Number of units built of each product.
+    :return: A dictionary of products x hubs arrays keyed by RESULT_COLUMNS.
+    """
+    missing = np.isnan(material_prices)
+    cost = materials @ np.where(missing, 0.0, material_prices)
+    cost[(materials > 0) @ missing > 0] = np.nan
+    margin = product_prices - cost
+    job_hours = np.broadcast_to(job_hours[:, None], cost.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "cost": cost,
+            "revenue": product_prices,
+            "margin": margin,
+            "margin_pct": margin / product_prices,
+            "job_hours": job_hours,
+            "isk_per_hour": np.where(job_hours > 0, margin / job_hours, np.nan),
+            "avg_daily_volume": daily_volume,
+            "days_to_sell": np.where(daily_volume > 0, quantity / daily_volume, np.inf),
+        }
+
+
+@ANALYTICS_SECONDS.time(function="build_profitability")
+def build_profitability(engine, product_ids, region_ids, quantity=1,
+                        material_side="best_ask", product_side="best_ask"):
+    """
+    Calculate margin, ISK/hour and days-to-sell for every product in every hub.
+
+    :param engine: The BOMEngine used to expand the products.
+    :param product_ids: A list of product type IDs.
+    :param region_ids: A list of hub region IDs.
+    :param quantity: Number of units built of each product, used for days-to-sell.
+    :param material_side: Price materials are bought at, "best_ask" or "best_bid".
+    :param product_side: Price products are sold at, "best_ask" or "best_bid".
+    :return: A DataFrame indexed by (region_id, type_id) with RESULT_COLUMNS.
+    """
+    region_ids = [int(region_id) for region_id in region_ids]
+    expansions = engine.expand_many(product_ids)
+    materials, product_ids, material_ids, job_hours = material_matrix(expansions)
+
+    prices = best_prices(set(product_ids) | set(material_ids), region_ids)
+    material_prices = _hub_matrix(prices[material_side], material_ids, region_ids)
+    product_prices = _hub_matrix(prices[product_side], product_ids, region_ids)
+    stats = market_history_stats(product_ids, region_ids, windows=(30,))
+    daily_volume = _hub_matrix(stats["avg_volume_30"], product_ids, region_ids)
+
+    result = profitability_matrix(materials, material_prices, product_prices, job_hours,
+                                  np.nan_to_num(daily_volume), quantity)
+    index = pd.MultiIndex.from_product([region_ids, product_ids],
+                                       names=["region_id", "type_id"])
+    # Arrays are products x hubs; transpose so rows are ordered by hub, then product
+    return pd.DataFrame({column: np.asarray(values).T.ravel()
+                         for column, values in result.items()}, index=index)
+
+
+def _hub_matrix(series, type_ids, region_ids):
+    """Reshape a (region_id, type_id) indexed series into a types x hubs matrix."""
+    index = pd.MultiIndex.from_product([region_ids, type_ids], names=["region_id", "type_id"])
+    values = series.reindex(index).to_numpy(dtype=float)
+    return values.reshape(len(region_ids), len(type_ids)).T
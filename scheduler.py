@@ -0,0 +1,214 @@
+"""
+Module Docstring: This module keeps market data for several trade hubs fresh in the background.
+
+Each tracked type gets an order refresh interval from its recent trade volume, busy
+types are refreshed every few minutes and rarely traded ones a few times a day. The
+intervals are stretched when needed so the whole plan fits a global ESI request
+budget. History is refreshed once a day per hub.
+
+    python scheduler.py --hubs Jita Amarr --local 10000060
+"""
+import argparse
+import logging
+import time
+from collections import defaultdict
+
+import schedule
+
+from app import create_app
+from app.models import db, FetchState
+from fetch_data import (fetch_market_orders, fetch_market_history, load_tracked_type_ids,
+                        order_fetch_mode, REGION_SNAPSHOT_TYPE_ID, TRADE_HUBS)
+
+# (minimum average daily volume, order refresh interval in seconds), busiest first
+VOLUME_TIERS = (
+    (1000, 300),
+    (100, 1800),
+    (10, 3 * 3600),
+    (0, 12 * 3600),
+)
+HISTORY_INTERVAL = 86400
+# ESI requests per minute the scheduler may spend across all hubs
+REQUEST_BUDGET_PER_MINUTE = 300
+# Seconds between re-planning the intervals from fresh volumes
+REPLAN_INTERVAL = 3600
+
+
+def tier_interval(avg_daily_volume):
+    """Return the order refresh interval for a type trading `avg_daily_volume` units a day."""
+    for min_volume, interval in VOLUME_TIERS:
+        if avg_daily_volume >= min_volume:
+            return interval
+    return VOLUME_TIERS[-1][1]
+
+
+def requests_per_minute(jobs):
+    """Return the ESI requests per minute a plan of (interval, request count) jobs costs."""
+    return sum(count * 60 / interval for interval, count in jobs)
+
+
+def fit_to_budget(jobs, budget_per_minute):
+    """
+    Return the factor all intervals must be multiplied by to stay within the budget.
+
+    :param jobs: (interval, request count) pairs.
+    :param budget_per_minute: The ESI requests per minute available.
+    """
+    load = requests_per_minute(jobs)
+    return max(1.0, load / budget_per_minute)
+
+
+class JobMetrics:
+    """Lag and throughput of one scheduled job."""
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.failures = 0
+        self.last_lag = 0.0
+        self.last_duration = 0.0
+        self.last_types = 0
+        self.total_types = 0
+        self.total_requests = 0
+        self.total_seconds = 0.0
+
+    def record(self, lag, duration, types, requests):
+        """Record one completed run."""
+        self.runs += 1
+        self.last_lag = lag
+        self.last_duration = duration
+        self.last_types = types
+        self.total_types += types
+        self.total_requests += requests
+        self.total_seconds += duration
+
+    def summary(self):
+        """Return the metrics as a dictionary."""
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_lag_seconds": round(self.last_lag, 3),
+            "last_duration_seconds": round(self.last_duration, 3),
+            "last_types": self.last_types,
+            "types_per_second": (round(self.total_types / self.total_seconds, 3)
+                                 if self.total_seconds else 0.0),
+            "requests": self.total_requests,
+        }
+
+
+class MarketScheduler:
+    """
+    Plans and runs order and history refreshes for a set of hubs.
+
+    :param region_ids: The hub region IDs to refresh.
+    :param type_ids: The tracked type IDs.
+    :param budget_per_minute: The ESI requests per minute available.
+    """
+
+    def __init__(self, region_ids, type_ids, budget_per_minute=REQUEST_BUDGET_PER_MINUTE):
+        self.region_ids = [int(region_id) for region_id in region_ids]
+        self.type_ids = [int(type_id) for type_id in type_ids]
+        self.budget_per_minute = budget_per_minute
+        self.scheduler = schedule.Scheduler()
+        self.metrics = {}
+
+    def plan(self):
+        """
+        Compute the refresh plan from current volumes and (re)register every job.
+
+        :return: A list of (job name, interval in seconds, type IDs) tuples.
+        """
+        # pandas is imported on the first plan, not when the scheduler starts
+        from analytics import market_history_stats  # pylint: disable=import-outside-toplevel
+        stats = market_history_stats(self.type_ids, self.region_ids, windows=(30,))
+        volumes = stats["avg_volume_30"].to_dict()
+
+        plan = []
+        for region_id in self.region_ids:
+            buckets = defaultdict(list)
+            for type_id in self.type_ids:
+                buckets[tier_interval(volumes.get((region_id, type_id), 0.0))].append(type_id)
+            # The mode follows all tracked types, each job is run in it whatever its share
+            mode = order_fetch_mode(region_id, len(self.type_ids))
+            if mode == "region":
+                # A region snapshot refreshes every type, at the pace of the busiest one
+                pages = FetchState.query.filter_by(
+                    endpoint="orders", region_id=region_id, type_id=REGION_SNAPSHOT_TYPE_ID,
+                ).count() or 1
+                plan.append((f"orders {region_id}", "orders", region_id, min(buckets),
+                             self.type_ids, pages, mode))
+            else:
+                for interval, type_ids in sorted(buckets.items()):
+                    plan.append((f"orders {region_id} every {interval}s", "orders", region_id,
+                                 interval, type_ids, len(type_ids), mode))
+            plan.append((f"history {region_id}", "history", region_id, HISTORY_INTERVAL,
+                         self.type_ids, len(self.type_ids), None))
+
+        factor = fit_to_budget([(job[3], job[5]) for job in plan], self.budget_per_minute)
+        if factor > 1:
+            logging.warning("Refresh plan exceeds the ESI budget of %s requests/minute,"
+                            " stretching all intervals by %.2fx.", self.budget_per_minute, factor)
+
+        self.scheduler.clear()
+        registered = []
+        for name, endpoint, region_id, interval, type_ids, _, mode in plan:
+            interval = int(interval * factor)
+            job = self.scheduler.every(interval).seconds
+            job.do(self._run, job, name, endpoint, region_id, type_ids, mode)
+            self.metrics.setdefault(name, JobMetrics(name))
+            registered.append((name, interval, type_ids))
+            logging.info("Scheduled %s for %s types every %s seconds.",
+                         name, len(type_ids), interval)
+        return registered
+
+    def _run(self, job, name, endpoint, region_id, type_ids, mode=None):
+        """Run one job, recording its lag behind schedule and its throughput."""
+        metrics = self.metrics[name]
+        lag = max(0.0, time.time() - job.next_run.timestamp())
+        start = time.perf_counter()
+        try:
+            if endpoint == "orders":
+                stats = fetch_market_orders(region_id, type_ids, mode=mode)
+            else:
+                stats = fetch_market_history(region_id, type_ids)
+        except Exception:  # pylint: disable=broad-except
+            metrics.failures += 1
+            logging.exception("Scheduled job %s failed.", name)
+            return
+        finally:
+            db.session.remove()
+        metrics.record(lag, time.perf_counter() - start, len(type_ids), stats.requests)
+        logging.info("Job %s: %s", name, metrics.summary())
+
+    def run_forever(self):
+        """Run every job once, then keep running jobs as they fall due."""
+        self.plan()
+        self.scheduler.run_all()
+        last_plan = time.monotonic()
+        while True:
+            if time.monotonic() - last_plan >= REPLAN_INTERVAL:
+                self.plan()
+                last_plan = time.monotonic()
+            self.scheduler.run_pending()
+            idle = self.scheduler.idle_seconds
+            time.sleep(min(max(idle or 1, 0.5), 30))
+
+
+def main():
+    """Main entry point of the script."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hubs", nargs="+", default=list(TRADE_HUBS), choices=list(TRADE_HUBS))
+    parser.add_argument("--local", type=int, nargs="*", default=[],
+                        help="Region IDs of local markets to refresh as well.")
+    parser.add_argument("--budget", type=int, default=REQUEST_BUDGET_PER_MINUTE,
+                        help="ESI requests per minute the scheduler may use.")
+    args = parser.parse_args()
+
+    region_ids = [TRADE_HUBS[hub] for hub in args.hubs] + args.local
+    with create_app().app_context():
+        MarketScheduler(region_ids, load_tracked_type_ids(), args.budget).run_forever()
+
+
+if __name__ == "__main__":
+    main()
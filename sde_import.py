@@ -0,0 +1,210 @@
+"""
+Module Docstring: This module imports the SDE tables we use into a slim local database.
+
+Only the tables and columns read by the SDE index are copied out of the Fuzzwork
+export, with a primary key on each, into a database of a few megabytes. Each import
+applies a row-level diff against the previous one: rows that changed are replaced,
+rows that disappeared are deleted, and the type IDs they touch are returned so that
+downstream caches can drop just those types. They are also recorded in the slim
+database with the MD5 they were diffed against, so other processes can do the same
+(see last_import).
+
+    python sde_import.py  # download the latest SDE if it changed, then import it
+"""
+import logging
+import os
+import sqlite3
+
+from logging_config import configure_logging
+from sde_updater import EXTRACTED_FILE, download_sde, get_local_md5
+
+SLIM_DB_FILE = "sde-slim.sqlite"
+
+# table -> (key columns, value columns), the key columns form the primary key
+SDE_TABLES = {
+    "invTypes": (("typeID",), ("groupID", "typeName", "published")),
+    "invGroups": (("groupID",), ("categoryID", "groupName")),
+    "invMetaTypes": (("typeID",), ("parentTypeID", "metaGroupID")),
+    "industryActivity": (("typeID", "activityID"), ("time",)),
+    "industryActivityMaterials": (("typeID", "activityID", "materialTypeID"), ("quantity",)),
+    "industryActivityProducts": (("typeID", "activityID", "productTypeID"), ("quantity",)),
+    "industryActivityProbabilities": (("typeID", "activityID", "productTypeID"),
+                                      ("probability",)),
+}
+# Columns of each table that hold a type ID whose index entries change with the row
+TYPE_COLUMNS = {
+    "invTypes": ("typeID",),
+    "invMetaTypes": ("typeID",),
+    "industryActivity": ("typeID",),
+    "industryActivityMaterials": ("typeID",),
+    "industryActivityProducts": ("typeID", "productTypeID"),
+    "industryActivityProbabilities": ("typeID", "productTypeID"),
+}
+# Indexes for the lookups the SDE index and ad-hoc queries make besides the primary keys
+SDE_INDEXES = {
+    "ix_invTypes_groupID": ("invTypes", ("groupID",)),
+    "ix_industryActivityProducts_productTypeID": ("industryActivityProducts",
+                                                  ("productTypeID", "activityID")),
+    "ix_industryActivityMaterials_materialTypeID": ("industryActivityMaterials",
+                                                    ("materialTypeID",)),
+}
+
+
+def import_sde(sde_path=EXTRACTED_FILE, slim_path=SLIM_DB_FILE, md5=None):
+    """
+    Bring the slim database up to date with an extracted SDE.
+
+    :param sde_path: Path of the full SDE database.
+    :param slim_path: Path of the slim database, created if missing.
+    :param md5: MD5 of the SDE, defaults to the one saved by sde_updater.
+    :return: The set of type IDs whose data changed, empty if the SDE was already imported.
+    """
+    md5 = md5 or get_local_md5()
+    if not os.path.exists(sde_path):
+        # ATTACH would silently create an empty database and the diff would delete everything
+        raise FileNotFoundError(f"SDE database {sde_path} not found")
+    conn = sqlite3.connect(f"file:{slim_path}", uri=True)
+    try:
+        _create_schema(conn)
+        previous_md5 = _meta(conn, "md5")
+        if md5 and md5 == previous_md5:
+            logging.info("Slim SDE already imported from %s.", md5)
+            return set()
+        conn.execute("ATTACH DATABASE ? AS src", (f"file:{sde_path}?mode=ro",))
+        changed = set()
+        with conn:
+            for table in SDE_TABLES:
+                changed |= _apply_diff(conn, table)
+            conn.executemany("INSERT OR REPLACE INTO sdeMeta (key, value) VALUES (?, ?)", [
+                ("md5", md5),
+                ("previous_md5", previous_md5),
+                ("changed_type_ids", ",".join(map(str, sorted(changed)))),
+            ])
+        conn.execute("DETACH DATABASE src")
+    finally:
+        conn.close()
+    logging.info("Imported SDE %s into %s, %s types changed.", md5, slim_path, len(changed))
+    return changed
+
+
+def imported_md5(slim_path=SLIM_DB_FILE):
+    """Return the MD5 of the SDE the slim database was last imported from, or None."""
+    if not os.path.exists(slim_path):
+        return None
+    conn = sqlite3.connect(f"file:{slim_path}?mode=ro", uri=True)
+    try:
+        return _meta(conn, "md5")
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def last_import(slim_path=SLIM_DB_FILE):
+    """
+    Return what the last import of the slim database changed.
+
+    :return: (MD5 imported, MD5 it was diffed against, set of changed type IDs), with
+             None for the MD5s the slim database does not record.
+    """
+    if not os.path.exists(slim_path):
+        return None, None, set()
+    conn = sqlite3.connect(f"file:{slim_path}?mode=ro", uri=True)
+    try:
+        changed = _meta(conn, "changed_type_ids")
+        return (_meta(conn, "md5"), _meta(conn, "previous_md5"),
+                {int(type_id) for type_id in changed.split(",") if type_id} if changed else set())
+    except sqlite3.OperationalError:
+        return None, None, set()
+    finally:
+        conn.close()
+
+
+def ensure_slim_sde(sde_path=EXTRACTED_FILE, slim_path=SLIM_DB_FILE):
+    """Import the SDE if the slim database does not exist yet but an extracted SDE does."""
+    if not os.path.exists(slim_path) and os.path.exists(sde_path):
+        import_sde(sde_path, slim_path)
+
+
+def update_sde(slim_path=SLIM_DB_FILE):
+    """
+    Download the latest SDE if it changed and apply it to the slim database.
+
+    :return: The set of type IDs whose data changed.
+    """
+    download_sde()
+    if not os.path.exists(EXTRACTED_FILE):
+        return set()
+    return import_sde(EXTRACTED_FILE, slim_path)
+
+
+def _create_schema(conn):
+    """Create the slim tables and indexes that do not exist yet."""
+    for table, (keys, values) in SDE_TABLES.items():
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(keys + values)},"
+            f" PRIMARY KEY ({', '.join(keys)})) WITHOUT ROWID"
+        )
+    for name, (table, columns) in SDE_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+    conn.execute("CREATE TABLE IF NOT EXISTS sdeMeta (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def _meta(conn, key):
+    """Return a value from the sdeMeta table, or None."""
+    row = conn.execute("SELECT value FROM sdeMeta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _apply_diff(conn, table):
+    """
+    Make one slim table match the attached SDE, touching only the rows that differ.
+
+    :return: The set of type IDs affected by the changed rows.
+    """
+    keys, values = SDE_TABLES[table]
+    columns = ", ".join(keys + values)
+    key_columns = ", ".join(keys)
+    upserts = conn.execute(
+        f"SELECT {columns} FROM src.{table} EXCEPT SELECT {columns} FROM main.{table}"
+    ).fetchall()
+    deletes = conn.execute(
+        f"SELECT {key_columns} FROM main.{table} EXCEPT SELECT {key_columns} FROM src.{table}"
+    ).fetchall()
+
+    changed = set()
+    if table == "invGroups":
+        # A group change, e.g., its category, affects every type in the group
+        group_ids = [(row[0],) for row in upserts + deletes]
+        for group_id in group_ids:
+            changed.update(type_id for (type_id,) in conn.execute(
+                "SELECT typeID FROM main.invTypes WHERE groupID = ?"
+                " UNION SELECT typeID FROM src.invTypes WHERE groupID = ?",
+                group_id * 2,
+            ))
+    else:
+        positions = [(keys + values).index(column) for column in TYPE_COLUMNS[table]]
+        for row in upserts + deletes:
+            changed.update(row[position] for position in positions if position < len(row))
+
+    placeholders = ", ".join("?" for _ in keys + values)
+    conn.executemany(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})",
+                     upserts)
+    conn.executemany(
+        f"DELETE FROM {table} WHERE {' AND '.join(f'{key} = ?' for key in keys)}", deletes
+    )
+    if upserts or deletes:
+        logging.info("SDE table %s: %s rows added or changed, %s removed.",
+                     table, len(upserts), len(deletes))
+    return changed
+
+
+def main():
+    """Main entry point of the script."""
+    configure_logging()
+    changed = update_sde()
+    print(f"SDE import complete, {len(changed)} types changed.")
+
+
+if __name__ == "__main__":
+    main()
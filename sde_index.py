@@ -0,0 +1,183 @@
+"""
+Module Docstring: This module indexes the SDE tables used for industry calculations.
+
+The blueprint products, materials and activity times of every activity are read
+with a handful of bulk queries into dictionaries, then pickled next to the SDE
+under a name keyed by the SDE MD5. Later runs load the pickle instead of opening
+the SDE, and every lookup is a single dictionary access. By default the index is
+built from the slim database kept by sde_import rather than the full export.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+
+from sde_import import SLIM_DB_FILE, ensure_slim_sde, imported_md5
+from sde_updater import get_local_md5
+
+# Industry activity IDs
+MANUFACTURING = 1
+RESEARCH_TIME = 3
+RESEARCH_MATERIAL = 4
+COPYING = 5
+INVENTION = 8
+REACTION = 11
+
+SHIP_CATEGORY_ID = 6
+TECH_II_META_GROUP_ID = 2
+
+# Bump when the cached structure changes so stale cache files are ignored
+CACHE_VERSION = 2
+CACHE_FILE_TEMPLATE = "sde_index_v{version}_{md5}.pickle"
+
+
+class SDEIndex:
+    """
+    In-memory lookup tables built from the SDE.
+
+    :param products: (blueprint_id, activity_id) -> tuple of (product_type_id, quantity).
+    :param materials: (blueprint_id, activity_id) -> tuple of (material_type_id, quantity).
+    :param times: (blueprint_id, activity_id) -> activity time in seconds.
+    :param types: type_id -> (type_name, group_id, category_id, meta_group_id).
+    :param probabilities: (blueprint_id, activity_id) -> success chance, for invention.
+    """
+
+    def __init__(self, products, materials, times, types, probabilities):
+        self.products = products
+        self.materials = materials
+        self.times = times
+        self.types = types
+        self.probabilities = probabilities
+        # product_type_id -> {activity_id: blueprint_id}
+        self.blueprints = {}
+        for (blueprint_id, activity_id), outputs in products.items():
+            for product_type_id, _ in outputs:
+                self.blueprints.setdefault(product_type_id, {})[activity_id] = blueprint_id
+
+    @classmethod
+    def from_sde(cls, sde_path=SLIM_DB_FILE):
+        """Build the index by reading the SDE database, slim or full."""
+        conn = sqlite3.connect(f"file:{sde_path}?mode=ro", uri=True)
+        try:
+            cursor = conn.cursor()
+            products = _group_pairs(cursor.execute("""
+                SELECT typeID, activityID, productTypeID, quantity
+                FROM industryActivityProducts
+            """))
+            materials = _group_pairs(cursor.execute("""
+                SELECT typeID, activityID, materialTypeID, quantity
+                FROM industryActivityMaterials
+            """))
+            times = {
+                (blueprint_id, activity_id): time
+                for blueprint_id, activity_id, time in cursor.execute(
+                    "SELECT typeID, activityID, time FROM industryActivity"
+                )
+            }
+            probabilities = {
+                (blueprint_id, activity_id): probability
+                for blueprint_id, activity_id, probability in cursor.execute(
+                    "SELECT typeID, activityID, probability FROM industryActivityProbabilities"
+                )
+            }
+            types = {
+                type_id: (name, group_id, category_id, meta_group_id)
+                for type_id, name, group_id, category_id, meta_group_id in cursor.execute("""
+                    SELECT t.typeID, t.typeName, t.groupID, g.categoryID, m.metaGroupID
+                    FROM invTypes t
+                    LEFT JOIN invGroups g ON g.groupID = t.groupID
+                    LEFT JOIN invMetaTypes m ON m.typeID = t.typeID
+                """)
+            }
+        finally:
+            conn.close()
+        return cls(products, materials, times, types, probabilities)
+
+    @classmethod
+    def load(cls, sde_path=SLIM_DB_FILE, md5=None, cache_dir="."):
+        """
+        Load the index from its cache, building and caching it from the SDE if needed.
+
+        :param sde_path: Path of the SDE database, the slim one is imported first if missing.
+        :param md5: MD5 of the SDE, defaults to the one the slim database was imported
+                    from, or else the one saved by sde_updater.
+        :param cache_dir: Directory holding the cache files.
+        :return: An SDEIndex.
+        """
+        if sde_path == SLIM_DB_FILE:
+            ensure_slim_sde(slim_path=sde_path)
+        md5 = md5 or imported_md5(sde_path) or get_local_md5()
+        if not md5:
+            return cls.from_sde(sde_path)
+        cache_path = os.path.join(cache_dir, CACHE_FILE_TEMPLATE.format(version=CACHE_VERSION, md5=md5))
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                return cls(*pickle.load(f))
+        index = cls.from_sde(sde_path)
+        index.save(cache_path)
+        return index
+
+    def save(self, cache_path):
+        """Write the index to a cache file, replacing any previous one atomically."""
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self.products, self.materials, self.times, self.types,
+                         self.probabilities), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        logging.info("Saved SDE index to %s.", cache_path)
+
+    def blueprint_for(self, product_type_id, activity_id=MANUFACTURING):
+        """Return the blueprint producing a type through an activity, or None."""
+        return self.blueprints.get(int(product_type_id), {}).get(activity_id)
+
+    def activity_materials(self, blueprint_id, activity_id=MANUFACTURING):
+        """Return the (material_type_id, quantity) pairs an activity consumes per run."""
+        return self.materials.get((blueprint_id, activity_id), ())
+
+    def activity_products(self, blueprint_id, activity_id=MANUFACTURING):
+        """Return the (product_type_id, quantity) pairs an activity produces per run."""
+        return self.products.get((blueprint_id, activity_id), ())
+
+    def activity_time(self, blueprint_id, activity_id=MANUFACTURING):
+        """Return the base time of an activity in seconds, or None."""
+        return self.times.get((blueprint_id, activity_id))
+
+    def probability(self, blueprint_id, activity_id=INVENTION):
+        """Return the base success chance of an activity, 1.0 if it always succeeds."""
+        return self.probabilities.get((blueprint_id, activity_id), 1.0)
+
+    def type_name(self, type_id):
+        """Return the name of a type, or None."""
+        info = self.types.get(int(type_id))
+        return info[0] if info else None
+
+    def t2_ships(self):
+        """Return (type_id, type_name) for every Tech II ship."""
+        return sorted(
+            (type_id, name) for type_id, (name, _, category_id, meta_group_id) in self.types.items()
+            if category_id == SHIP_CATEGORY_ID and meta_group_id == TECH_II_META_GROUP_ID
+        )
+
+    def blueprint_details(self, type_id):
+        """
+        Return blueprint details for manufacturing a type.
+
+        :param type_id: The type ID of the product.
+        :return: A dictionary containing the blueprint ID and materials, or None.
+        """
+        blueprint_id = self.blueprint_for(type_id)
+        if blueprint_id is None:
+            return None
+        return {
+            "blueprint_id": blueprint_id,
+            "materials": list(self.activity_materials(blueprint_id)),
+        }
+
+
+def _group_pairs(rows):
+    """Group (blueprint_id, activity_id, type_id, quantity) rows into tuples per blueprint and activity."""
+    grouped = {}
+    for blueprint_id, activity_id, type_id, quantity in rows:
+        grouped.setdefault((blueprint_id, activity_id), []).append((type_id, quantity))
+    return {key: tuple(pairs) for key, pairs in grouped.items()}
@@ -1,20 +1,39 @@
 """
 Module to download and extract the latest EVE Online Static Data Export (SDE) from Fuzzwork.
+
+The SDE is decompressed while it downloads, so memory use stays at a few buffers
+whatever the size of the export. Both the compressed and the extracted file are
+written under a ".part" name and only renamed into place once the MD5 of the download
+matches the published one. An interrupted download is resumed with an HTTP Range
+request, both on retry and on the next run.
 """
 import os
 import bz2
+import glob
+import hashlib
+import time
 import requests
 
+from custom_exceptions import SDEDownloadException
+
 # URL and filenames
 SDE_URL = "https://www.fuzzwork.co.uk/dump/sqlite-latest.sqlite.bz2"
 MD5_URL = "https://www.fuzzwork.co.uk/dump/sqlite-latest.sqlite.bz2.md5"
 LOCAL_FILE = "sqlite-latest.sqlite.bz2"
 EXTRACTED_FILE = "sqlite-latest.sqlite"
 MD5_FILE = "sqlite-latest.md5"
+PART_SUFFIX = ".part"
+
+# Size of the download, hashing and decompression buffers
+CHUNK_SIZE = 1024 * 1024
+# Number of times an interrupted download is resumed before giving up
+DOWNLOAD_RETRIES = 5
+# (connect, read) timeouts in seconds
+DOWNLOAD_TIMEOUT = (10, 60)
 
-def get_remote_md5():
+def get_remote_md5(md5_url=MD5_URL):
     """Gets the MD5 checksum of the remote SDE file."""
-    response = requests.get(MD5_URL, timeout=10)
+    response = requests.get(md5_url, timeout=10)
     if response.status_code == 200:
         return response.text.strip()
     return None
@@ -31,32 +50,155 @@ def save_local_md5(md5_hash):
     with open(MD5_FILE, "w", encoding="utf-8") as f:
         f.write(md5_hash)
 
-def download_sde():
-    """Downloads the SDE file if the remote MD5 has changed."""
-    remote_md5 = get_remote_md5()
+def md5_digest(md5_text):
+    """Returns the hex digest of an MD5 checksum file, which may also name the file."""
+    return md5_text.split()[0].lower()
+
+class StreamingExtractor:
+    """
+    Hashes bz2 data as it arrives and writes the decompressed content to a file.
+
+    :param dest: The binary file object the decompressed data is written to.
+    """
+
+    def __init__(self, dest):
+        self.dest = dest
+        self.md5 = hashlib.md5()
+        self.decompressor = bz2.BZ2Decompressor()
+
+    def feed(self, data):
+        """
+        Hashes and decompresses the next chunk of compressed data.
+
+        :raises ValueError: If the data is not valid bz2.
+        """
+        self.md5.update(data)
+        while True:
+            if self.decompressor.eof:
+                # A file may hold several concatenated bz2 streams
+                data = self.decompressor.unused_data + data
+                if not data:
+                    return
+                self.decompressor = bz2.BZ2Decompressor()
+            try:
+                # Bounding the output keeps memory flat even for highly compressible data
+                self.dest.write(self.decompressor.decompress(data, CHUNK_SIZE))
+            except OSError as e:
+                raise ValueError(f"Invalid bz2 data: {e}") from e
+            data = b""
+            if self.decompressor.needs_input and not self.decompressor.eof:
+                return
+
+    def feed_file(self, path):
+        """Feeds the content of a compressed file already on disk."""
+        with open(path, "rb") as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                self.feed(chunk)
+
+    def finish(self):
+        """
+        Checks that the compressed data ended cleanly.
+
+        :return: The hex MD5 digest of all the compressed data fed.
+        :raises EOFError: If the data ends in the middle of a bz2 stream.
+        """
+        if not self.decompressor.eof:
+            raise EOFError("Compressed data ended before the end-of-stream marker was reached")
+        return self.md5.hexdigest()
+
+def download_sde(sde_url=SDE_URL, md5_url=MD5_URL, local_file=LOCAL_FILE,
+                 extracted_file=EXTRACTED_FILE):
+    """
+    Downloads and extracts the SDE file if the remote MD5 has changed.
+
+    :return: True if a new SDE was put in place, False otherwise.
+    :raises SDEDownloadException: If the download fails or does not match the remote MD5.
+    """
+    remote_md5 = get_remote_md5(md5_url)
     local_md5 = get_local_md5()
 
-    if os.path.exists(EXTRACTED_FILE) and remote_md5 and local_md5 == remote_md5:
+    if os.path.exists(extracted_file) and remote_md5 and local_md5 == remote_md5:
         print("SDE is up to date. No need to download.")
-        return
+        return False
+    if not remote_md5:
+        print("Failed to get the remote SDE MD5, not downloading an SDE that cannot be verified.")
+        return False
 
-    print("Downloading SDE...")
-    response = requests.get(SDE_URL, stream=True, timeout=10)
-    if response.status_code == 200:
-        with open(LOCAL_FILE, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        print("Download complete.")
-        extract_sde()
-        save_local_md5(remote_md5)
-    else:
-        print("Failed to download SDE. HTTP Status Code:", response.status_code)
-
-def extract_sde():
+    digest = md5_digest(remote_md5)
+    partial = f"{local_file}.{digest}{PART_SUFFIX}"
+    extracting = extracted_file + PART_SUFFIX
+    for stale in glob.glob(f"{glob.escape(local_file)}.*{PART_SUFFIX}"):
+        if stale != partial:
+            os.remove(stale)
+
+    print("Downloading and extracting SDE...")
+    downloaded_md5 = _download_and_extract(sde_url, partial, extracting)
+    if downloaded_md5 != digest:
+        os.remove(partial)
+        os.remove(extracting)
+        raise SDEDownloadException(
+            f"MD5 mismatch for {sde_url}: expected {digest}, got {downloaded_md5}")
+
+    os.replace(extracting, extracted_file)
+    os.replace(partial, local_file)
+    save_local_md5(remote_md5)
+    print("Download and extraction complete.")
+    return True
+
+def _download_and_extract(sde_url, partial, extracting):
+    """
+    Streams the SDE into `partial` while extracting it into `extracting`.
+
+    Bytes already in `partial` are kept and only the rest is requested, the
+    decompressor and hash are rebuilt from the bytes on disk first.
+
+    :return: The hex MD5 digest of the complete compressed file.
+    """
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        try:
+            with requests.get(sde_url, headers=headers, stream=True,
+                              timeout=DOWNLOAD_TIMEOUT) as response, \
+                    open(extracting, "wb") as extracted:
+                extractor = StreamingExtractor(extracted)
+                if response.status_code == 416 and offset:
+                    # The previous attempt already had every byte
+                    extractor.feed_file(partial)
+                    return extractor.finish()
+                if response.status_code == 200:
+                    offset = 0  # The server ignored the Range header
+                elif response.status_code != 206:
+                    raise SDEDownloadException(
+                        f"Failed to download SDE. HTTP Status Code: {response.status_code}")
+                if offset:
+                    print(f"Resuming SDE download at byte {offset}.")
+                    extractor.feed_file(partial)
+                with open(partial, "ab" if offset else "wb") as compressed:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        compressed.write(chunk)
+                        extractor.feed(chunk)
+                return extractor.finish()
+        except (requests.RequestException, EOFError) as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise SDEDownloadException(f"SDE download interrupted: {e}") from e
+            print(f"SDE download interrupted ({e}), resuming...")
+            time.sleep(2 ** attempt)
+        except ValueError as e:
+            # Corrupt bz2 data, resuming would only build on it
+            os.remove(partial)
+            raise SDEDownloadException(f"Invalid SDE data from {sde_url}: {e}") from e
+    return None
+
+def extract_sde(local_file=LOCAL_FILE, extracted_file=EXTRACTED_FILE):
     """Extracts the downloaded SDE file."""
     print("Extracting SDE...")
-    with bz2.BZ2File(LOCAL_FILE, "rb") as source, open(EXTRACTED_FILE, "wb") as dest:
-        dest.write(source.read())
+    extracting = extracted_file + PART_SUFFIX
+    with open(extracting, "wb") as dest:
+        extractor = StreamingExtractor(dest)
+        extractor.feed_file(local_file)
+        extractor.finish()
+    os.replace(extracting, extracted_file)
     print("Extraction complete.")
 
 def main():
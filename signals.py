@@ -0,0 +1,18 @@
+"""
+Module Docstring: This module defines the signals sent once ingested market data is committed.
+
+The sender is the Flask app the ingest ran in. Receivers get the region ID and the
+type IDs whose stored data changed, e.g., to invalidate cached API responses:
+
+    @orders_committed.connect
+    def on_orders_committed(app, region_id, type_ids):
+        ...
+"""
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Orders, and with them order book summaries and build costs, changed
+orders_committed = _signals.signal("orders-committed")
+# Market history, and with it volumes and price statistics, changed
+history_committed = _signals.signal("history-committed")